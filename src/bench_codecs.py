@@ -0,0 +1,103 @@
+"""Benchmark de los codecs de starting_pack para cada mensaje de messages.py.
+
+Uso: `python bench_codecs.py [--repeat N]`
+
+Para cada tipo de mensaje y codec mide el tiempo de codificación (con
+`encode_into` sobre un buffer reutilizado, como hace `publish`), el de
+decodificación y el tamaño del payload. Cubre todos los Struct de
+messages.py y los de starting_pack que viajan por NATS (Clock, NodeReady).
+"""
+
+import argparse
+import math
+import time
+import msgspec
+import numpy as np
+import messages
+import starting_pack
+from messages import Controls, VehicleState, Cone, Cones, Perception, TimeScale, TrackEvent, \
+    TrackEvents, LidarScan, SolveStats
+from cone_index import pack_cones
+from starting_pack import Clock, NodeReady
+
+
+def make_cones(n: int) -> Cones:
+    return Cones(cones=[Cone(x=20.0 * math.cos(a), y=15.0 * math.sin(a))
+                        for a in [(i / n) * 2 * math.pi for i in range(n)]])
+
+
+def make_cone_map(n: int, dtype: str = "<f8"):
+    a = np.arange(n) / n * 2 * math.pi
+    return pack_cones(20.0 * np.cos(a), 15.0 * np.sin(a), np.arange(n) % 4, dtype)
+
+
+def make_scan(rays: int) -> LidarScan:
+    ranges = (np.abs(np.sin(np.arange(rays) * 0.05)) * 3000).astype("<u2")
+    return LidarScan(timestamp=1760000000.123456, angle_min=-math.pi, angle_step=2 * math.pi / rays,
+                     resolution=0.01, ranges=ranges.tobytes())
+
+
+EVENT = TrackEvent(kind="hit", vehicle=3, cone=412, timestamp=1760000000.123456, x=17.3251, y=-2.6123)
+
+MESSAGES = [
+    ("Controls", Controls(throttle=0.4213, steer=-0.1378)),
+    ("VehicleState", VehicleState(x=17.3251, y=-2.6123, yaw=3.0271, speed=5.9812,
+                                  timestamp=1760000000.123456)),
+    ("Cone", Cone(x=12.5, y=-7.25)),
+    ("Cones (10)", make_cones(10)),
+    ("Cones (1000)", make_cones(1000)),
+    ("Cones (50000)", make_cones(50000)),
+    ("ConeMap (1000)", make_cone_map(1000)),
+    ("ConeMap (50000)", make_cone_map(50000)),
+    ("ConeMap f4 (50000)", make_cone_map(50000, "<f4")),
+    ("Perception (20)", Perception(timestamp=1760000000.123456, cones=make_cones(20).cones)),
+    ("TimeScale", TimeScale(scale=5.0)),
+    ("TrackEvent", EVENT),
+    ("TrackEvents (3)", TrackEvents(timestamp=1760000000.123456, events=[EVENT] * 3)),
+    ("LidarScan (360)", make_scan(360)),
+    ("SolveStats", SolveStats(timestamp=1760000000.123456, solve_time=0.0151, samples=1000,
+                              best_cost=123.456, effective_samples=87.3)),
+    ("Clock", Clock(time=1760000000.123456, scale=1.0)),
+    ("NodeReady", NodeReady(node="controller", pid=12345, timestamp=1760000000.123456)),
+]
+
+# Que no se quede fuera ningún mensaje nuevo de messages.py
+MISSING = {name for name, cls in vars(messages).items()
+           if isinstance(cls, type) and issubclass(cls, msgspec.Struct) and cls.__module__ == "messages"} \
+    - {type(msg).__name__ for _, msg in MESSAGES}
+assert not MISSING, f"faltan mensajes en MESSAGES: {', '.join(sorted(MISSING))}"
+
+
+def per_call_us(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20000,
+                        help="repeticiones para mensajes pequeños (se reduce con el tamaño)")
+    args = parser.parse_args()
+
+    print(f"{'mensaje':<19} {'codec':<14} {'bytes':>9} {'encode µs':>10} {'decode µs':>10} "
+          f"{'enc MB/s':>9} {'dec MB/s':>9}")
+    for name, msg in MESSAGES:
+        size_hint = len(starting_pack.encode(msg))
+        repeat = max(5, min(args.repeat, args.repeat * 200 // size_hint))
+        for codec in starting_pack.CODECS:
+            buffer = bytearray()
+            starting_pack.encode_into(msg, buffer, codec)
+            # Comparar vía json: con msgpack-array se recibe una subclase del tipo
+            decoded = starting_pack.decode(buffer, type(msg), codec)
+            assert starting_pack.encode(decoded) == starting_pack.encode(msg)
+
+            enc = per_call_us(lambda: starting_pack.encode_into(msg, buffer, codec), repeat)
+            dec = per_call_us(lambda: starting_pack.decode(buffer, type(msg), codec), repeat)
+            print(f"{name:<19} {codec:<14} {len(buffer):>9} {enc:>10.2f} {dec:>10.2f} "
+                  f"{len(buffer) / enc:>9.1f} {len(buffer) / dec:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark del coste por paso de la detección de contactos y salidas (collisions.py).
+
+Uso: `python bench_collisions.py [--steps N]`
+
+Circuitos en anillo de 100 a 100.000 conos (separados ~3 m, el anillo crece con
+el número de conos) y flotas de 1 a 10.000 coches repartidos sobre el anillo,
+cerca de los conos y moviéndose un poco en cada paso. Mide µs por paso de
+`TrackMonitor.update` para toda la flota y por coche, frente a probar cada coche
+contra todos los conos (solo donde cabe en memoria). También cuenta los pares
+(coche, cono) que llegan a la prueba exacta del triángulo: no crecen con el
+tamaño del circuito.
+"""
+
+import argparse
+import math
+import time
+import numpy as np
+from cone_index import ConeIndex
+from collisions import TrackMonitor, triangle_distance, CONE_RADIUS, CAR_RADIUS
+
+CONES = [100, 1_000, 10_000, 100_000]
+FLEETS = [1, 100, 10_000]
+CONE_GAP = 3.0  # m entre conos del anillo
+BRUTE_FORCE_MAX = 10_000_000  # pares coche x cono como máximo para la referencia
+
+
+def make_ring(n: int):
+    radius = n * CONE_GAP / (2 * math.pi)
+    a = np.linspace(0.0, 2 * math.pi, n, endpoint=False)
+    return radius * np.cos(a), radius * np.sin(a), radius
+
+
+def brute_force(index: ConeIndex, x, y, yaw) -> int:
+    """Contactos probando cada coche contra todos los conos."""
+    dx = index.xs[None, :] - x[:, None]
+    dy = index.ys[None, :] - y[:, None]
+    cos_yaw, sin_yaw = np.cos(yaw)[:, None], np.sin(yaw)[:, None]
+    d = triangle_distance((cos_yaw * dx + sin_yaw * dy).ravel(), (-sin_yaw * dx + cos_yaw * dy).ravel())
+    return int((d <= CONE_RADIUS).sum())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=50)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'conos':>7} {'coches':>7} {'µs/paso':>10} {'µs/coche':>9} {'pares/coche':>12} "
+          f"{'fuerza bruta µs/paso':>21}")
+    for n in CONES:
+        xs, ys, radius = make_ring(n)
+        index = ConeIndex(xs, ys)
+        for cars in FLEETS:
+            monitor = TrackMonitor(index, cars)
+            a = rng.uniform(0.0, 2 * math.pi, cars)
+            r = radius + rng.uniform(-2.0, 2.0, cars)
+            x, y = r * np.cos(a), r * np.sin(a)
+            yaw = a + math.pi / 2 + rng.normal(0.0, 0.3, cars)
+            pairs = len(index.query_radius_many(x, y, CAR_RADIUS + CONE_RADIUS)[0])
+
+            elapsed = 0.0
+            for step in range(args.steps):
+                x += 0.5 * np.cos(yaw)
+                y += 0.5 * np.sin(yaw)
+                t0 = time.perf_counter()
+                monitor.update(x, y, yaw, step * 0.05)
+                elapsed += time.perf_counter() - t0
+            per_step = elapsed / args.steps * 1e6
+
+            brute = "-"
+            if cars * n <= BRUTE_FORCE_MAX:
+                t0 = time.perf_counter()
+                brute_force(index, x, y, yaw)
+                brute = f"{(time.perf_counter() - t0) * 1e6:.0f}"
+            print(f"{n:>7} {cars:>7} {per_step:>10.0f} {per_step / cars:>9.2f} "
+                  f"{pairs / cars:>12.2f} {brute:>21}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark del mapa de conos: `Cones` (un objeto por cono) frente a `ConeMap` empaquetado.
+
+Uso: `python bench_conemap.py [--repeat N]`
+
+Para circuitos de 10 a 100.000 conos y cada codec mide:
+- bytes del mensaje codificado
+- memoria que ocupa el mensaje decodificado (tracemalloc)
+- µs para decodificarlo
+- µs para decodificarlo y tener las coordenadas como arrays de NumPy, que es
+  lo que hacen controladores y visualizador (con ConeMap es una vista del buffer)
+"""
+
+import argparse
+import math
+import time
+import tracemalloc
+import numpy as np
+from starting_pack import encode, decode
+from messages import Cone, Cones, ConeMap
+from cone_index import pack_cones, cone_xy
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+CODECS = ["json", "msgpack", "msgpack-array"]
+
+
+def make_track(n: int):
+    a = np.linspace(0.0, 2 * math.pi, n, endpoint=False)
+    xs, ys = 20.0 * n ** 0.5 * np.cos(a), 15.0 * n ** 0.5 * np.sin(a)
+    return xs, ys
+
+
+def best_us(function, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+
+def retained_bytes(function) -> int:
+    """Bytes que siguen reservados mientras vive lo que devuelve `function`."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'conos':>7} {'mensaje':<11} {'codec':<14} {'bytes':>10} {'memoria':>10} "
+          f"{'decode µs':>11} {'+arrays µs':>11}")
+    for n in SIZES:
+        xs, ys = make_track(n)
+        messages = [
+            ("Cones", Cones(cones=[Cone(x=x, y=y) for x, y in zip(xs.tolist(), ys.tolist())])),
+            ("ConeMap f8", pack_cones(xs, ys)),
+            ("ConeMap f4", pack_cones(xs, ys, dtype="<f4")),
+        ]
+        for name, msg in messages:
+            for codec in CODECS:
+                data = encode(msg, codec)
+                message_type = type(msg)
+                decoded = decode(data, message_type, codec)
+                assert np.allclose(cone_xy(decoded), np.c_[xs, ys], atol=1e-2)
+                memory = retained_bytes(lambda: decode(data, message_type, codec))
+                t_decode = best_us(lambda: decode(data, message_type, codec), args.repeat)
+                t_arrays = best_us(lambda: cone_xy(decode(data, message_type, codec)), args.repeat)
+                print(f"{n:>7} {name:<11} {codec:<14} {len(data):>10} {memory:>10} "
+                      f"{t_decode:>11.1f} {t_arrays:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Benchmark de la selección de conos: bucle escalar original frente a ConeIndex.
+
+Uso: `python bench_cones.py [--ticks N]`
+
+Para cada tamaño de circuito mide el coste por tick de `control_loop` en
+controller.py y controller2.py, y comprueba que los `Controls` generados son
+idénticos a los de la implementación escalar original (copiada aquí como referencia).
+"""
+
+import argparse
+import math
+import random
+import time
+from typing import List, Optional
+from messages import VehicleState, Controls, Cone, Cones
+from cone_index import ConeIndex
+import controller
+import controller2
+
+CONE_COUNTS = [10, 100, 1000, 5000, 20000]
+
+
+# ============================
+#   Referencia escalar
+# ============================
+
+def angle_diff(a: float, b: float) -> float:
+    return (a - b + math.pi) % (2 * math.pi) - math.pi
+
+
+def scalar_controller(s: VehicleState, cones: List[Cone]) -> Controls:
+    best_cone = None
+    best_dist = float("inf")
+    found_right = False
+    for c in cones:
+        dx = c.x - s.x
+        dy = c.y - s.y
+        dist = math.hypot(dx, dy)
+        angle_diff_to = angle_diff(math.atan2(dy, dx), s.yaw)
+        if abs(angle_diff_to) < math.radians(120) and dist > 1.0:
+            y_rel = -(dx * math.sin(s.yaw)) + (dy * math.cos(s.yaw))
+            if y_rel < 0:
+                if (not found_right) or (dist < best_dist):
+                    best_cone, best_dist, found_right = c, dist, True
+            elif (not found_right) and (dist < best_dist):
+                best_cone, best_dist = c, dist
+    if best_cone is None and cones:
+        for c in cones:
+            dist = math.hypot(c.x - s.x, c.y - s.y)
+            if dist < best_dist:
+                best_cone, best_dist = c, dist
+
+    if best_cone:
+        dx = best_cone.x - s.x
+        dy = best_cone.y - s.y
+        dist = max(math.hypot(dx, dy), 1e-6)
+        target_x = best_cone.x - dy / dist * 1.0
+        target_y = best_cone.y + dx / dist * 1.0
+        heading_error = angle_diff(math.atan2(target_y - s.y, target_x - s.x), s.yaw)
+        steer_cmd = max(-1.0, min(1.0, 1.2 * heading_error))
+    else:
+        steer_cmd = 0.0
+    return Controls(throttle=0.6 * (controller.TARGET_SPEED - s.speed), steer=steer_cmd)
+
+
+class ScalarController2:
+
+    def __init__(self):
+        self.side: Optional[str] = None
+        self.proj: Optional[float] = None
+
+    def __call__(self, s: VehicleState, cones: List[Cone]) -> Controls:
+        left, right = [], []
+        for c in cones:
+            dx = c.x - s.x
+            dy = c.y - s.y
+            dist = math.hypot(dx, dy)
+            if abs(angle_diff(math.atan2(dy, dx), s.yaw)) < math.radians(120) and dist > 0.5:
+                x_rel = dx * math.cos(s.yaw) + dy * math.sin(s.yaw)
+                y_rel = -(dx * math.sin(s.yaw)) + (dy * math.cos(s.yaw))
+                (right if y_rel < 0 else left).append((x_rel, dist, c, y_rel))
+        left.sort(key=lambda x: x[0], reverse=True)
+        right.sort(key=lambda x: x[0], reverse=True)
+
+        best_cone, best_dist, selected_proj = None, float("inf"), None
+        preferred = {"left": "right", "right": "left"}.get(self.side)
+        if preferred == "right" and right:
+            for proj, dist, c, y_rel in right:
+                if self.proj is None or proj > self.proj + 1.0:
+                    best_dist, best_cone, selected_proj = dist, c, proj
+                    break
+            else:
+                selected_proj, best_dist, best_cone, _ = right[0]
+            self.side = "right"
+        elif preferred == "left" and left:
+            for proj, dist, c, y_rel in left:
+                if self.proj is None or proj > self.proj + 1.0:
+                    best_dist, best_cone, selected_proj = dist, c, proj
+                    self.side = "left"
+                    break
+            else:
+                selected_proj, best_dist, best_cone, _ = left[0]
+        else:
+            candidates = ([left[0]] if left else []) + ([right[0]] if right else [])
+            if candidates:
+                candidates.sort(key=lambda x: x[0], reverse=True)
+                chosen = next((c for c in candidates
+                               if self.proj is None or c[0] > self.proj + 1.0), candidates[0])
+                selected_proj, best_dist, best_cone, y_rel = chosen
+                self.side = "right" if y_rel < 0 else "left"
+            elif cones:
+                best_cone = min(cones, key=lambda c: math.hypot(c.x - s.x, c.y - s.y))
+                dx = best_cone.x - s.x
+                dy = best_cone.y - s.y
+                best_dist = math.hypot(dx, dy)
+                y_rel = -(dx * math.sin(s.yaw)) + (dy * math.cos(s.yaw))
+                self.side = "right" if y_rel < 0 else "left"
+                selected_proj = dx * math.cos(s.yaw) + dy * math.sin(s.yaw)
+
+        steer_cmd = 0.0
+        throttle_cmd = 0.6 * (controller2.TARGET_SPEED - s.speed)
+        if best_cone:
+            heading_error = angle_diff(math.atan2(best_cone.y - s.y, best_cone.x - s.x), s.yaw)
+            steer_cmd = max(-1.0, min(1.0, 1.2 * heading_error))
+            if best_dist < 2.0:
+                throttle_cmd = min(throttle_cmd, -min(1.0, (2.0 - best_dist) / 2.0 * 1.2))
+            if abs(heading_error) > math.radians(45) and s.speed > 1.5:
+                throttle_cmd = min(throttle_cmd, 0.0)
+            self.proj = float(selected_proj)
+        return Controls(throttle=throttle_cmd, steer=steer_cmd)
+
+
+# ============================
+#   Escenarios
+# ============================
+
+def make_track(n: int, rng: random.Random) -> Cones:
+    """Óvalo con ruido cuyo perímetro crece con el número de conos (~2 m entre conos)."""
+    scale = max(1.0, n * 2.0 / (2 * math.pi * 17.5))
+    return Cones(cones=[
+        Cone(x=20.0 * scale * math.cos(a) + rng.gauss(0, 0.5),
+             y=15.0 * scale * math.sin(a) + rng.gauss(0, 0.5))
+        for a in [(i / n) * 2 * math.pi for i in range(n)]
+    ])
+
+
+def make_states(cones: Cones, ticks: int, rng: random.Random) -> List[VehicleState]:
+    states = []
+    for _ in range(ticks):
+        c = rng.choice(cones.cones)
+        states.append(VehicleState(x=c.x + rng.uniform(-5, 5), y=c.y + rng.uniform(-5, 5),
+                                   yaw=rng.uniform(-math.pi, math.pi),
+                                   speed=rng.uniform(0, 10), timestamp=0.0))
+    return states
+
+
+def per_tick_us(fn, states) -> float:
+    t0 = time.perf_counter()
+    for s in states:
+        fn(s)
+    return (time.perf_counter() - t0) / len(states) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print(f"{'conos':>7} {'índice (ms)':>12} {'ctrl escalar':>13} {'ctrl vector':>12} "
+          f"{'ctrl2 escalar':>14} {'ctrl2 vector':>13}   (µs/tick)")
+    for n in CONE_COUNTS:
+        cones = make_track(n, rng)
+        states = make_states(cones, args.ticks, rng)
+
+        t0 = time.perf_counter()
+        index = ConeIndex.from_cones(cones)
+        build_ms = (time.perf_counter() - t0) * 1e3
+
+        # Comprobar que ambas implementaciones producen exactamente lo mismo
+        ref2 = ScalarController2()
+        controller2.last_target_side = controller2.last_target_proj = None
+        for s in states:
+            assert controller.compute_controls(s, index) == scalar_controller(s, cones.cones)
+            assert controller2.compute_controls(s, index) == ref2(s, cones.cones)
+
+        ref2 = ScalarController2()
+        t_c1s = per_tick_us(lambda s: scalar_controller(s, cones.cones), states)
+        t_c1v = per_tick_us(lambda s: controller.compute_controls(s, index), states)
+        t_c2s = per_tick_us(lambda s: ref2(s, cones.cones), states)
+        t_c2v = per_tick_us(lambda s: controller2.compute_controls(s, index), states)
+        print(f"{n:>7} {build_ms:>12.2f} {t_c1s:>13.1f} {t_c1v:>12.1f} {t_c2s:>14.1f} {t_c2v:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark de la latencia de control: del timestamp del estado a la publicación de Controls.
+
+Uso: `python bench_control_latency.py [--seconds T]` (con un servidor NATS en NATS_URL)
+
+Arranca simulator.py en otro proceso y controller.py en este, primero con el
+control en un `@timer` de 50 ms (CONTROL_PERIOD=0.05, sin sincronizar con el
+simulador) y después disparado por cada estado nuevo (`@on_message`). Para
+cada `Controls` publicado mide cuánto hace que se generó el estado que usa, y
+cuenta los estados usados dos veces y los que no llegó a usar ningún control.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = [("timer 50 ms", "0.05"), ("on_message", "")]
+WARMUP_S = 2.0
+
+
+async def client(seconds: float) -> str:
+    import controller
+    from starting_pack import start, now
+
+    ages, used = [], []
+    publish = controller.publish
+
+    async def measured_publish(topic, msg):
+        if time.monotonic() > measure_from:
+            ages.append(now() - controller.latest_state.timestamp)
+            used.append(controller.latest_state.timestamp)
+        await publish(topic, msg)
+
+    controller.publish = measured_publish
+    simulator = subprocess.Popen([sys.executable, "simulator.py"], env=os.environ,
+                                 stdout=subprocess.DEVNULL)
+    measure_from = time.monotonic() + WARMUP_S
+    node = asyncio.create_task(start())
+    try:
+        await asyncio.sleep(WARMUP_S + seconds)
+    finally:
+        node.cancel()
+        simulator.terminate()
+        simulator.wait()
+
+    ages.sort()
+    repeated = len(used) - len(set(used))
+    # Estados publicados en el intervalo medido, a 20 Hz
+    states = round((used[-1] - used[0]) * 20) + 1 if used else 0
+    return (f"{statistics.median(ages) * 1e3:>10.2f} {ages[int(len(ages) * 0.99)] * 1e3:>10.2f} "
+            f"{ages[-1] * 1e3:>10.2f} {len(ages):>9} {repeated:>9} {max(0, states - len(set(used))):>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--client", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.client:
+        print(asyncio.run(client(args.seconds)))
+        return
+    print(f"{'modo':<14} {'p50 ms':>10} {'p99 ms':>10} {'máx ms':>10} {'controles':>9} "
+          f"{'repetidos':>9} {'saltados':>9}")
+    for name, period in MODES:
+        print(f"{name:<14} ", end="")
+        sys.stdout.flush()
+        # Un proceso por modo: el modo se elige al importar controller.py
+        subprocess.run([sys.executable, __file__, "--client", "--seconds", str(args.seconds)],
+                       env=dict(os.environ, CONTROL_PERIOD=period))
+
+
+if __name__ == "__main__":
+    main()
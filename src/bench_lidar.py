@@ -0,0 +1,105 @@
+"""Benchmark del lidar simulado (lidar.py): coste por barrido frente a conos y rayos.
+
+Uso: `python bench_lidar.py [--scans N]`
+
+Circuitos en anillo de 100 a 100.000 conos (separados ~3 m) con un coche en el
+anillo mirando a lo largo de él. Para cada número de rayos mide µs por barrido:
+- lidar: `Lidar.scan` (prefiltro de la rejilla y solo los rayos del sector de cada cono)
+- denso cercanos: mismo prefiltro, pero la matriz completa rayos x conos cercanos
+- denso todos: matriz rayos x todos los conos, sin prefiltro (solo donde cabe)
+y el porcentaje de un núcleo que supone barrer a 20 Hz. Al final, el coste por
+coche lanzando los rayos de una flota de 100 coches a la vez, y el tamaño del
+LidarScan publicado.
+"""
+
+import argparse
+import math
+import time
+import numpy as np
+from cone_index import ConeIndex
+from collisions import CONE_RADIUS
+from lidar import Lidar
+from starting_pack import encode
+
+CONES = [100, 1_000, 10_000, 100_000]
+RAYS = [100, 1_000, 4_000]
+CONE_GAP = 3.0  # m entre conos del anillo
+DENSE_MAX = 20_000_000  # elementos rayos x conos como máximo para el denso sin prefiltro
+RATE = 20.0  # Hz
+
+
+def make_ring(n: int):
+    radius = n * CONE_GAP / (2 * math.pi)
+    a = np.linspace(0.0, 2 * math.pi, n, endpoint=False)
+    return ConeIndex(radius * np.cos(a), radius * np.sin(a)), radius
+
+
+def dense(lidar: Lidar, xs, ys, x: float, y: float, yaw: float) -> np.ndarray:
+    """Referencia: todos los rayos contra todos los conos dados."""
+    dx, dy = xs - x, ys - y
+    cx = math.cos(yaw) * dx + math.sin(yaw) * dy
+    cy = -math.sin(yaw) * dx + math.cos(yaw) * dy
+    along = lidar.cos[:, None] * cx + lidar.sin[:, None] * cy
+    across2 = cx * cx + cy * cy - along * along
+    hit = (along > 0.0) & (across2 <= CONE_RADIUS ** 2)
+    t = np.where(hit, along - np.sqrt(np.maximum(0.0, CONE_RADIUS ** 2 - across2)), np.inf)
+    ranges = np.maximum(t.min(axis=1), 0.0)
+    ranges[ranges > lidar.max_range] = np.inf
+    return ranges
+
+
+def best_us(function, scans: int) -> float:
+    best = math.inf
+    for _ in range(scans):
+        t0 = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scans", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'conos':>7} {'rayos':>6} {'lidar µs':>9} {'% a 20 Hz':>10} "
+          f"{'denso cercanos µs':>18} {'denso todos µs':>15}")
+    for n in CONES:
+        index, radius = make_ring(n)
+        x, y, yaw = radius - 1.0, 0.0, math.pi / 2
+        for rays in RAYS:
+            lidar = Lidar(rays=rays)
+            ranges = lidar.scan(index, x, y, yaw)[0]
+            near = index.query_radius(x, y, lidar.max_range + CONE_RADIUS)
+            assert np.allclose(ranges, dense(lidar, index.xs[near], index.ys[near], x, y, yaw))
+
+            t_lidar = best_us(lambda: lidar.scan(index, x, y, yaw), args.scans)
+
+            def dense_near():
+                near = index.query_radius(x, y, lidar.max_range + CONE_RADIUS)
+                dense(lidar, index.xs[near], index.ys[near], x, y, yaw)
+            t_near = best_us(dense_near, args.scans)
+
+            t_all = "-"
+            if rays * n <= DENSE_MAX:
+                t_all = f"{best_us(lambda: dense(lidar, index.xs, index.ys, x, y, yaw), 3):.0f}"
+            print(f"{n:>7} {rays:>6} {t_lidar:>9.0f} {t_lidar * RATE / 1e4:>10.2f} "
+                  f"{t_near:>18.0f} {t_all:>15}")
+
+    # Flota: todos los coches en una sola llamada
+    index, radius = make_ring(10_000)
+    rng = np.random.default_rng(0)
+    cars = 100
+    a = rng.uniform(0.0, 2 * math.pi, cars)
+    r = radius + rng.uniform(-2.0, 2.0, cars)
+    lidar = Lidar(rays=1000, noise_std=0.02, dropout=0.05, seed=0)
+    t_fleet = best_us(lambda: lidar.scan(index, r * np.cos(a), r * np.sin(a), a + math.pi / 2), args.scans)
+    msg = lidar.message(lidar.scan(index, radius - 1.0, 0.0, math.pi / 2)[0], 0.0)
+    print(f"[LOG] Flota de {cars} coches, 1000 rayos, 10.000 conos: {t_fleet:.0f} µs por paso, "
+          f"{t_fleet / cars:.0f} µs por coche")
+    print(f"[LOG] LidarScan de 1000 rayos: {len(encode(msg, 'msgpack'))} bytes en msgpack, "
+          f"{len(encode(msg, 'json'))} en json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark de la percepción por alcance frente al mapa completo de conos.
+
+Uso: `python bench_perception.py [--ticks N]`
+
+Para cada tamaño de circuito compara lo que cuesta, por coche y tick:
+- mapa completo: tamaño del mensaje `Cones` y coste de `compute_controls`
+  (controller.py) sobre el ConeIndex de todo el mapa
+- percepción: coste en el simulador de seleccionar los conos visibles
+  (`ConeIndex.visible`), tamaño del mensaje `Perception` y coste en el
+  controlador de decodificarlo y ejecutar `compute_controls_local`
+"""
+
+import argparse
+import random
+import time
+from messages import Cone, Perception
+from cone_index import ConeIndex
+from starting_pack import encode, decode
+from bench_cones import make_track, make_states, per_tick_us
+import controller
+import simulator
+
+CONE_COUNTS = [10, 1000, 20000, 100000]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ticks", type=int, default=500)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print(f"{'conos':>7} {'mapa (B)':>10} {'ctrl mapa µs':>13} {'sim percep µs':>14} "
+          f"{'percep (B)':>11} {'conos vistos':>13} {'ctrl percep µs':>15}")
+    for n in CONE_COUNTS:
+        cones = make_track(n, rng)
+        states = make_states(cones, args.ticks, rng)
+        index = ConeIndex.from_cones(cones)
+        map_bytes = len(encode(cones))
+
+        t_map = per_tick_us(lambda s: controller.compute_controls(s, index), states)
+
+        def perceive(s):
+            f = index.visible(s.x, s.y, s.yaw, simulator.SENSOR_RANGE, simulator.SENSOR_FOV)
+            return Perception(timestamp=s.timestamp,
+                              cones=[Cone(x=x, y=y) for x, y in zip(f.x_rel.tolist(), f.y_rel.tolist())])
+
+        t_sim = per_tick_us(perceive, states)
+        payloads = {id(s): encode(perceive(s)) for s in states}
+        mean_bytes = sum(len(p) for p in payloads.values()) / len(payloads)
+        mean_seen = sum(len(decode(p, Perception).cones) for p in payloads.values()) / len(payloads)
+        t_local = per_tick_us(
+            lambda s: controller.compute_controls_local(s, decode(payloads[id(s)], Perception)), states)
+
+        print(f"{n:>7} {map_bytes:>10} {t_map:>13.1f} {t_sim:>14.1f} "
+              f"{mean_bytes:>11.0f} {mean_seen:>13.1f} {t_local:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark de precisión frente a coste de los integradores de physics.py.
+
+Uso: `python bench_physics.py [--cars N] [--seconds T]`
+
+Una flota de coches con controles aleatorios (dirección a fondo incluida,
+así hay giros con mucha velocidad angular) que cambian a la frecuencia de
+publicación del simulador y se mantienen entre publicaciones, como en
+simulator.py. Para cada integrador y paso de física mide:
+- el error de posición al final frente a una referencia RK4 con paso de 0.1 ms
+- el coste en µs por segundo simulado y coche
+El paso original del simulador es "semi-implicit" con un subpaso por publicación.
+"""
+
+import argparse
+import time
+import numpy as np
+from physics import Fleet, MAX_STEER_ANGLE
+
+PUBLISH_DT = 0.05
+PHYSICS_DTS = [0.05, 0.025, 0.01, 0.005, 0.001]
+REFERENCE_DT = 1e-4
+
+
+def run(cars: int, seconds: float, physics_dt: float, method: str, seed: int = 0):
+    """Posiciones finales y segundos reales que tardó la integración."""
+    rng = np.random.default_rng(seed)
+    fleet = Fleet(cars, x=0.0, y=0.0, yaw=0.0, speed=5.0)
+    substeps = max(1, round(PUBLISH_DT / physics_dt))
+    elapsed = 0.0
+    for _ in range(round(seconds / PUBLISH_DT)):
+        fleet.throttle[:] = rng.uniform(-0.3, 1.0, cars)
+        fleet.steer[:] = np.clip(rng.normal(0.0, 0.8, cars), -1.0, 1.0)
+        fleet.tan_steer[:] = np.tan(fleet.steer * MAX_STEER_ANGLE)
+        t0 = time.perf_counter()
+        fleet.advance(PUBLISH_DT, substeps, method)
+        elapsed += time.perf_counter() - t0
+    return fleet.x.copy(), fleet.y.copy(), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cars", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    ref_x, ref_y, _ = run(args.cars, args.seconds, REFERENCE_DT, "rk4")
+
+    print(f"{'integrador':>14} {'paso (s)':>9} {'subpasos':>9} {'error medio (m)':>16} "
+          f"{'error máx (m)':>14} {'µs/s·coche':>11}")
+    for method in ("semi-implicit", "rk4"):
+        for physics_dt in PHYSICS_DTS:
+            x, y, elapsed = run(args.cars, args.seconds, physics_dt, method)
+            error = np.hypot(x - ref_x, y - ref_y)
+            cost = elapsed / args.seconds / args.cars * 1e6
+            print(f"{method:>14} {physics_dt:>9.3f} {max(1, round(PUBLISH_DT / physics_dt)):>9} "
+                  f"{error.mean():>16.2e} {error.max():>14.2e} {cost:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
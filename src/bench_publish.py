@@ -0,0 +1,97 @@
+"""Benchmark de publicación: un `publish` por mensaje frente a `publish_many` y el batcher.
+
+Uso: `python bench_publish.py [--ticks N] [--fleet N] [url ...]`
+(por defecto `nats://127.0.0.1:4222 shm://bench`)
+
+Simula lo que publica el simulador con una flota: en cada tick un
+`VehicleState` por coche en `simulator.<id>.state`. Para cada forma de
+publicar mide mensajes por segundo real y por segundo de CPU del proceso
+publicador (lo que cuesta en un núcleo), hasta que el transporte los ha
+entregado (`flush`):
+- publish: una llamada por mensaje, como hasta ahora
+- publish_many: una llamada por tick con todos los coches
+- batcher turno: `batch_publishing()`, se envía al final de cada vuelta del event loop
+- batcher 100: `batch_publishing(max_messages=100, max_delay_s=None)`
+- batcher 1 ms: `batch_publishing(max_delay_s=0.001)`
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import starting_pack
+from starting_pack import publish, publish_many, batch_publishing, flush, on_start, start, nats_connection
+from messages import VehicleState
+
+STATE = VehicleState(x=17.3251, y=-2.6123, yaw=3.0271, speed=5.9812, timestamp=1760000000.123456)
+
+
+async def measure(url: str, ticks: int, fleet: int) -> None:
+    topics = [f"simulator.{i}.state" for i in range(fleet)]
+    done = asyncio.get_running_loop().create_future()
+
+    async def tick_publish():
+        for topic in topics:
+            await publish(topic, STATE)
+
+    async def tick_many():
+        await publish_many([(topic, STATE) for topic in topics])
+
+    modes = [
+        ("publish", tick_publish, None),
+        ("publish_many", tick_many, None),
+        ("batcher turno", tick_publish, {}),
+        ("batcher 100", tick_publish, {"max_messages": 100, "max_delay_s": None}),
+        ("batcher 1 ms", tick_publish, {"max_delay_s": 0.001}),
+    ]
+
+    @on_start
+    async def run():
+        lines = []
+        for name, tick, batching in modes:
+            batch_publishing(**batching) if batching is not None else batch_publishing(enabled=False)
+            await tick()  # calentar
+            await flush()
+            await nats_connection().flush()
+            wall0, cpu0 = time.perf_counter(), time.process_time()
+            for _ in range(ticks):
+                await tick()
+                await asyncio.sleep(0)  # una vuelta del event loop por tick
+            await flush()
+            await nats_connection().flush()
+            wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+            count = ticks * fleet
+            lines.append(f"{url:<24} {name:<14} {count / wall:>12.0f} {count / cpu:>12.0f}")
+        batch_publishing(enabled=False)
+        done.set_result("\n".join(lines))
+
+    node = asyncio.create_task(start())
+    try:
+        print(await asyncio.wait_for(done, 600))
+    finally:
+        node.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("urls", nargs="*", default=["nats://127.0.0.1:4222", "shm://bench"])
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--fleet", type=int, default=1000, help="mensajes por tick")
+    parser.add_argument("--client", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.client:
+        asyncio.run(measure(os.environ["NATS_URL"], args.ticks, args.fleet))
+        return
+    print(f"{'url':<24} {'modo':<14} {'msg/s':>12} {'msg/s CPU':>12}")
+    sys.stdout.flush()
+    # Un proceso por url: starting_pack tiene una sola conexión por proceso
+    for url in args.urls:
+        subprocess.run([sys.executable, __file__, "--client", "--ticks", str(args.ticks),
+                        "--fleet", str(args.fleet)], env=dict(os.environ, NATS_URL=url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark del dibujado del visualizador con muchos coches y conos.
+
+Uso: `python bench_render.py [--frames N]`
+
+Compara, por frame, el redibujado completo de la figura (lo que hacía antes
+el visualizador) con el blitting del `Renderer`: restaurar el fondo con los
+conos ya dibujados y pintar solo coches, direcciones y texto; y el blitting
+con la estela llena de cada coche, ya decimada a la escala de la figura como
+la deja `ScreenTrails` al llegar las poses. Usa el backend Agg, así que no
+hace falta pantalla.
+"""
+
+import argparse
+import math
+import time
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import visualizer
+from trajectory import Trajectories, ScreenTrails
+from bench_codecs import make_cones
+
+
+def make_poses(n: int) -> visualizer.Poses:
+    rng = np.random.default_rng(0)
+    p = visualizer.Poses(n)
+    p.x[:] = rng.uniform(-20, 20, n)
+    p.y[:] = rng.uniform(-15, 15, n)
+    p.yaw[:] = rng.uniform(-math.pi, math.pi, n)
+    p.speed[:] = rng.uniform(0, 10, n)
+    return p
+
+
+def make_trails(p: visualizer.Poses) -> Trajectories:
+    # Buffers llenos: cada coche da vueltas a un círculo alrededor de su posición
+    trails = Trajectories(len(p))
+    for k in range(trails.capacity):
+        a = k * trails.sample_dt * 0.5
+        for i in range(len(p)):
+            trails.append(i, p.x[i] + 5 * math.cos(a), p.y[i] + 5 * math.sin(a), k * trails.sample_dt)
+    return trails
+
+
+def make_lines(renderer: visualizer.Renderer, trails: Trajectories):
+    screen = ScreenTrails(len(trails), visualizer.TRAIL_STEP, trails.capacity, trails.seconds)
+    screen.rebuild(trails, renderer.trail_step())
+    return screen.lines
+
+
+def per_frame_ms(renderer: visualizer.Renderer, p: visualizer.Poses, cones, frames: int,
+                 trails=None) -> float:
+    renderer.frame(p, cones, trails)  # primer frame: dibuja los conos y guarda el fondo
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        p.yaw += 0.01
+        renderer.frame(p, cones, trails)
+        if not renderer.blit:
+            renderer.fig.canvas.draw()  # Agg no dibuja en draw_idle
+    return (time.perf_counter() - t0) / frames * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'coches':>7} {'conos':>7} {'completo ms':>12} {'blit ms':>9} {'blit+estela ms':>15}")
+    for n_cars, n_cones in [(1, 10), (10, 1000), (100, 10000), (1000, 50000)]:
+        cones = make_cones(n_cones)
+        p = make_poses(n_cars)
+        trails = make_trails(p)
+        results = []
+        for blit, t in ((False, None), (True, None), (True, trails)):
+            renderer = visualizer.Renderer()
+            renderer.blit = blit
+            renderer.set_cones(cones)  # la escala con la que se decima la estela
+            lines = make_lines(renderer, t) if t is not None else None
+            results.append(per_frame_ms(renderer, p, cones, args.frames, lines))
+            visualizer.plt.close(renderer.fig)
+        print(f"{n_cars:>7} {n_cones:>7} {results[0]:>12.2f} {results[1]:>9.2f} {results[2]:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark de los transportes de starting_pack: NATS, inproc y shm.
+
+Uso: `python bench_transports.py [--count N] [url ...]`
+(por defecto `nats://127.0.0.1:4222 inproc:// shm://bench`)
+
+Para cada url arranca un nodo eco (en otro proceso; con inproc en el mismo)
+que reenvía cada payload de `bench.ping` a `bench.pong`, y mide:
+- la latencia de ida y vuelta de un `VehicleState`, mensaje a mensaje
+- el throughput enviando N pings seguidos y esperando a todos los pongs
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import starting_pack
+from starting_pack import subscribe_raw, on_start, send, start, encode
+from messages import VehicleState
+
+PAYLOAD = encode(VehicleState(x=17.3251, y=-2.6123, yaw=3.0271, speed=5.9812,
+                              timestamp=1760000000.123456))
+
+
+def register_echo() -> None:
+    @subscribe_raw("bench.ping")
+    async def echo(topic: str, data: bytes, codec: str):
+        await send("bench.pong", data, codec)
+
+
+async def client(url: str, count: int) -> str:
+    pongs = asyncio.Queue()
+
+    @subscribe_raw("bench.pong")
+    async def pong(topic: str, data: bytes, codec: str):
+        pongs.put_nowait(time.perf_counter())
+
+    echo = None
+    if url.startswith("inproc:"):
+        register_echo()
+    else:
+        echo = subprocess.Popen([sys.executable, __file__, "--echo"], env=os.environ)
+    done = asyncio.get_running_loop().create_future()
+
+    @on_start
+    async def measure():
+        # Esperar a que el eco esté suscrito
+        while True:
+            await send("bench.ping", PAYLOAD, "json")
+            try:
+                await asyncio.wait_for(pongs.get(), 0.2)
+                break
+            except asyncio.TimeoutError:
+                pass
+        await asyncio.sleep(0.2)
+        while not pongs.empty():
+            pongs.get_nowait()
+
+        rtts = []
+        for _ in range(min(count, 5000)):
+            t0 = time.perf_counter()
+            await send("bench.ping", PAYLOAD, "json")
+            rtts.append(await pongs.get() - t0)
+        rtts.sort()
+
+        t0 = time.perf_counter()
+        for i in range(count):
+            await send("bench.ping", PAYLOAD, "json")
+            if i % 1000 == 999:
+                await asyncio.sleep(0)
+        for _ in range(count):
+            await pongs.get()
+        rate = count / (time.perf_counter() - t0)
+        done.set_result(f"{url:<24} {statistics.median(rtts) * 1e6:>10.1f} "
+                        f"{rtts[int(len(rtts) * 0.99)] * 1e6:>10.1f} {rate:>12.0f}")
+
+    node = asyncio.create_task(start())
+    try:
+        return await asyncio.wait_for(done, 120)
+    finally:
+        node.cancel()
+        if echo is not None:
+            echo.terminate()
+            echo.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("urls", nargs="*", default=["nats://127.0.0.1:4222", "inproc://", "shm://bench"])
+    parser.add_argument("--count", type=int, default=20000, help="mensajes de la prueba de throughput")
+    parser.add_argument("--echo", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--client", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.echo:
+        register_echo()
+        asyncio.run(start())
+    elif args.client:
+        print(asyncio.run(client(os.environ["NATS_URL"], args.count)))
+    else:
+        print(f"{'url':<24} {'rtt p50 µs':>10} {'rtt p99 µs':>10} {'pipeline msg/s':>12}")
+        sys.stdout.flush()
+        # Un proceso por url: starting_pack tiene una sola conexión por proceso
+        for url in args.urls:
+            subprocess.run([sys.executable, __file__, "--client", "--count", str(args.count)],
+                           env=dict(os.environ, NATS_URL=url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+from typing import Optional
+import numpy as np
+from cone_index import ConeIndex
+
+# ============================
+#   Parámetros de la línea
+# ============================
+
+SPACING = 0.25  # m entre puntos de la línea remuestreada
+SMOOTH_M = 4.0  # m, ventana mínima del suavizado (media móvil circular, dos pasadas)
+OFFSET_M = 1.5  # m de la línea a los conos, hacia el interior del circuito
+WINDOW_BACK = 8  # puntos hacia atrás en la búsqueda de proyección
+WINDOW_AHEAD = 48  # puntos hacia delante (12 m con SPACING = 0.25)
+LOST_DISTANCE = 5.0  # m: más lejos que esto de la ventana se busca en toda la línea
+
+
+def order_loop(index: ConeIndex) -> np.ndarray:
+    """Índices de los conos en orden de recorrido (vecino más cercano aún no visitado)."""
+    n = len(index)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.intp)
+    i = 0
+    for k in range(n):
+        order[k] = i
+        visited[i] = True
+        if k + 1 < n:
+            i = index.nearest(float(index.xs[i]), float(index.ys[i]),
+                              where=lambda f: ~visited[f.idx])
+    return order
+
+
+def resample_loop(x: np.ndarray, y: np.ndarray, spacing: float):
+    """Polilínea cerrada remuestreada a puntos equiespaciados por longitud de arco."""
+    px = np.append(x, x[0])
+    py = np.append(y, y[0])
+    s = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(px), np.diff(py)))])
+    n = max(8, int(round(s[-1] / spacing)))
+    t = np.arange(n) * (s[-1] / n)
+    return np.interp(t, s, px), np.interp(t, s, py)
+
+
+def smooth_loop(v: np.ndarray, window: int) -> np.ndarray:
+    """Media móvil circular de `window` puntos."""
+    window = max(1, min(window, len(v)) | 1)  # impar y no más larga que la línea
+    pad = window // 2
+    extended = np.concatenate([v[len(v) - pad:], v, v[:pad]])
+    return np.convolve(extended, np.ones(window) / window, mode="valid")
+
+
+class Centerline:
+
+    """
+    Línea de referencia del circuito como polilínea cerrada suavizada, con su
+    longitud de arco acumulada (`s`) y curvatura por punto. Se construye una
+    vez por mapa de conos; después cada tick solo mira una ventana de puntos
+    alrededor de la proyección anterior, así que su coste no depende del
+    tamaño del circuito.
+
+    El simulador marca el circuito con un único anillo de conos (sin colores),
+    así que la línea es ese anillo ordenado y suavizado, desplazada OFFSET_M
+    hacia dentro y recorrida en sentido antihorario (conos a la derecha, como
+    en controller.py).
+    """
+
+    def __init__(self, xs: np.ndarray, ys: np.ndarray):
+        self.xs = xs
+        self.ys = ys
+        n = len(xs)
+        seg = np.hypot(np.roll(xs, -1) - xs, np.roll(ys, -1) - ys)
+        self.s = np.concatenate([[0.0], np.cumsum(seg[:-1])])  # s[i]: arco hasta el punto i
+        self.length = float(seg.sum())
+        self.spacing = self.length / n
+        self.s_loop = np.concatenate([self.s, self.s + self.length])  # dos vueltas, para advance_many
+
+        # Curvatura con signo (izquierda+) a partir de diferencias centradas
+        dx = (np.roll(xs, -1) - np.roll(xs, 1)) / 2
+        dy = (np.roll(ys, -1) - np.roll(ys, 1)) / 2
+        ddx = np.roll(xs, -1) - 2 * xs + np.roll(xs, 1)
+        ddy = np.roll(ys, -1) - 2 * ys + np.roll(ys, 1)
+        self.curvature = (dx * ddy - dy * ddx) / np.maximum(np.hypot(dx, dy) ** 3, 1e-12)
+        self.window = np.arange(-WINDOW_BACK, WINDOW_AHEAD + 1)
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    @classmethod
+    def from_index(cls, index: ConeIndex, offset: float = OFFSET_M,
+                   spacing: float = SPACING) -> Optional["Centerline"]:
+        if len(index) < 3:
+            return None
+        order = order_loop(index)
+        x, y = index.xs[order], index.ys[order]
+        # Sentido antihorario (área con signo positiva): la normal izquierda apunta hacia dentro
+        if np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)) < 0:
+            x, y = x[::-1], y[::-1]
+
+        # La ventana cubre al menos la separación media entre conos, así se
+        # borran las esquinas del polígono que forman
+        gap = float(np.hypot(np.diff(x, append=x[0]), np.diff(y, append=y[0])).mean())
+        x, y = resample_loop(x, y, spacing)
+        window = int(round(max(SMOOTH_M, gap) / spacing))
+        for _ in range(2):
+            x, y = smooth_loop(x, window), smooth_loop(y, window)
+
+        tx = np.roll(x, -1) - np.roll(x, 1)
+        ty = np.roll(y, -1) - np.roll(y, 1)
+        norm = np.maximum(np.hypot(tx, ty), 1e-12)
+        x = x - ty / norm * offset
+        y = y + tx / norm * offset
+        # El desplazamiento cambia las distancias: volver a equiespaciar
+        return cls(*resample_loop(x, y, spacing))
+
+    # ============================
+    #   Consultas
+    # ============================
+
+    def project(self, x: float, y: float, hint: Optional[int] = None) -> int:
+        """Punto de la línea más cercano a (x, y), buscando cerca de `hint` si se da."""
+        if hint is not None:
+            idx = (hint + self.window) % len(self)
+            d2 = (self.xs[idx] - x) ** 2 + (self.ys[idx] - y) ** 2
+            k = int(np.argmin(d2))
+            if d2[k] <= LOST_DISTANCE ** 2:
+                return int(idx[k])
+        d2 = (self.xs - x) ** 2 + (self.ys - y) ** 2
+        return int(np.argmin(d2))
+
+    def advance(self, i: int, distance: float) -> int:
+        """Índice del punto `distance` metros por delante de `i` a lo largo de la línea."""
+        n = len(self)
+        j = i + int(distance / self.spacing)
+        # Corregir el salto con la longitud de arco real (unos pocos pasos)
+        target = self.s[i] + distance
+        while self.s[j % n] + self.length * (j // n) > target and j > i:
+            j -= 1
+        while self.s[(j + 1) % n] + self.length * ((j + 1) // n) <= target:
+            j += 1
+        return j % n
+
+    def max_curvature(self, i: int, j: int) -> float:
+        """|curvatura| máxima entre los puntos i y j (en sentido de avance)."""
+        if j >= i:
+            return float(np.abs(self.curvature[i:j + 1]).max())
+        return float(max(np.abs(self.curvature[i:]).max(), np.abs(self.curvature[:j + 1]).max()))
+
+    # ============================
+    #   Consultas de varios puntos
+    # ============================
+
+    def project_many(self, x: np.ndarray, y: np.ndarray, hints: np.ndarray) -> np.ndarray:
+        """`project` de varios puntos a la vez; un hint negativo es sin pista."""
+        idx = (np.maximum(hints, 0)[:, None] + self.window) % len(self)
+        d2 = (self.xs[idx] - x[:, None]) ** 2 + (self.ys[idx] - y[:, None]) ** 2
+        k = d2.argmin(axis=1)
+        rows = np.arange(len(x))
+        found = idx[rows, k]
+        # Sin pista o lejos de la ventana: búsqueda en toda la línea, solo esos puntos
+        lost = (hints < 0) | (d2[rows, k] > LOST_DISTANCE ** 2)
+        if lost.any():
+            d2 = (self.xs - x[lost, None]) ** 2 + (self.ys - y[lost, None]) ** 2
+            found[lost] = d2.argmin(axis=1)
+        return found
+
+    def advance_many(self, i: np.ndarray, distance: np.ndarray) -> np.ndarray:
+        """`advance` de varios puntos a la vez (distancias menores que una vuelta)."""
+        j = np.searchsorted(self.s_loop, self.s[i] + distance, side="right") - 1
+        return np.maximum(j, i) % len(self)
+
+    def max_curvature_many(self, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """`max_curvature` de varios tramos a la vez."""
+        span = (j - i) % len(self)
+        steps = np.arange(int(span.max(initial=0)) + 1)
+        idx = (i[:, None] + steps) % len(self)
+        return np.where(steps <= span[:, None], np.abs(self.curvature[idx]), 0.0).max(axis=1, initial=0.0)
@@ -0,0 +1,195 @@
+"""Contactos con conos y salidas del circuito de toda la flota, vectorizados.
+
+En cada paso `TrackMonitor.update` recibe las poses de todos los coches (los
+arrays de `physics.Fleet`) y devuelve los eventos nuevos:
+- hit: el triángulo del coche (el mismo que dibuja visualizer.py) empieza a
+  tocar un cono
+- off_track / on_track: el coche se aleja más de TRACK_WIDTH_M de la línea de
+  conos, o vuelve
+
+Solo se prueban los conos cercanos a cada coche (`ConeIndex.query_radius_many`
+sobre la rejilla), así que el coste por paso crece con el número de coches y
+de conos cerca de ellos, no con el tamaño del circuito. Además cada coche
+guarda cuánto puede moverse sin que cambie nada (su holgura hasta el cono
+más cercano, y por separado hasta el borde del circuito) y solo se vuelve a
+probar cuando se ha movido más que eso: en la mayoría de pasos un coche solo
+cuesta una distancia. Con pocos pares coche x cono las distancias se calculan
+todas de una vez, sin la rejilla, que tiene un coste fijo mayor.
+"""
+
+from typing import List
+import numpy as np
+from cone_index import ConeIndex
+from centerline import order_loop, resample_loop
+from messages import TrackEvent
+
+# ============================
+#   Geometría
+# ============================
+
+# Triángulo del coche en su propio marco (x adelante, y izquierda), en sentido antihorario
+L = 1.5
+W = 0.7
+CAR_TRIANGLE = np.array([
+    [L, 0],
+    [-L * 0.6, W],
+    [-L * 0.6, -W],
+])
+CAR_RADIUS = float(np.hypot(CAR_TRIANGLE[:, 0], CAR_TRIANGLE[:, 1]).max())  # círculo que contiene el triángulo
+CONE_RADIUS = 0.15  # m, radio de la base de un cono
+TRACK_WIDTH_M = 4.0  # m a un lado u otro de la línea de conos que siguen siendo circuito
+BOUNDARY_SPACING = 1.0  # m entre puntos del anillo; la distancia al anillo sale como mucho ~3 cm larga
+HIT_RADIUS = CAR_RADIUS + CONE_RADIUS  # más lejos de ningún cono el coche no puede tocarlo
+MAX_SLACK = 2.0  # m, holgura máxima: se miran conos y anillo hasta esta distancia más allá
+DENSE_PAIRS = 4096  # hasta cuántos pares coche x punto se calculan todas las distancias sin rejilla
+
+
+# Aristas del triángulo: origen (AX, AY), vector (EX, EY) y longitud al cuadrado
+AX, AY = CAR_TRIANGLE.T
+EX, EY = (np.roll(CAR_TRIANGLE, -1, axis=0) - CAR_TRIANGLE).T
+EDGE_SQ = EX * EX + EY * EY
+
+
+def triangle_distance(px: np.ndarray, py: np.ndarray) -> np.ndarray:
+    """Distancia de puntos (en el marco del coche) al triángulo del coche, 0 dentro."""
+    ex, ey = EX, EY
+    dx = px[:, None] - AX
+    dy = py[:, None] - AY
+    # Punto más cercano de cada arista: proyección recortada a [0, 1]
+    t = np.minimum(np.maximum((dx * ex + dy * ey) / EDGE_SQ, 0.0), 1.0)
+    dist = np.hypot(dx - t * ex, dy - t * ey).min(axis=1)
+    # Dentro si queda a la izquierda de las tres aristas
+    inside = ((ex * dy - ey * dx) >= 0.0).all(axis=1)
+    return np.where(inside, 0.0, dist)
+
+
+def near_pairs(index: ConeIndex, x: np.ndarray, y: np.ndarray, r: float):
+    """(coche, cono, distancia) de cada cono a distancia <= r de cada coche."""
+    if len(x) * len(index) <= DENSE_PAIRS:
+        dist = np.hypot(index.xs - x[:, None], index.ys - y[:, None])
+        car, cone = np.nonzero(dist <= r)
+        return car, cone, dist[car, cone]
+    car, cone = index.query_radius_many(x, y, r)
+    return car, cone, np.hypot(index.xs[cone] - x[car], index.ys[cone] - y[car])
+
+
+def nearest_distance(n: int, car: np.ndarray, dist: np.ndarray) -> np.ndarray:
+    """Distancia mínima por coche entre sus pares, inf si no tiene ninguno."""
+    nearest = np.full(n, np.inf)
+    np.minimum.at(nearest, car, dist)
+    return nearest
+
+
+# ============================
+#   Monitor
+# ============================
+
+class Slack:
+
+    """
+    Cuánto puede alejarse cada coche de `anchor` (su posición en la última
+    prueba) sin que cambie el resultado. Holgura 0: se prueba en cada paso.
+    """
+
+    def __init__(self, n: int):
+        self.anchor_x = np.zeros(n)
+        self.anchor_y = np.zeros(n)
+        self.slack = np.zeros(n)  # 0: todos se prueban en el primer paso
+
+    def due(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Coches que se han movido al menos su holgura y hay que volver a probar."""
+        return np.flatnonzero(np.hypot(x - self.anchor_x, y - self.anchor_y) >= self.slack)
+
+    def reset(self, cars: np.ndarray, x: np.ndarray, y: np.ndarray, slack: np.ndarray) -> None:
+        self.anchor_x[cars] = x
+        self.anchor_y[cars] = y
+        self.slack[cars] = np.clip(slack, 0.0, MAX_SLACK)
+
+
+class TrackMonitor:
+
+    """
+    Estado de contactos de una flota sobre un mapa de conos. Guarda qué pares
+    (coche, cono) están en contacto y qué coches están fuera, así cada contacto
+    o salida se informa una vez, al empezar, y no en cada paso que dura.
+
+    El circuito es el anillo de conos ordenado y remuestreado cada BOUNDARY_SPACING m;
+    un coche está fuera cuando ningún punto del anillo queda a TRACK_WIDTH_M.
+
+    Un coche solo se prueba contra los conos cuando se ha movido más que su
+    holgura hasta el cono más cercano (`hit_slack`), y contra el borde cuando
+    se ha movido más que su distancia a cruzarlo (`track_slack`). Con un cono a
+    HIT_RADIUS la holgura es 0, porque el contacto depende también del rumbo.
+    """
+
+    def __init__(self, index: ConeIndex, n: int, track_width: float = TRACK_WIDTH_M):
+        self.index = index
+        self.track_width = track_width
+        if len(index) >= 3:
+            order = order_loop(index)
+            self.boundary = ConeIndex(*resample_loop(index.xs[order], index.ys[order], BOUNDARY_SPACING))
+        else:
+            self.boundary = None  # sin circuito no hay salidas
+        self.contacts = np.empty(0, dtype=np.int64)  # coche * len(index) + cono, ordenados
+        self.off_track = np.zeros(n, dtype=bool)
+        self.hit_slack = Slack(n)
+        self.track_slack = Slack(n)
+
+    def update(self, x: np.ndarray, y: np.ndarray, yaw: np.ndarray, timestamp: float) -> List[TrackEvent]:
+        """Eventos nuevos con las poses actuales de todos los coches."""
+        events = []
+        cars = self.hit_slack.due(x, y)
+        if len(cars):
+            events += self.update_hits(cars, x, y, yaw, timestamp)
+        cars = self.track_slack.due(x, y) if self.boundary is not None else cars[:0]
+        if len(cars):
+            events += self.update_track(cars, x, y, timestamp)
+        return events
+
+    def update_hits(self, cars: np.ndarray, x: np.ndarray, y: np.ndarray, yaw: np.ndarray,
+                    timestamp: float) -> List[TrackEvent]:
+        """Contactos nuevos de los coches `cars`; los demás no tienen ningún cono al alcance."""
+        events = []
+        cx, cy = x[cars], y[cars]
+
+        # Conos al alcance de cada coche (y hasta MAX_SLACK más allá, para la holgura)
+        car, cone, dist = near_pairs(self.index, cx, cy, HIT_RADIUS + MAX_SLACK)
+        self.hit_slack.reset(cars, cx, cy, nearest_distance(len(cars), car, dist) - HIT_RADIUS)
+        near = dist <= HIT_RADIUS
+        car, cone = cars[car[near]], cone[near]
+        if len(car) == 0 and len(self.contacts) == 0:
+            return events  # ningún cono al alcance ni contactos que terminen
+
+        # Prueba exacta contra el triángulo de cada coche
+        dx = self.index.xs[cone] - x[car]
+        dy = self.index.ys[cone] - y[car]
+        cos_yaw, sin_yaw = np.cos(yaw[car]), np.sin(yaw[car])
+        touching = triangle_distance(cos_yaw * dx + sin_yaw * dy,
+                                     -sin_yaw * dx + cos_yaw * dy) <= CONE_RADIUS
+        contacts = np.sort(car[touching].astype(np.int64) * len(self.index) + cone[touching])
+        for key in np.setdiff1d(contacts, self.contacts, assume_unique=True).tolist():
+            vehicle, cone_id = divmod(key, len(self.index))
+            events.append(TrackEvent(kind="hit", vehicle=vehicle, cone=cone_id, timestamp=timestamp,
+                                     x=float(x[vehicle]), y=float(y[vehicle])))
+        # Un coche con un contacto tiene holgura 0 y siempre está en `cars`
+        self.contacts = contacts
+        return events
+
+    def update_track(self, cars: np.ndarray, x: np.ndarray, y: np.ndarray,
+                     timestamp: float) -> List[TrackEvent]:
+        """Salidas y vueltas de los coches `cars`; los demás siguen donde estaban."""
+        events = []
+        cx, cy = x[cars], y[cars]
+
+        # Fuera: ningún punto del anillo de conos a menos de track_width
+        car, _, dist = near_pairs(self.boundary, cx, cy, self.track_width + MAX_SLACK)
+        nearest = nearest_distance(len(cars), car, dist)
+        self.track_slack.reset(cars, cx, cy, np.abs(nearest - self.track_width))
+        off_track = nearest > self.track_width
+        for i in np.flatnonzero(off_track != self.off_track[cars]).tolist():
+            vehicle = int(cars[i])
+            events.append(TrackEvent(kind="off_track" if off_track[i] else "on_track",
+                                     vehicle=vehicle, cone=-1, timestamp=timestamp,
+                                     x=float(x[vehicle]), y=float(y[vehicle])))
+        self.off_track[cars] = off_track
+        return events
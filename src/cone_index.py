@@ -0,0 +1,242 @@
+import math
+from typing import Callable, NamedTuple, Optional, Union
+import numpy as np
+from messages import Cones, ConeMap
+
+# ============================
+#   Parámetros del índice
+# ============================
+
+CELL_SIZE = 5.0  # m, lado de cada celda de la rejilla
+MAX_CELLS_PER_CONE = 4  # límite de celdas vacías para circuitos muy dispersos
+FULL_SCAN_MAX = 256  # con menos conos una pasada sobre todos es más barata que la rejilla
+CONE_DTYPES = ("<f8", "<f4")  # tipos de coordenada de ConeMap
+
+
+# ============================
+#   Mapa empaquetado
+# ============================
+
+def pack_cones(xs, ys, classes=None, dtype: str = "<f8") -> ConeMap:
+    """ConeMap con las coordenadas (y las clases, si hay) en buffers contiguos."""
+    if dtype not in CONE_DTYPES:
+        raise ValueError(f"tipo de coordenada desconocido {dtype}, usa uno de: {', '.join(CONE_DTYPES)}")
+    xy = np.empty((len(xs), 2), dtype=dtype)
+    xy[:, 0] = xs
+    xy[:, 1] = ys
+    if classes is not None:
+        classes = np.ascontiguousarray(classes, dtype=np.uint8).tobytes()
+    return ConeMap(xy=xy.tobytes(), dtype=dtype, classes=classes)
+
+
+def cone_xy(msg: Union[Cones, ConeMap]) -> np.ndarray:
+    """
+    Coordenadas de los conos como array (n, 2). Con un ConeMap es una vista de
+    solo lectura sobre el buffer del mensaje (sin copias); con Cones se construye.
+    """
+    if isinstance(msg, ConeMap):
+        if msg.dtype not in CONE_DTYPES:
+            raise ValueError(f"tipo de coordenada desconocido {msg.dtype}, usa uno de: {', '.join(CONE_DTYPES)}")
+        return np.frombuffer(msg.xy, dtype=msg.dtype).reshape(-1, 2)
+    xy = np.fromiter((v for c in msg.cones for v in (c.x, c.y)), dtype=np.float64, count=2 * len(msg.cones))
+    return xy.reshape(-1, 2)
+
+
+def cone_classes(msg: ConeMap) -> Optional[np.ndarray]:
+    """Clase de cada cono (uint8, vista sobre el mensaje) o None si no las trae."""
+    if msg.classes is None:
+        return None
+    return np.frombuffer(msg.classes, dtype=np.uint8)
+
+
+class EgoCones(NamedTuple):
+
+    """
+    Conos expresados en el marco del coche (un array por campo):
+    - idx: índice del cono en el mapa original
+    - dist: distancia al coche (m)
+    - bearing: ángulo relativo al rumbo del coche, en [-pi, pi]
+    - x_rel: coordenada longitudinal (adelante+)
+    - y_rel: coordenada lateral (izquierda+)
+    """
+
+    idx: np.ndarray
+    dist: np.ndarray
+    bearing: np.ndarray
+    x_rel: np.ndarray
+    y_rel: np.ndarray
+
+
+def ego_cones(x_rel: np.ndarray, y_rel: np.ndarray) -> EgoCones:
+    """EgoCones a partir de posiciones ya expresadas en el marco del coche."""
+    return EgoCones(
+        idx=np.arange(len(x_rel)),
+        dist=np.hypot(x_rel, y_rel),
+        bearing=np.arctan2(y_rel, x_rel),
+        x_rel=x_rel,
+        y_rel=y_rel,
+    )
+
+
+class ConeIndex:
+
+    """
+    Mapa de conos como arrays de NumPy con una rejilla uniforme para consultas
+    por radio. Se construye una vez por mensaje `Cones` y se reutiliza en cada tick.
+
+    La rejilla se guarda en formato CSR: los conos ordenados por celda
+    (`_order`) y el inicio de cada celda (`_starts`). Dentro de una fila las
+    celdas son contiguas, así que una consulta es un slice por fila.
+    """
+
+    def __init__(self, xs, ys, cell_size: float = CELL_SIZE):
+        self.xs = np.ascontiguousarray(xs, dtype=np.float64)
+        self.ys = np.ascontiguousarray(ys, dtype=np.float64)
+        n = len(self.xs)
+
+        if n == 0:
+            self.cell_size = cell_size
+            self.x0 = self.y0 = self.x1 = self.y1 = 0.0
+            self.nx = self.ny = 0
+            self._order = np.empty(0, dtype=np.intp)
+            self._starts = np.zeros(1, dtype=np.intp)
+            return
+
+        self.x0, self.x1 = float(self.xs.min()), float(self.xs.max())
+        self.y0, self.y1 = float(self.ys.min()), float(self.ys.max())
+
+        # Agrandar las celdas si la rejilla quedaría casi vacía
+        area = max(self.x1 - self.x0, cell_size) * max(self.y1 - self.y0, cell_size)
+        cell_size = max(cell_size, math.sqrt(area / (MAX_CELLS_PER_CONE * n)))
+        self.cell_size = cell_size
+        self.nx = int((self.x1 - self.x0) // cell_size) + 1
+        self.ny = int((self.y1 - self.y0) // cell_size) + 1
+
+        cx = ((self.xs - self.x0) // cell_size).astype(np.intp)
+        cy = ((self.ys - self.y0) // cell_size).astype(np.intp)
+        cells = cy * self.nx + cx
+        # Orden estable: dentro de cada celda se conserva el orden original
+        self._order = np.argsort(cells, kind="stable")
+        self._starts = np.searchsorted(cells[self._order], np.arange(self.nx * self.ny + 1))
+
+    @classmethod
+    def from_cones(cls, msg: Union[Cones, ConeMap], cell_size: float = CELL_SIZE) -> "ConeIndex":
+        xy = cone_xy(msg)
+        return cls(xy[:, 0], xy[:, 1], cell_size)
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    # ============================
+    #   Consultas
+    # ============================
+
+    def query_radius(self, x: float, y: float, r: float) -> np.ndarray:
+        """Índices (ordenados) de los conos a distancia <= r de (x, y)."""
+        if len(self) == 0:
+            return self._order[:0]
+
+        cs = self.cell_size
+        cx0 = max(0, int((x - r - self.x0) // cs))
+        cx1 = min(self.nx - 1, int((x + r - self.x0) // cs))
+        cy0 = max(0, int((y - r - self.y0) // cs))
+        cy1 = min(self.ny - 1, int((y + r - self.y0) // cs))
+        if cx0 > cx1 or cy0 > cy1:
+            return self._order[:0]
+
+        starts = self._starts
+        chunks = [
+            self._order[starts[row * self.nx + cx0]:starts[row * self.nx + cx1 + 1]]
+            for row in range(cy0, cy1 + 1)
+        ]
+        idx = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        idx = idx[np.hypot(self.xs[idx] - x, self.ys[idx] - y) <= r]
+        idx.sort()
+        return idx
+
+    def query_radius_many(self, xs: np.ndarray, ys: np.ndarray, r: float):
+        """
+        query_radius para muchos puntos a la vez, sin bucle en Python. Devuelve
+        dos arrays (punto, cono) con un par por cada cono a distancia <= r de
+        cada punto. Cada punto solo mira las filas de celdas que toca su círculo.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if len(self) == 0 or len(xs) == 0:
+            return self._order[:0], self._order[:0]
+
+        cs = self.cell_size
+        cx0 = np.maximum(0, ((xs - r - self.x0) // cs).astype(np.intp))
+        cx1 = np.minimum(self.nx - 1, ((xs + r - self.x0) // cs).astype(np.intp))
+        cy0 = np.maximum(0, ((ys - r - self.y0) // cs).astype(np.intp))
+        cy1 = np.minimum(self.ny - 1, ((ys + r - self.y0) // cs).astype(np.intp))
+
+        # Un slice del CSR por (punto, fila): como mucho `rows` filas por punto
+        rows = int(2 * r // cs) + 2
+        row = cy0[:, None] + np.arange(rows)
+        ok = (row <= cy1[:, None]) & (cx0 <= cx1)[:, None]
+        point = np.nonzero(ok)[0]
+        row = row[ok]
+        begin = self._starts[row * self.nx + cx0[point]]
+        counts = self._starts[row * self.nx + cx1[point] + 1] - begin
+
+        # Concatenar los slices: posición de cada candidato dentro de _order
+        total = int(counts.sum())
+        owner = np.repeat(point, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        idx = self._order[np.repeat(begin, counts) + offsets]
+        keep = np.hypot(self.xs[idx] - xs[owner], self.ys[idx] - ys[owner]) <= r
+        return owner[keep], idx[keep]
+
+    def frame(self, x: float, y: float, yaw: float,
+              idx: Optional[np.ndarray] = None) -> EgoCones:
+        """Transforma los conos `idx` (todos si es None) al marco del coche."""
+        if idx is None:
+            idx = np.arange(len(self))
+            dx = self.xs - x
+            dy = self.ys - y
+        else:
+            dx = self.xs[idx] - x
+            dy = self.ys[idx] - y
+
+        cos_yaw = math.cos(yaw)
+        sin_yaw = math.sin(yaw)
+        bearing = (np.arctan2(dy, dx) - yaw + math.pi) % (2 * math.pi) - math.pi
+        return EgoCones(
+            idx=idx,
+            dist=np.hypot(dx, dy),
+            bearing=bearing,
+            x_rel=dx * cos_yaw + dy * sin_yaw,
+            y_rel=-(dx * sin_yaw) + (dy * cos_yaw),
+        )
+
+    def visible(self, x: float, y: float, yaw: float, max_range: float, fov: float) -> EgoCones:
+        """Conos a distancia <= max_range y con |bearing| <= fov, en el marco del coche."""
+        f = self.frame(x, y, yaw, self.query_radius(x, y, max_range))
+        keep = np.abs(f.bearing) <= fov
+        return EgoCones(*(field[keep] for field in f))
+
+    def nearest(self, x: float, y: float, yaw: float = 0.0,
+                where: Optional[Callable[[EgoCones], np.ndarray]] = None) -> int:
+        """
+        Índice del cono más cercano que cumple `where` (máscara sobre EgoCones),
+        o -1 si no hay ninguno. Busca en anillos crecientes de la rejilla; en
+        caso de empate devuelve el de menor índice, igual que un bucle lineal.
+        """
+        if len(self) == 0:
+            return -1
+
+        # Distancia a la esquina más lejana del mapa: a partir de ahí se han visto todos
+        reach = math.hypot(max(abs(x - self.x0), abs(x - self.x1)),
+                           max(abs(y - self.y0), abs(y - self.y1)))
+        r = self.cell_size if len(self) > FULL_SCAN_MAX else reach
+        while True:
+            # Cuando el radio cubre todo el mapa se recorren todos los conos sin la rejilla
+            idx = self.query_radius(x, y, r) if r < reach else None
+            f = self.frame(x, y, yaw, idx)
+            ok = np.flatnonzero(where(f)) if where is not None else np.arange(len(f.idx))
+            if len(ok):
+                return int(f.idx[ok[np.argmin(f.dist[ok])]])
+            if idx is None:
+                return -1
+            r *= 2
@@ -1,18 +1,37 @@
 import math
+import os
 from typing import List, Optional
 from msgspec import Struct
-from starting_pack import subscribe, publish, timer, start
+from starting_pack import subscribe, subscribe_snapshot, publish, timer, on_message, start
 import asyncio
-from messages import VehicleState, Controls, Cone, Cones
+import numpy as np
+from messages import VehicleState, Controls, Cone, ConeMap, Perception
+from cone_index import ConeIndex, EgoCones, ego_cones
 
 # ============================
 #   Variables globales
 # ============================
 
 latest_state: Optional[VehicleState] = None
-latest_cones: Optional[Cones] = None
+latest_cones: Optional[ConeMap] = None
+cone_index: Optional[ConeIndex] = None  # se reconstruye una vez por mapa de conos
+latest_perception: Optional[Perception] = None
+
+# Con PERCEPTION=1 se conduce con los conos que publica el simulador en
+# `simulator.perception` (solo los cercanos, en el marco del coche) en lugar
+# del mapa completo
+PERCEPTION = bool(int(os.environ.get("PERCEPTION") or 0))
+
+# El control se calcula en cuanto llega cada estado nuevo (o percepción, con
+# PERCEPTION=1). Con CONTROL_PERIOD=<s> se calcula en un @timer de ese
+# periodo, sin sincronizar con el simulador, como antes
+CONTROL_PERIOD = float(os.environ.get("CONTROL_PERIOD") or 0)
 
 TARGET_SPEED = 6.0  # m/s
+FOV = math.radians(120)  # semiángulo del campo de visión
+K_STEER = 1.2  # ganancia de dirección
+K_SPEED = 0.6  # ganancia de velocidad
+LATERAL_OFFSET_M = 1.0  # desplazamiento lateral deseado respecto al cono
 
 
 # ============================
@@ -29,83 +48,64 @@ def angle_diff(a: float, b: float) -> float:
 #   Suscripciones NATS
 # ============================
 
-@subscribe("simulator.state", VehicleState)
+# Solo interesa el último estado: si el nodo se retrasa se saltan los atrasados
+@subscribe("simulator.state", VehicleState, mode="latest")
 async def state_callback(msg: VehicleState):
     
     global latest_state
     latest_state = msg
 
 
-@subscribe("simulator.cones", Cones)
-async def cones_callback(msg: Cones):
+async def cones_callback(msg: ConeMap):
     
-    global latest_cones
+    global latest_cones, cone_index
     latest_cones = msg
+    cone_index = ConeIndex.from_cones(msg)
+
+
+async def perception_callback(msg: Perception):
+
+    global latest_perception
+    latest_perception = msg
+
+
+if PERCEPTION:
+    subscribe("simulator.perception", Perception, mode="latest")(perception_callback)
+else:
+    subscribe_snapshot("simulator.conemap", ConeMap)(cones_callback)
 
 
 # ============================
 #   Control principal
 # ============================
 
-@timer(0.05)
-async def control_loop():
-    """Algoritmo de conducción autónoma básico."""
-    global latest_state, latest_cones
+def in_front(f: EgoCones, min_dist: float) -> np.ndarray:
+    """Conos "delante" (±120°) y a una distancia mínima."""
+    return (np.abs(f.bearing) < FOV) & (f.dist > min_dist)
 
-    if latest_state is None or latest_cones is None:
-        return  # Se espera a tener datos
 
-    s = latest_state
-    cones = latest_cones.cones
+def compute_controls(s: VehicleState, index: ConeIndex) -> Controls:
+    """Algoritmo de conducción autónoma básico."""
 
     # Buscar cono objetivo:
     # 1) Preferir conos a la derecha del vehículo (en el marco del coche)
     # 2) De los válidos delante, elegir el más cercano
-    best_cone = None
-    best_dist = float("inf")
-    found_right = False  # indica si ya encontramos conos a la derecha
-
-    for c in cones:
-        dx = c.x - s.x
-        dy = c.y - s.y
-        dist = math.hypot(dx, dy)
-        angle_to = math.atan2(dy, dx)
-        angle_diff_to = angle_diff(angle_to, s.yaw)
-
-        # Filtrar conos "delante" (±120°) y a una distancia mínima
-        if abs(angle_diff_to) < math.radians(120) and dist > 1.0:
-
-            # Coordenada lateral en el marco del coche (y_car):
-            y_rel = -(dx * math.sin(s.yaw)) + (dy * math.cos(s.yaw))
-
-            # Preferir conos a la derecha (y_rel < 0). 
-            if y_rel < 0:
-                if (not found_right) or (dist < best_dist):
-                    best_cone = c
-                    best_dist = dist
-                    found_right = True
-            # Si aún no hemos encontrado ninguno a la derecha, aceptamos cualquiera delante.
-            else:
-                if (not found_right) and (dist < best_dist):
-                    best_cone = c
-                    best_dist = dist
-
-    if best_cone is None and cones:
-        # Si no hay conos delante, ir al más cercano obv
-        for c in cones:
-            dx = c.x - s.x
-            dy = c.y - s.y
-            dist = math.hypot(dx, dy)
-            if dist < best_dist:
-                best_cone = c
-                best_dist = dist
+    # 3) Si no hay conos delante, ir al más cercano obv
+    best = index.nearest(s.x, s.y, s.yaw, lambda f: in_front(f, 1.0) & (f.y_rel < 0))
+    if best < 0:
+        best = index.nearest(s.x, s.y, s.yaw, lambda f: in_front(f, 1.0))
+    if best < 0:
+        best = index.nearest(s.x, s.y)
 
     # Calcular comandos de control
-    if best_cone:
+    if best >= 0:
+        cone_x = float(index.xs[best])
+        cone_y = float(index.ys[best])
+
         # Apuntar a un punto desplazado a la izq del cono respecto al vector
         # de aproximación, para pasar dejando el cono a la derecha del vehículo.
-        dx = best_cone.x - s.x
-        dy = best_cone.y - s.y
+        dx = cone_x - s.x
+        dy = cone_y - s.y
         dist = math.hypot(dx, dy)
 
         if dist < 1e-6:
@@ -116,28 +116,73 @@ async def control_loop():
         nx = -vy
         ny = vx
 
-        lateral_offset_m = 1.0  # desplazamiento lateral deseado
-
-        target_x = best_cone.x + nx * lateral_offset_m
-        target_y = best_cone.y + ny * lateral_offset_m
+        target_x = cone_x + nx * LATERAL_OFFSET_M
+        target_y = cone_y + ny * LATERAL_OFFSET_M
 
         angle_to_target = math.atan2(target_y - s.y, target_x - s.x)
         heading_error = angle_diff(angle_to_target, s.yaw)
 
         # Dirección proporcional con saturación
-        K_steer = 1.2
-        steer_cmd = max(-1.0, min(1.0, K_steer * heading_error))
+        steer_cmd = max(-1.0, min(1.0, K_STEER * heading_error))
     else:
         steer_cmd = 0.0
 
     # Control proporcional de velocidad
-    K_speed = 0.6
     speed_error = TARGET_SPEED - s.speed
-    throttle_cmd = K_speed * speed_error
+    throttle_cmd = K_SPEED * speed_error
+
+    return Controls(throttle=throttle_cmd, steer=steer_cmd)
+
+
+def compute_controls_local(s: VehicleState, p: Perception) -> Controls:
+    """Mismo algoritmo que compute_controls con conos ya en el marco del coche."""
+
+    f = ego_cones(np.fromiter((c.x for c in p.cones), dtype=np.float64, count=len(p.cones)),
+                  np.fromiter((c.y for c in p.cones), dtype=np.float64, count=len(p.cones)))
+    ok = np.flatnonzero(in_front(f, 1.0) & (f.y_rel < 0))
+    if len(ok) == 0:
+        ok = np.flatnonzero(in_front(f, 1.0))
+    if len(ok) == 0:
+        ok = f.idx
+
+    steer_cmd = 0.0
+    if len(ok):
+        best = ok[np.argmin(f.dist[ok])]
+        cone_x = float(f.x_rel[best])
+        cone_y = float(f.y_rel[best])
+        dist = max(float(f.dist[best]), 1e-6)
+
+        # El coche está en el origen mirando a +x: el desplazamiento a la
+        # izquierda del vector de aproximación y el error de rumbo salen directos
+        target_x = cone_x - cone_y / dist * LATERAL_OFFSET_M
+        target_y = cone_y + cone_x / dist * LATERAL_OFFSET_M
+        heading_error = math.atan2(target_y, target_x)
+        steer_cmd = max(-1.0, min(1.0, K_STEER * heading_error))
+
+    throttle_cmd = K_SPEED * (TARGET_SPEED - s.speed)
+    return Controls(throttle=throttle_cmd, steer=steer_cmd)
+
+
+async def control_loop():
+    global latest_state, cone_index
+
+    if PERCEPTION:
+        if latest_state is None or latest_perception is None:
+            return  # Se espera a tener datos
+        await publish("vehicle.controls", compute_controls_local(latest_state, latest_perception))
+        return
+
+    if latest_state is None or cone_index is None:
+        return  # Se espera a tener datos
 
     # Enviar controles
-    ctrl = Controls(throttle=throttle_cmd, steer=steer_cmd)
-    await publish("vehicle.controls", ctrl)
+    await publish("vehicle.controls", compute_controls(latest_state, cone_index))
+
+
+if CONTROL_PERIOD:
+    timer(CONTROL_PERIOD)(control_loop)
+else:
+    on_message("simulator.perception" if PERCEPTION else "simulator.state")(control_loop)
 
 
 # ============================
@@ -1,18 +1,26 @@
 import math
 from typing import List, Optional
 from msgspec import Struct
-from starting_pack import subscribe, publish, timer, start
+from starting_pack import subscribe, subscribe_snapshot, publish, on_message, start
 import asyncio
-from messages import VehicleState, Controls, Cone, Cones
+import numpy as np
+from messages import VehicleState, Controls, Cone, ConeMap
+from cone_index import ConeIndex, EgoCones
 
 # ============================
 #   Variables globales
 # ============================
 
 latest_state: Optional[VehicleState] = None
-latest_cones: Optional[Cones] = None
+latest_cones: Optional[ConeMap] = None
+cone_index: Optional[ConeIndex] = None  # se reconstruye una vez por mapa de conos
 
 TARGET_SPEED = 6.0  # m/s
+FOV = math.radians(120)  # semiángulo del campo de visión
+K_STEER = 1.2  # ganancia de dirección (respuesta agresiva para zigzag)
+K_SPEED = 0.6  # ganancia de velocidad
+BRAKE_DISTANCE = 2.0  # m, por debajo se frena al acercarse al cono objetivo
+MIN_PROGRESS = 1.0  # m, umbral mínimo de progreso para evitar quedarse entre dos conos
 # Estado para zigzag
 last_target_side: Optional[str] = None  # 'left' or 'right'
 last_target_proj: Optional[float] = None  # proyección (avance) del último objetivo
@@ -32,61 +40,55 @@ def angle_diff(a: float, b: float) -> float:
 #   Suscripciones NATS
 # ============================
 
-@subscribe("simulator.state", VehicleState)
+# Solo interesa el último estado: si el nodo se retrasa se saltan los atrasados
+@subscribe("simulator.state", VehicleState, mode="latest")
 async def state_callback(msg: VehicleState):
     
     global latest_state
     latest_state = msg
 
 
-@subscribe("simulator.cones", Cones)
-async def cones_callback(msg: Cones):
+@subscribe_snapshot("simulator.conemap", ConeMap)
+async def cones_callback(msg: ConeMap):
     
-    global latest_cones
+    global latest_cones, cone_index
     latest_cones = msg
+    cone_index = ConeIndex.from_cones(msg)
 
 
 # ============================
 #   Control principal
 # ============================
 
-@timer(0.05)
-async def control_loop():
-    """Algoritmo de conducción autónoma básico."""
-    global latest_state, latest_cones
+def most_advanced(s: VehicleState, index: ConeIndex, f: EgoCones, mask: np.ndarray):
+    """Candidato (proyección, distancia, índice, y_rel) más adelantado de `mask`, o None."""
+    k = np.flatnonzero(mask)
+    if not len(k):
+        return None
+    # argmax devuelve el primero de los empates, igual que una ordenación estable
+    j = k[np.argmax(f.x_rel[k])]
+    i = int(f.idx[j])
+    # La distancia del elegido se recalcula con math.hypot (np.hypot puede diferir en el último bit)
+    dist = math.hypot(float(index.xs[i]) - s.x, float(index.ys[i]) - s.y)
+    return float(f.x_rel[j]), dist, i, float(f.y_rel[j])
 
-    if latest_state is None or latest_cones is None:
-        return  # Se espera a tener datos
 
-    s = latest_state
-    cones = latest_cones.cones
+def compute_controls(s: VehicleState, index: ConeIndex) -> Controls:
+    """Algoritmo de conducción autónoma básico."""
 
     # Buscar cono objetivo: zizaguear (lo que hace es ir por el interior del circuito xd)
     global last_target_side, last_target_proj
-    left_candidates = []
-    right_candidates = []
-
-    for c in cones:
-        dx = c.x - s.x
-        dy = c.y - s.y
-        dist = math.hypot(dx, dy)
-        angle_to = math.atan2(dy, dx)
-        angle_diff_to = angle_diff(angle_to, s.yaw)
-
-        # Filtrar conos "delante" (±120°) y a una distancia mínima
-        if abs(angle_diff_to) < math.radians(120) and dist > 0.5:
-            # Coordenadas en el marco del coche
-            x_rel = dx * math.cos(s.yaw) + dy * math.sin(s.yaw)  # adelante+
-            y_rel = -(dx * math.sin(s.yaw)) + (dy * math.cos(s.yaw))  # izquierda+
-            # Guardamos la proyección (avance) x_rel para medir progreso
-            if y_rel < 0:
-                right_candidates.append((x_rel, dist, c, y_rel))
-            else:
-                left_candidates.append((x_rel, dist, c, y_rel))
-
-    # Ordenar por proyección hacia adelante (x_rel) en orden descendente (más adelante primero)
-    left_candidates.sort(key=lambda x: x[0], reverse=True)
-    right_candidates.sort(key=lambda x: x[0], reverse=True)
+
+    # Coordenadas en el marco del coche de todos los conos a la vez
+    f = index.frame(s.x, s.y, s.yaw)
+    # Filtrar conos "delante" (±120°) y a una distancia mínima
+    front = (np.abs(f.bearing) < FOV) & (f.dist > 0.5)
+    right = front & (f.y_rel < 0)
+
+    # Guardamos la proyección (avance) x_rel para medir progreso: de cada lado
+    # nos quedamos con el más adelantado
+    left_best = most_advanced(s, index, f, front & ~right)
+    right_best = most_advanced(s, index, f, right)
 
     best_cone = None
     best_dist = float("inf")
@@ -98,61 +100,29 @@ async def control_loop():
     elif last_target_side == 'right':
         preferred_side = 'left'
 
-    # Umbral mínimo de progreso para evitar quedarse entre dos conos
-    MIN_PROGRESS = 1.0  # metros
-
-    if preferred_side == 'right' and right_candidates:
-        # buscar en candidatos de la derecha uno que avance respecto al último objetivo
-        for proj, dist, c, y_rel in right_candidates:
-            if last_target_proj is None or proj > (last_target_proj + MIN_PROGRESS):
-                best_dist = dist
-                best_cone = c
-                last_target_side = 'right'
-                selected_proj = proj
-                break
-        else:
-            # si no hay avance suficiente, tomar el más avanzado igualmente
-            proj, best_dist, best_cone, y_rel = right_candidates[0]
-            selected_proj = proj
-            last_target_side = 'right'
-    elif preferred_side == 'left' and left_candidates:
-        for proj, dist, c, y_rel in left_candidates:
-            if last_target_proj is None or proj > (last_target_proj + MIN_PROGRESS):
-                best_dist = dist
-                best_cone = c
-                last_target_side = 'left'
-                selected_proj = proj
-                break
-        else:
-            proj, best_dist, best_cone, y_rel = left_candidates[0]
-            selected_proj = proj
+    # El candidato más adelantado es el primero que avanza respecto al último objetivo;
+    # si ni él avanza lo suficiente, se toma igualmente
+    if preferred_side == 'right' and right_best:
+        selected_proj, best_dist, best_cone, y_rel = right_best
+        last_target_side = 'right'
+    elif preferred_side == 'left' and left_best:
+        selected_proj, best_dist, best_cone, y_rel = left_best
+        if last_target_proj is None or selected_proj > (last_target_proj + MIN_PROGRESS):
+            last_target_side = 'left'
     else:
-        # Si no hay candidato del lado preferido, coger el más cercano entre ambos
-        candidates = []
-        if left_candidates:
-            candidates.append(left_candidates[0])
-        if right_candidates:
-            candidates.append(right_candidates[0])
+        # Si no hay candidato del lado preferido, coger el más adelantado entre ambos
+        candidates = [c for c in (left_best, right_best) if c is not None]
         if candidates:
-            
-            # elegir el que esté más adelante y que produzca progreso si es posible
-            candidates.sort(key=lambda x: x[0], reverse=True)
-            chosen = None
-            for proj, dist, c, y_rel in candidates:
-                if last_target_proj is None or proj > (last_target_proj + MIN_PROGRESS):
-                    chosen = (proj, dist, c, y_rel)
-                    break
-            if chosen is None:
-                chosen = candidates[0]
-            best_proj, best_dist, best_cone, y_rel = chosen
+            chosen = max(candidates, key=lambda x: x[0])
+            selected_proj, best_dist, best_cone, y_rel = chosen
             last_target_side = 'right' if y_rel < 0 else 'left'
-            selected_proj = best_proj
         else:
             # fallback: si no hay ninguno en el frente, tomar el más cercano total
-            if cones:
-                best_cone = min(cones, key=lambda c: math.hypot(c.x - s.x, c.y - s.y))
-                dx = best_cone.x - s.x
-                dy = best_cone.y - s.y
+            nearest = index.nearest(s.x, s.y)
+            if nearest >= 0:
+                best_cone = nearest
+                dx = float(index.xs[best_cone]) - s.x
+                dy = float(index.ys[best_cone]) - s.y
                 best_dist = math.hypot(dx, dy)
                 x_rel = dx * math.cos(s.yaw) + dy * math.sin(s.yaw)
                 y_rel = -(dx * math.sin(s.yaw)) + (dy * math.cos(s.yaw))
@@ -160,23 +130,21 @@ async def control_loop():
                 selected_proj = x_rel
 
     # Calcular comandos de control
-    if best_cone:
-        angle_to_target = math.atan2(best_cone.y - s.y, best_cone.x - s.x)
+    if best_cone is not None:
+        angle_to_target = math.atan2(float(index.ys[best_cone]) - s.y,
+                                     float(index.xs[best_cone]) - s.x)
         heading_error = angle_diff(angle_to_target, s.yaw)
 
         # Dirección proporcional (mantener respuesta agresiva para zigzag)
-        K_steer = 1.2
-        steer_cmd = max(-1.0, min(1.0, K_steer * heading_error))
+        steer_cmd = max(-1.0, min(1.0, K_STEER * heading_error))
     else:
         steer_cmd = 0.0
 
     # Control proporcional de velocidad + frenada si es necesario
-    K_speed = 0.6
     speed_error = TARGET_SPEED - s.speed
-    throttle_cmd = K_speed * speed_error
+    throttle_cmd = K_SPEED * speed_error
 
     # Frenado si estamos muy cerca del cono objetivo
-    BRAKE_DISTANCE = 2.0  # m
     if best_cone is not None:
         if best_dist < BRAKE_DISTANCE:
             # Frenada proporcional a la proximidad (más cerca -> más frenada)
@@ -189,17 +157,21 @@ async def control_loop():
             throttle_cmd = min(throttle_cmd, 0.0)
 
         # Actualizar la proyección objetivo elegido para el próximo paso
-        try:
-            last_target_proj = float(selected_proj)
-        except Exception:
-            # si no existe selected_proj, calcular la proyección actual
-            dx = best_cone.x - s.x
-            dy = best_cone.y - s.y
-            last_target_proj = dx * math.cos(s.yaw) + dy * math.sin(s.yaw)
+        last_target_proj = float(selected_proj)
+
+    return Controls(throttle=throttle_cmd, steer=steer_cmd)
+
+
+# Se calcula en cuanto llega cada estado nuevo
+@on_message("simulator.state")
+async def control_loop():
+    global latest_state, cone_index
+
+    if latest_state is None or cone_index is None:
+        return  # Se espera a tener datos
 
     # Enviar controles
-    ctrl = Controls(throttle=throttle_cmd, steer=steer_cmd)
-    await publish("vehicle.controls", ctrl)
+    await publish("vehicle.controls", compute_controls(latest_state, cone_index))
 
 # ============================
 #   Ejecución
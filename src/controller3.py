@@ -0,0 +1,66 @@
+from typing import Optional
+from starting_pack import subscribe, subscribe_snapshot, publish, on_message, start
+import asyncio
+from messages import VehicleState, ConeMap
+from cone_index import ConeIndex
+from centerline import Centerline
+import pure_pursuit
+
+# ============================
+#   Variables globales
+# ============================
+
+latest_state: Optional[VehicleState] = None
+centerline: Optional[Centerline] = None  # se reconstruye una vez por mapa de conos
+last_index: Optional[int] = None  # proyección del tick anterior sobre la línea
+
+# La ley y sus constantes (TARGET_SPEED, LOOKAHEAD_GAIN...) están en pure_pursuit.py,
+# compartidas con fleet_controller.py
+
+
+# ============================
+#   Suscripciones NATS
+# ============================
+
+# Solo interesa el último estado: si el nodo se retrasa se saltan los atrasados
+@subscribe("simulator.state", VehicleState, mode="latest")
+async def state_callback(msg: VehicleState):
+
+    global latest_state
+    latest_state = msg
+
+
+@subscribe_snapshot("simulator.conemap", ConeMap)
+async def cones_callback(msg: ConeMap):
+
+    global centerline, last_index
+    centerline = Centerline.from_index(ConeIndex.from_cones(msg))
+    last_index = None  # los índices de la línea anterior ya no valen
+
+
+# ============================
+#   Control principal
+# ============================
+
+# Se calcula en cuanto llega cada estado nuevo
+@on_message("simulator.state")
+async def control_loop():
+    global last_index
+
+    if latest_state is None or centerline is None:
+        return  # Se espera a tener datos
+
+    controls, last_index = pure_pursuit.compute_controls(latest_state, centerline, last_index)
+    await publish("vehicle.controls", controls)
+
+
+# ============================
+#   Ejecución
+# ============================
+
+if __name__ == "__main__":
+
+    try:
+        asyncio.run(start())
+    except KeyboardInterrupt:
+        print("[LOG] Controlador detenido por el usuario.")
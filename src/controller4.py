@@ -0,0 +1,183 @@
+import math
+import time
+from typing import Optional
+from starting_pack import subscribe, subscribe_snapshot, publish, on_message, start
+import asyncio
+import numpy as np
+from messages import VehicleState, Controls, ConeMap, SolveStats
+from cone_index import ConeIndex
+from centerline import Centerline
+from physics import Fleet, MAX_SPEED, MAX_STEER_ANGLE
+
+# ============================
+#   Variables globales
+# ============================
+
+latest_state: Optional[VehicleState] = None
+cone_index: Optional[ConeIndex] = None  # se reconstruye una vez por mapa de conos
+centerline: Optional[Centerline] = None
+last_index: Optional[int] = None  # proyección del tick anterior sobre la línea
+
+# MPPI: en cada tick se simulan SAMPLES secuencias de controles alrededor de la
+# solución anterior con el mismo modelo que el simulador (physics.Fleet, un
+# "coche" por trayectoria, todas a la vez) y se publica la media de las
+# secuencias pesada por exp(-coste / temperatura)
+SAMPLES = 1000  # trayectorias por tick
+HORIZON = 30  # pasos simulados por trayectoria
+DT = 0.05  # s, el paso de publicación del simulador
+CHECK_EVERY = 3  # la posición se puntúa cada tantos pasos
+NOISE_THROTTLE = 0.4  # desviación de la perturbación de throttle
+NOISE_STEER = 0.3  # desviación de la perturbación de steer
+NOISE_SMOOTHING = 0.8  # correlación de la perturbación entre pasos seguidos (0 = ruido blanco)
+# Temperatura relativa a la dispersión de costes del tick (mediana - mejor): la
+# trayectoria mediana pesa exp(-1 / TEMPERATURE) respecto a la mejor, sea cual
+# sea la escala de los costes. Más baja -> la media se parece más a la mejor
+TEMPERATURE = 0.2
+
+# Coste de una trayectoria
+W_TRACK = 1.0  # por m² de distancia a la línea central más allá de TRACK_BAND, en cada punto puntuado
+TRACK_BAND = 1.0  # m a cada lado de la línea central sin coste
+W_CONE = 100.0  # por m² de invasión de la distancia de seguridad a un cono
+CONE_CLEARANCE = 1.2  # m, distancia de seguridad del coche a los conos
+W_PROGRESS = 5.0  # por m avanzado sobre la línea al final del horizonte
+W_STEER_RATE = 1.0  # por cambio de steer² entre pasos
+LINE_STRIDE = 2  # puntos de la línea central usados (uno de cada tantos)
+
+rng = np.random.default_rng(0)  # semilla fija: los episodios headless se repiten igual
+rollouts: Optional[Fleet] = None  # una trayectoria por coche, se reutiliza entre ticks
+nominal: Optional[np.ndarray] = None  # (throttle, steer) por paso, solución anterior desplazada
+
+
+# ============================
+#   Suscripciones NATS
+# ============================
+
+# Solo interesa el último estado: si el nodo se retrasa se saltan los atrasados
+@subscribe("simulator.state", VehicleState, mode="latest")
+async def state_callback(msg: VehicleState):
+
+    global latest_state
+    latest_state = msg
+
+
+@subscribe_snapshot("simulator.conemap", ConeMap)
+async def cones_callback(msg: ConeMap):
+
+    global cone_index, centerline, last_index
+    cone_index = ConeIndex.from_cones(msg)
+    centerline = Centerline.from_index(cone_index)
+    last_index = None  # los índices de la línea anterior ya no valen
+
+
+# ============================
+#   Control principal
+# ============================
+
+def rollout(s: VehicleState, controls: np.ndarray):
+    """Posiciones (trayectorias, pasos // CHECK_EVERY) de cada secuencia de controles desde `s`."""
+    global rollouts
+    samples, horizon, _ = controls.shape
+    if rollouts is None or len(rollouts) != samples:
+        rollouts = Fleet(samples)
+    f = rollouts
+    f.x[:], f.y[:], f.yaw[:], f.speed[:] = s.x, s.y, s.yaw, s.speed
+    checks = horizon // CHECK_EVERY
+    xs = np.empty((samples, checks))
+    ys = np.empty((samples, checks))
+    for t in range(horizon):
+        f.throttle[:] = controls[:, t, 0]
+        f.steer[:] = controls[:, t, 1]
+        np.tan(f.steer * MAX_STEER_ANGLE, out=f.tan_steer)
+        f.step(DT)
+        if (t + 1) % CHECK_EVERY == 0:
+            xs[:, (t + 1) // CHECK_EVERY - 1] = f.x
+            ys[:, (t + 1) // CHECK_EVERY - 1] = f.y
+    return xs, ys
+
+
+def costs(s: VehicleState, xs: np.ndarray, ys: np.ndarray, controls: np.ndarray,
+          index: ConeIndex, line: Centerline, i: int) -> np.ndarray:
+    """Coste de cada trayectoria: distancia a la línea, conos cercanos, progreso y suavidad."""
+    reach = MAX_SPEED * controls.shape[1] * DT
+
+    # Tramo de la línea que se puede alcanzar en el horizonte, con su arco desde i
+    back = CHECK_EVERY * LINE_STRIDE
+    ahead = int(reach / line.spacing) + LINE_STRIDE
+    steps = np.arange(-back, ahead + 1, LINE_STRIDE)
+    wx, wy = line.xs[(i + steps) % len(line)], line.ys[(i + steps) % len(line)]
+    d2 = (xs[..., None] - wx) ** 2 + (ys[..., None] - wy) ** 2
+    nearest = d2.argmin(axis=2)
+    off_line = np.sqrt(np.take_along_axis(d2, nearest[..., None], axis=2)[..., 0])
+    track = (np.maximum(0.0, off_line - TRACK_BAND) ** 2).sum(axis=1)
+    progress = steps[nearest[:, -1]] * line.spacing
+
+    # Solo los conos al alcance del horizonte (rejilla)
+    near = index.query_radius(s.x, s.y, reach + CONE_CLEARANCE)
+    cone = np.zeros(len(xs))
+    if len(near):
+        dist = np.sqrt((xs[..., None] - index.xs[near]) ** 2 + (ys[..., None] - index.ys[near]) ** 2)
+        cone = (np.maximum(0.0, CONE_CLEARANCE - dist) ** 2).sum(axis=(1, 2))
+
+    steer_rate = (np.diff(controls[:, :, 1], axis=1) ** 2).sum(axis=1)
+    return W_TRACK * track + W_CONE * cone - W_PROGRESS * progress + W_STEER_RATE * steer_rate
+
+
+def compute_controls(s: VehicleState, index: ConeIndex, line: Centerline, hint: Optional[int]):
+    """Una iteración de MPPI. Devuelve (controles, índice proyectado, estadísticas)."""
+    global nominal
+    t0 = time.perf_counter()
+    i = line.project(s.x, s.y, hint)
+    samples, horizon = int(SAMPLES), int(HORIZON)
+    if nominal is None or len(nominal) != horizon:
+        nominal = np.zeros((horizon, 2))
+
+    # Perturbaciones alrededor de la solución anterior, correlacionadas en el
+    # tiempo (así hay giros sostenidos); la primera trayectoria es ella misma
+    noise = rng.normal(0.0, 1.0, (samples, horizon, 2))
+    for t in range(1, horizon):
+        noise[:, t] = NOISE_SMOOTHING * noise[:, t - 1] + math.sqrt(1 - NOISE_SMOOTHING ** 2) * noise[:, t]
+    noise *= (NOISE_THROTTLE, NOISE_STEER)
+    noise[0] = 0.0
+    controls = np.clip(nominal + noise, -1.0, 1.0)
+
+    xs, ys = rollout(s, controls)
+    cost = costs(s, xs, ys, controls, index, line, i)
+
+    # Media pesada de las secuencias
+    best = float(cost.min())
+    spread = max(float(np.median(cost)) - best, 1e-9)
+    weights = np.exp(-(cost - best) / (TEMPERATURE * spread))
+    weights /= weights.sum()
+    solution = np.tensordot(weights, controls, axes=1)
+
+    # Arranque en caliente: el siguiente tick parte de esta solución desplazada un paso
+    nominal = np.vstack([solution[1:], solution[-1:]])
+
+    stats = SolveStats(timestamp=s.timestamp, solve_time=time.perf_counter() - t0, samples=samples,
+                       best_cost=best, effective_samples=float(1.0 / (weights ** 2).sum()))
+    return Controls(throttle=float(solution[0, 0]), steer=float(solution[0, 1])), i, stats
+
+
+# Se calcula en cuanto llega cada estado nuevo
+@on_message("simulator.state")
+async def control_loop():
+    global last_index
+
+    if latest_state is None or centerline is None:
+        return  # Se espera a tener datos
+
+    controls, last_index, stats = compute_controls(latest_state, cone_index, centerline, last_index)
+    await publish("vehicle.controls", controls)
+    await publish("controller.solve", stats)
+
+
+# ============================
+#   Ejecución
+# ============================
+
+if __name__ == "__main__":
+
+    try:
+        asyncio.run(start())
+    except KeyboardInterrupt:
+        print("[LOG] Controlador detenido por el usuario.")
@@ -0,0 +1,84 @@
+from typing import Dict, Optional
+from starting_pack import subscribe, subscribe_snapshot, publish_many, on_message, start
+import asyncio
+import numpy as np
+from messages import VehicleState, Controls, ConeMap
+from cone_index import ConeIndex
+from centerline import Centerline
+import pure_pursuit
+
+# Un único proceso controla toda la flota del simulador (FLEET_SIZE > 0): en
+# lugar de un controller3.py por coche, recibe `simulator.<id>.state` de todos
+# con una sola suscripción con comodín, comparte un único mapa de conos y línea
+# central, y en cada paso calcula los controles de todos los coches a la vez
+# (la ley de controller3.py, vectorizada en pure_pursuit.py) y los publica en un lote.
+
+# ============================
+#   Variables globales
+# ============================
+
+states: Dict[int, VehicleState] = {}  # último estado de cada coche, por id
+cone_index: Optional[ConeIndex] = None  # compartidos por todos los coches,
+centerline: Optional[Centerline] = None  # se reconstruyen una vez por mapa de conos
+last_index: Dict[int, int] = {}  # proyección del tick anterior de cada coche sobre la línea
+CONTROL_TOPICS: Dict[int, str] = {}  # `vehicle.<id>.controls`, por id
+# La ley y sus constantes están en pure_pursuit.py, compartidas con controller3.py
+
+
+# ============================
+#   Suscripciones NATS
+# ============================
+
+# Un estado por coche; solo interesa el último de cada uno
+@subscribe("simulator.*.state", VehicleState, mode="latest")
+async def state_callback(msg: VehicleState, vehicle: str):
+
+    vehicle_id = int(vehicle)
+    if vehicle_id not in CONTROL_TOPICS:
+        CONTROL_TOPICS[vehicle_id] = f"vehicle.{vehicle_id}.controls"
+    states[vehicle_id] = msg
+
+
+@subscribe_snapshot("simulator.conemap", ConeMap)
+async def cones_callback(msg: ConeMap):
+
+    global cone_index, centerline
+    cone_index = ConeIndex.from_cones(msg)
+    centerline = Centerline.from_index(cone_index)
+    last_index.clear()  # los índices de la línea anterior ya no valen
+
+
+# ============================
+#   Control principal
+# ============================
+
+# El simulador publica el reloj después de los estados de todos los coches
+@on_message("simulator.clock")
+async def control_loop():
+
+    if not states or centerline is None:
+        return  # Se espera a tener datos
+
+    vehicles = list(states)
+    x = np.array([states[v].x for v in vehicles])
+    y = np.array([states[v].y for v in vehicles])
+    yaw = np.array([states[v].yaw for v in vehicles])
+    speed = np.array([states[v].speed for v in vehicles])
+    hints = np.array([last_index.get(v, -1) for v in vehicles])
+
+    throttle, steer, indices = pure_pursuit.compute_controls_many(x, y, yaw, speed, centerline, hints)
+    last_index.update(zip(vehicles, indices.tolist()))
+    await publish_many([(CONTROL_TOPICS[v], Controls(throttle=t, steer=s))
+                        for v, t, s in zip(vehicles, throttle.tolist(), steer.tolist())])
+
+
+# ============================
+#   Ejecución
+# ============================
+
+if __name__ == "__main__":
+
+    try:
+        asyncio.run(start())
+    except KeyboardInterrupt:
+        print("[LOG] Controlador de flota detenido por el usuario.")
@@ -0,0 +1,38 @@
+"""Ejecución headless: simulador + controlador en un solo proceso, sin NATS.
+
+Uso: `python headless.py [--controller controller2] [--duration 600]`
+
+Los nodos corren en lockstep sobre un reloj simulado (`starting_pack.run_lockstep`),
+así que la ejecución es determinista y tan rápida como permitan los callbacks.
+"""
+
+import argparse
+import asyncio
+import importlib
+import time
+import starting_pack
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--controller", default="controller", help="módulo del controlador")
+    parser.add_argument("--duration", type=float, default=600.0, help="segundos simulados")
+    args = parser.parse_args()
+
+    # El simulador se importa primero: en cada instante su paso se ejecuta antes
+    # que el tick del controlador
+    simulator = importlib.import_module("simulator")
+    importlib.import_module(args.controller)
+
+    t0 = time.perf_counter()
+    asyncio.run(starting_pack.run_lockstep(args.duration))
+    wall = time.perf_counter() - t0
+
+    s = simulator.fleet.state(0, starting_pack.now())
+    print(f"[LOG] {args.duration:.1f} s simulados en {wall:.2f} s reales "
+          f"({args.duration / wall:.0f}x tiempo real)")
+    print(f"[LOG] Estado final: x={s.x!r} y={s.y!r} yaw={s.yaw!r} speed={s.speed!r}")
+
+
+if __name__ == "__main__":
+    main()
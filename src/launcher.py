@@ -0,0 +1,184 @@
+"""Lanzador del sistema: servidor NATS y nodos en orden de dependencias, sin esperas fijas.
+
+Uso: `python launcher.py [--controller controller2] [--no-visualizer] [--nats-server CMD]`
+
+1. Si no hay servidor NATS en NATS_URL lo arranca (`nats-server` si está
+   instalado, si no `server/nats_server.sh`, o el comando de `--nats-server`)
+2. Arranca cada nodo en cuanto los nodos de los que depende han anunciado en
+   `node.<nombre>.ready` que tienen sus suscripciones activas (si el anuncio
+   se pierde, les pregunta en `node.<nombre>.ready.get` hasta que responden)
+3. Informa del tiempo hasta cada nodo listo y hasta el primer `Controls`
+
+Sigue vigilando los procesos: si uno termina, o con Ctrl+C, para todos.
+"""
+
+import argparse
+import asyncio
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from urllib.parse import urlparse
+from starting_pack import NodeReady, subscribe, subscribe_raw, on_start, start, query_ready
+import transports
+
+# Nodo -> nodos que tienen que estar listos antes de arrancarlo
+DEPENDENCIES = {
+    "simulator": [],
+    "controller": ["simulator"],
+    "visualizer": ["simulator"],
+}
+READY_TIMEOUT = 30.0  # s que puede tardar un nodo en estar listo
+READY_POLL_S = 0.2  # s entre preguntas a un nodo que aún no ha respondido
+NATS_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server", "nats_server.sh")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--controller", default="controller", help="módulo del controlador")
+    parser.add_argument("--no-visualizer", action="store_true", help="sin visualizador")
+    parser.add_argument("--nats-server", default=None,
+                        help="comando para arrancar NATS si no está ya en marcha")
+    args = parser.parse_args()
+
+    t0 = time.monotonic()
+    url = os.environ.get("NATS_URL") or "nats://127.0.0.1:4222"
+    os.environ["NATS_URL"] = url
+    # Todos los nodos siguen el reloj del simulador (SIM_SPEED=5 va a 5x)
+    os.environ.setdefault("STARTING_PACK_CLOCK", "simulator.clock")
+
+    scripts = {"simulator": "simulator", "controller": args.controller, "visualizer": "visualizer"}
+    if args.no_visualizer:
+        del scripts["visualizer"]
+    processes = {}  # nombre -> Popen
+    ready = {}  # nombre -> s desde el inicio
+    ready_changed = asyncio.Event()
+    first_controls = None
+    failure = None  # por qué no se pudo lanzar todo
+
+    def elapsed() -> float:
+        return time.monotonic() - t0
+
+    def log(text: str) -> None:
+        print(f"[LOG] {elapsed():6.2f} s  {text}")
+        sys.stdout.flush()
+
+    # ============================
+    #   Servidor NATS
+    # ============================
+
+    parsed = urlparse(url)
+    server = None
+    if parsed.scheme in ("nats", "tls", ""):
+        host, port = parsed.hostname or "127.0.0.1", parsed.port or 4222
+        try:
+            asyncio.run(transports.wait_for_server(host, port, 0.0))
+            log(f"NATS ya en marcha en {host}:{port}")
+        except ConnectionRefusedError:
+            if args.nats_server:
+                command = shlex.split(args.nats_server)
+            elif shutil.which("nats-server"):
+                command = ["nats-server", "-a", host, "-p", str(port)]
+            else:
+                command = ["bash", NATS_SCRIPT]
+            log(f"arrancando NATS: {' '.join(command)}")
+            server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # ============================
+    #   Nodos
+    # ============================
+
+    @subscribe("node.*.ready", NodeReady)
+    async def on_ready(msg: NodeReady, node: str):
+        # Un nodo se llama como su script; los controladores cuentan como "controller"
+        mark_ready(next((n for n, script in scripts.items() if script == node), node), msg.pid)
+
+    def mark_ready(name: str, pid: int) -> None:
+        if name in processes and name not in ready:
+            ready[name] = elapsed()
+            log(f"{name} listo (pid {pid})")
+            ready_changed.set()
+
+    async def ask_until_ready(name: str):
+        # El anuncio se envía una sola vez y puede perderse: se pregunta hasta que responda
+        while name not in ready and processes[name].poll() is None:
+            answer = await query_ready(scripts[name])
+            if answer is not None:
+                mark_ready(name, answer.pid)
+            else:
+                await asyncio.sleep(READY_POLL_S)
+
+    async def on_controls(topic: str, data: bytes, codec: str):
+        nonlocal first_controls
+        if first_controls is None:
+            first_controls = elapsed()
+            log(f"primer Controls en {topic}")
+
+    subscribe_raw("vehicle.controls")(on_controls)
+    subscribe_raw("vehicle.*.controls")(on_controls)
+
+    def spawn(name: str) -> None:
+        log(f"arrancando {name}")
+        processes[name] = subprocess.Popen([sys.executable, f"{scripts[name]}.py"], env=os.environ)
+        asyncio.get_running_loop().create_task(ask_until_ready(name))
+
+    @on_start
+    async def launch():
+        waiting = [name for name in DEPENDENCIES if name in scripts]
+        while waiting:
+            for name in [n for n in waiting if all(d in ready for d in DEPENDENCIES[n])]:
+                waiting.remove(name)
+                spawn(name)
+            if not waiting:
+                break
+            ready_changed.clear()
+            try:
+                await asyncio.wait_for(ready_changed.wait(), READY_TIMEOUT)
+            except asyncio.TimeoutError:
+                nonlocal failure
+                failure = f"ningún nodo listo en {READY_TIMEOUT:g} s, esperando a {', '.join(waiting)}"
+                return
+
+        while first_controls is None or len(ready) < len(processes):
+            await asyncio.sleep(0.05)
+        print("")
+        print(f"[LOG] Todo listo en {max(ready.values()):.2f} s, primer Controls a {first_controls:.2f} s")
+        for name, process in processes.items():
+            print(f"  {name:<11}: PID {process.pid}, listo a {ready[name]:.2f} s")
+        print("[LOG] Ctrl+C para detener todo.")
+        sys.stdout.flush()
+
+    async def supervise():
+        node = asyncio.create_task(start())
+        while not node.done():
+            gone = [name for name, process in processes.items() if process.poll() is not None]
+            if gone or failure:
+                log(failure or f"{', '.join(gone)} terminó, deteniendo el resto")
+                break
+            await asyncio.sleep(0.2)
+        if node.done():
+            node.result()  # errores de conexión o del lanzamiento
+        node.cancel()
+
+    try:
+        asyncio.run(supervise())
+    except KeyboardInterrupt:
+        print("[LOG] Detenido por el usuario.")
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # un segundo Ctrl+C no corta la parada
+        for process in list(processes.values()) + ([server] if server else []):
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in list(processes.values()) + ([server] if server else []):
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
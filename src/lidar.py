@@ -0,0 +1,137 @@
+"""Lidar simulado: un abanico de rayos desde la pose de cada coche contra los conos.
+
+Los conos son círculos de radio CONE_RADIUS. `Lidar.scan` lanza los rayos de
+toda la flota a la vez, sin bucles en Python:
+1. prefiltro espacial: solo los conos a max_range de cada coche
+   (`ConeIndex.query_radius_many` sobre la rejilla)
+2. cada cono solo puede cortar los rayos de su sector angular (su ángulo
+   visto desde el coche ± asin(R / distancia)), así que en lugar de la matriz
+   completa rayos x conos se generan únicamente esos pares (coche, cono, rayo)
+3. intersección rayo-círculo de todos los pares y mínimo por rayo
+
+Después se añade, si se pide, ruido gaussiano a las distancias y dropout (rayos
+sin retorno). El resultado va en un `LidarScan` con las distancias en uint16.
+"""
+
+import math
+from typing import Optional
+import numpy as np
+from cone_index import ConeIndex
+from collisions import CONE_RADIUS
+from messages import LidarScan
+
+# ============================
+#   Parámetros por defecto
+# ============================
+
+RAYS = 1000
+FOV = 2 * math.pi  # rad, abanico completo; menos de 2*pi -> centrado en el rumbo
+MAX_RANGE = 20.0  # m
+RESOLUTION = 0.01  # m por unidad en LidarScan.ranges (uint16: hasta 655 m)
+NO_RETURN = 0  # valor en LidarScan.ranges de un rayo sin retorno
+
+
+class Lidar:
+
+    """
+    Abanico de `rays` rayos en el marco del coche. Con `fov` de 2*pi cubre la
+    vuelta entera empezando por detrás (-pi); con menos, va de -fov/2 a fov/2.
+    `noise_std` (m) es el ruido gaussiano de cada retorno y `dropout` la
+    probabilidad de que un rayo no devuelva nada.
+    """
+
+    def __init__(self, rays: int = RAYS, fov: float = FOV, max_range: float = MAX_RANGE,
+                 noise_std: float = 0.0, dropout: float = 0.0, seed: Optional[int] = None):
+        if max_range / RESOLUTION >= np.iinfo(np.uint16).max:
+            raise ValueError(f"alcance {max_range} m demasiado grande para uint16 con {RESOLUTION} m")
+        self.rays = rays
+        self.full = fov >= 2 * math.pi - 1e-9
+        if self.full:
+            self.angle_min = -math.pi
+            self.angle_step = 2 * math.pi / rays
+        else:
+            self.angle_min = -fov / 2
+            self.angle_step = fov / max(1, rays - 1)
+        angles = self.angle_min + self.angle_step * np.arange(rays)
+        self.cos = np.cos(angles)
+        self.sin = np.sin(angles)
+        self.max_range = max_range
+        self.noise_std = noise_std
+        self.dropout = dropout
+        self.rng = np.random.default_rng(seed)
+
+    def scan(self, index: ConeIndex, x: np.ndarray, y: np.ndarray, yaw: np.ndarray) -> np.ndarray:
+        """Distancias (m) de cada rayo de cada coche, array (coches, rayos); inf sin retorno."""
+        x, y, yaw = np.atleast_1d(x), np.atleast_1d(y), np.atleast_1d(yaw)
+        ranges = np.full(len(x) * self.rays, np.inf)
+
+        # Conos al alcance, en el marco de su coche
+        car, cone = index.query_radius_many(x, y, self.max_range + CONE_RADIUS)
+        dx = index.xs[cone] - x[car]
+        dy = index.ys[cone] - y[car]
+        cos_yaw, sin_yaw = np.cos(yaw[car]), np.sin(yaw[car])
+        cx = cos_yaw * dx + sin_yaw * dy
+        cy = -sin_yaw * dx + cos_yaw * dy
+        dist = np.hypot(cx, cy)
+
+        # Sector angular de cada cono -> primer y último rayo que puede cortarlo
+        half = np.arcsin(np.minimum(1.0, CONE_RADIUS / np.maximum(dist, 1e-9)))
+        rel = np.arctan2(cy, cx) - self.angle_min
+        if self.full:
+            rel %= 2 * math.pi
+        first = np.ceil((rel - half) / self.angle_step).astype(np.intp)
+        last = np.floor((rel + half) / self.angle_step).astype(np.intp)
+        if not self.full:
+            first = np.maximum(first, 0)
+            last = np.minimum(last, self.rays - 1)
+        counts = np.maximum(last - first + 1, 0)
+
+        # Pares (cono, rayo): como en query_radius_many, un rango por cono
+        pair = np.repeat(np.arange(len(cone)), counts)
+        ray = np.repeat(first, counts) + np.arange(len(pair)) - np.repeat(np.cumsum(counts) - counts, counts)
+        if self.full:
+            ray %= self.rays
+
+        # Intersección rayo-círculo: distancia al punto más cercano del rayo al centro,
+        # menos la media cuerda. Si el coche está dentro del cono, 0
+        along = cx[pair] * self.cos[ray] + cy[pair] * self.sin[ray]
+        across2 = dist[pair] ** 2 - along ** 2
+        hit = (along > 0.0) & (across2 <= CONE_RADIUS ** 2)
+        t = np.maximum(0.0, along[hit] - np.sqrt(CONE_RADIUS ** 2 - across2[hit]))
+        np.minimum.at(ranges, car[pair[hit]] * self.rays + ray[hit], t)
+
+        ranges[ranges > self.max_range] = np.inf
+        if self.noise_std > 0.0:
+            ranges += self.rng.normal(0.0, self.noise_std, len(ranges))
+            np.maximum(ranges, 0.0, out=ranges)
+        if self.dropout > 0.0:
+            ranges[self.rng.random(len(ranges)) < self.dropout] = np.inf
+        return ranges.reshape(len(x), self.rays)
+
+    def message(self, ranges: np.ndarray, timestamp: float) -> LidarScan:
+        """LidarScan de las distancias de un coche (una fila de `scan`)."""
+        packed = np.rint(np.minimum(ranges, self.max_range) / RESOLUTION)
+        packed = np.maximum(packed, NO_RETURN + 1)  # 0 queda para "sin retorno"
+        packed[~np.isfinite(ranges)] = NO_RETURN
+        return LidarScan(timestamp=timestamp, angle_min=self.angle_min, angle_step=self.angle_step,
+                         resolution=RESOLUTION, ranges=packed.astype("<u2").tobytes())
+
+
+# ============================
+#   Lectura de LidarScan
+# ============================
+
+def scan_ranges(msg: LidarScan) -> np.ndarray:
+    """Distancias (m) de un LidarScan, NaN en los rayos sin retorno."""
+    raw = np.frombuffer(msg.ranges, dtype="<u2")
+    ranges = raw * msg.resolution
+    ranges[raw == NO_RETURN] = np.nan
+    return ranges
+
+
+def scan_points(msg: LidarScan):
+    """(x_rel, y_rel) de los retornos en el marco del coche, sin los rayos vacíos."""
+    ranges = scan_ranges(msg)
+    angles = msg.angle_min + msg.angle_step * np.arange(len(ranges))
+    ok = ~np.isnan(ranges)
+    return ranges[ok] * np.cos(angles[ok]), ranges[ok] * np.sin(angles[ok])
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from msgspec import Struct
 
 # Comandos de control del vehículo (producidos por el controlador)
@@ -39,3 +39,96 @@ class Cone(Struct):
 class Cones(Struct):
    
     cones: List[Cone]
+
+# Mapa de conos empaquetado: todas las coordenadas en un único buffer en lugar
+# de un objeto Cone por cono. Con cone_index.cone_xy se leen como un array de
+# NumPy que apunta al buffer, sin copiarlas
+class ConeMap(Struct):
+
+    """
+    - xy: pares x, y (m) seguidos, little-endian, del tipo `dtype`
+    - dtype: "<f8" (float64) o "<f4" (float32, la mitad de bytes)
+    - classes: clase o color de cada cono, un byte por cono (opcional)
+    """
+
+    xy: bytes
+    dtype: str = "<f8"
+    classes: Optional[bytes] = None
+
+# Conos que ve un coche en un instante (publicado por el simulador)
+class Perception(Struct):
+
+    """
+    - timestamp: instante de tiempo (s), el mismo que el VehicleState del paso
+    - cones: conos dentro del alcance y campo de visión del sensor, en el
+      marco del coche (x adelante, y izquierda)
+    """
+
+    timestamp: float
+    cones: List[Cone]
+
+# Velocidad del tiempo simulado (tiempo simulado por segundo real, 0 = pausa)
+class TimeScale(Struct):
+
+    scale: float
+
+# Un contacto o salida del circuito de un coche (publicado por el simulador)
+class TrackEvent(Struct):
+
+    """
+    - kind: "hit" (empieza a tocar un cono), "off_track" (sale del circuito)
+      u "on_track" (vuelve)
+    - vehicle: id del coche (0 sin flota)
+    - cone: índice del cono en el mapa, -1 si no es un hit
+    - timestamp: instante del paso (s)
+    - x, y: posición del coche (m)
+    """
+
+    kind: str
+    vehicle: int
+    cone: int
+    timestamp: float
+    x: float
+    y: float
+
+# Eventos de un paso de toda la flota, en un solo mensaje en `simulator.events`
+class TrackEvents(Struct):
+
+    timestamp: float
+    events: List[TrackEvent]
+
+# Barrido de un lidar simulado (publicado por el simulador): una distancia por
+# rayo en un buffer compacto. Con lidar.scan_ranges se lee como array de NumPy
+class LidarScan(Struct):
+
+    """
+    - timestamp: instante de tiempo (s), el mismo que el VehicleState del paso
+    - angle_min: ángulo del primer rayo respecto al rumbo del coche (rad)
+    - angle_step: separación entre rayos (rad), en sentido antihorario
+    - resolution: metros por unidad de `ranges`
+    - ranges: distancia de cada rayo, uint16 little-endian en unidades de
+      `resolution`; 0 = sin retorno (nada al alcance o dropout)
+    """
+
+    timestamp: float
+    angle_min: float
+    angle_step: float
+    resolution: float
+    ranges: bytes
+
+# Resultado de cada optimización de controller4.py (MPPI), en `controller.solve`
+class SolveStats(Struct):
+
+    """
+    - timestamp: instante del estado con el que se ha resuelto (s)
+    - solve_time: segundos reales que ha tardado la optimización
+    - samples: trayectorias simuladas
+    - best_cost: coste de la mejor trayectoria
+    - effective_samples: trayectorias que pesan de verdad en la media, 1 / sum(w²)
+    """
+
+    timestamp: float
+    solve_time: float
+    samples: int
+    best_cost: float
+    effective_samples: float
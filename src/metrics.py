@@ -0,0 +1,136 @@
+"""latency histograms used by starting_pack to instrument subscribe/publish.
+
+a `Histogram` is HDR-style: buckets are linear inside each power of two
+(2**SUB_BITS buckets per octave, ~1.5% resolution) so recording is a couple of
+integer operations and memory does not depend on how many values go in.
+Values are recorded in seconds and stored as integer nanoseconds.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+import msgspec
+from nats.aio.msg import Msg
+
+SUB_BITS = 6
+MAX_BITS = 40 # 2**40 ns is ~18 minutes, anything longer goes in the last bucket
+BUCKETS = (MAX_BITS - SUB_BITS + 1) << SUB_BITS
+
+def bucket_index(ns : int) -> int:
+    if ns < (2 << SUB_BITS):
+        return ns
+    shift = ns.bit_length() - SUB_BITS - 1
+    return min(BUCKETS - 1, ((shift + 1) << SUB_BITS) + (ns >> shift) - (1 << SUB_BITS))
+
+def bucket_value(index : int) -> int:
+    """lowest value (ns) that falls in bucket `index`"""
+    if index < (2 << SUB_BITS):
+        return index
+    shift = (index >> SUB_BITS) - 1
+    return ((index & ((1 << SUB_BITS) - 1)) + (1 << SUB_BITS)) << shift
+
+class HistogramSummary(msgspec.Struct):
+    # all in seconds
+    count : int
+    mean : float
+    p50 : float
+    p90 : float
+    p99 : float
+    max : float
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, seconds : float) -> None:
+        ns = int(seconds * 1e9)
+        if ns < 0:
+            ns = 0
+        # bucket_index inlined, this runs several times per message
+        if ns < (2 << SUB_BITS):
+            index = ns
+        else:
+            shift = ns.bit_length() - SUB_BITS - 1
+            index = ((shift + 1) << SUB_BITS) + (ns >> shift) - (1 << SUB_BITS)
+            if index >= BUCKETS:
+                index = BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, p : float) -> float:
+        """value (s) below which `p` percent of the recorded values fall"""
+        if not self.count:
+            return 0.0
+        target = max(1, round(self.count * p / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(bucket_value(index), self.max_ns) / 1e9
+        return self.max_ns / 1e9
+
+    def summary(self) -> HistogramSummary:
+        return HistogramSummary(
+            count = self.count,
+            mean = self.total_ns / self.count / 1e9 if self.count else 0.0,
+            p50 = self.percentile(50),
+            p90 = self.percentile(90),
+            p99 = self.percentile(99),
+            max = self.max_ns / 1e9,
+        )
+
+"""
+per topic we keep:
+- queue: time the message waited in the nats client before its callback ran
+- decode, handler: time spent decoding it and in the @subscribe callback
+- age: now() minus the message's `timestamp` field, when it has one
+- encode, publish: time encoding and handing it to nats in `publish`
+"""
+KINDS = ("queue", "decode", "handler", "age", "encode", "publish")
+
+class TimerStats(msgspec.Struct):
+    interval_s : float
+    ticks : int = 0
+    overruns : int = 0 # ticks that finished after the next deadline
+    missed : int = 0 # ticks never run (skip) or merged into another one (coalesce)
+    jitter_sum : float = 0.0 # seconds between deadline and actual start
+    jitter_max : float = 0.0
+    duration_sum : float = 0.0 # seconds spent in the callback
+    duration_max : float = 0.0
+
+    def record(self, jitter : float, duration : float) -> None:
+        self.ticks += 1
+        self.jitter_sum += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+        self.duration_sum += duration
+        self.duration_max = max(self.duration_max, duration)
+
+class NodeMetrics(msgspec.Struct):
+    node : str
+    timestamp : float
+    topics : dict[str,dict[str,HistogramSummary]] # topic -> kind -> summary
+    timers : dict[str,TimerStats] # @timer callback name -> its stats since start
+    dropped : dict[str,int] = {} # topic -> messages skipped since start (see subscribe mode="latest")
+
+class TopicMetrics:
+    def __init__(self) -> None:
+        for kind in KINDS:
+            setattr(self, kind, Histogram())
+
+    def summaries(self) -> dict[str,HistogramSummary]:
+        return {kind: getattr(self, kind).summary() for kind in KINDS if getattr(self, kind).count}
+
+@dataclass
+class TimedMsg(Msg):
+    """nats message stamped (perf_counter) when the client builds it, to measure queue delay"""
+    received_at : float = field(default_factory=time.perf_counter)
+
+def message_age(msg : msgspec.Struct, now : float) -> Optional[float]:
+    timestamp = getattr(msg, "timestamp", None)
+    return now - timestamp if isinstance(timestamp, float) else None
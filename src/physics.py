@@ -0,0 +1,142 @@
+import math
+import numpy as np
+from messages import VehicleState, Controls
+
+# ============================
+#   Parámetros del vehículo
+# ============================
+
+MAX_ACCEL = 3.0
+MAX_BRAKE = 6.0
+MAX_SPEED = 10.0
+MAX_STEER_ANGLE = math.radians(30)
+WHEEL_BASE = 2.5
+
+# Pose inicial (la misma que usaba el simulador con un solo coche)
+START_X = 18.0
+START_Y = 0.0
+START_YAW = math.pi
+
+# Integradores de `Fleet.advance`:
+# - semi-implicit: Euler semi-implícito, el paso original del simulador
+#   (velocidad, luego rumbo con la velocidad nueva, luego posición con el rumbo nuevo)
+# - rk4: Runge-Kutta de orden 4 sobre (x, y, yaw, speed) con los controles constantes en el paso
+INTEGRATORS = ("semi-implicit", "rk4")
+
+
+class Fleet:
+
+    """
+    Estado de N vehículos en formato structure-of-arrays: un array de NumPy
+    por variable (x, y, yaw, speed) y por control (throttle, steer).
+
+    `step` integra el modelo de bicicleta cinemático de todos los coches a la
+    vez. Con un solo coche usa el paso escalar del simulador original (con
+    `math`), así que reproduce bit a bit las ejecuciones anteriores; con
+    varios, np.cos/np.sin pueden diferir de `math` en el último bit.
+    `advance` divide un periodo en subpasos fijos con el integrador elegido.
+    """
+
+    def __init__(self, n: int, x: float = START_X, y: float = START_Y,
+                 yaw: float = START_YAW, speed: float = 0.0):
+        self.n = n
+        self.x = np.full(n, x, dtype=np.float64)
+        self.y = np.full(n, y, dtype=np.float64)
+        self.yaw = np.full(n, yaw, dtype=np.float64)
+        self.speed = np.full(n, speed, dtype=np.float64)
+        # Controles ya saturados a [-1, 1]
+        self.throttle = np.zeros(n, dtype=np.float64)
+        self.steer = np.zeros(n, dtype=np.float64)
+        # tan(ángulo de dirección), calculado al recibir controles con math.tan:
+        # np.tan puede diferir en el último bit y queremos el mismo resultado que el escalar
+        self.tan_steer = np.zeros(n, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def set_controls(self, i: int, msg: Controls) -> None:
+        throttle = max(-1.0, min(1.0, msg.throttle))
+        steer = max(-1.0, min(1.0, msg.steer))
+        self.throttle[i] = throttle
+        self.steer[i] = steer
+        self.tan_steer[i] = math.tan(steer * MAX_STEER_ANGLE)
+
+    def advance(self, dt: float, substeps: int = 1, method: str = "semi-implicit") -> None:
+        """Avanza `dt` segundos en `substeps` pasos iguales con el integrador `method`."""
+        if method not in INTEGRATORS:
+            raise ValueError(f"integrador desconocido {method}, usa uno de: {', '.join(INTEGRATORS)}")
+        step = self.step if method == "semi-implicit" else self.step_rk4
+        h = dt / substeps
+        for _ in range(substeps):
+            step(h)
+
+    def step(self, dt: float) -> None:
+        """Avanza `dt` segundos todos los vehículos (Euler semi-implícito)."""
+        if self.n == 1:
+            self.step_one(dt)
+            return
+        accel = self.throttle * np.where(self.throttle >= 0, MAX_ACCEL, MAX_BRAKE)
+
+        # Actualizar velocidad
+        self.speed += accel * dt
+        np.maximum(np.minimum(self.speed, MAX_SPEED, out=self.speed), 0.0, out=self.speed)
+
+        # Calcular cambio de orientación (yaw rate): speed / R, con R = L / tan(delta)
+        turning = (np.abs(self.steer * MAX_STEER_ANGLE) > 1e-3) & (self.speed > 0.01)
+        radius = np.divide(WHEEL_BASE, self.tan_steer, out=np.ones(self.n), where=turning)
+        yaw_rate = np.divide(self.speed, radius, out=np.zeros(self.n), where=turning)
+
+        # Integrar estado
+        self.yaw += yaw_rate * dt
+        self.x += self.speed * np.cos(self.yaw) * dt
+        self.y += self.speed * np.sin(self.yaw) * dt
+
+    def step_one(self, dt: float) -> None:
+        """`step` con un solo coche, en escalar y con `math` como el simulador original."""
+        throttle, steer = float(self.throttle[0]), float(self.steer[0])
+        accel = throttle * (MAX_ACCEL if throttle >= 0 else MAX_BRAKE)
+
+        # Actualizar velocidad
+        speed = max(0.0, min(MAX_SPEED, float(self.speed[0]) + accel * dt))
+
+        # Calcular cambio de orientación (yaw rate)
+        yaw_rate = 0.0
+        if abs(steer * MAX_STEER_ANGLE) > 1e-3 and speed > 0.01:
+            yaw_rate = speed / (WHEEL_BASE / float(self.tan_steer[0]))
+
+        # Integrar estado
+        yaw = float(self.yaw[0]) + yaw_rate * dt
+        self.speed[0] = speed
+        self.yaw[0] = yaw
+        self.x[0] += speed * math.cos(yaw) * dt
+        self.y[0] += speed * math.sin(yaw) * dt
+
+    def step_rk4(self, dt: float) -> None:
+        """Avanza `dt` segundos todos los vehículos con Runge-Kutta 4."""
+        accel = self.throttle * np.where(self.throttle >= 0, MAX_ACCEL, MAX_BRAKE)
+        # Curvatura de la trayectoria (1/R); la derivada solo depende de yaw y speed
+        turning = np.abs(self.steer * MAX_STEER_ANGLE) > 1e-3
+        curvature = np.where(turning, self.tan_steer / WHEEL_BASE, 0.0)
+
+        def derivatives(yaw, speed):
+            # Saturación: ni acelerar por encima de MAX_SPEED ni frenar por debajo de 0
+            saturated = ((speed >= MAX_SPEED) & (accel > 0)) | ((speed <= 0.0) & (accel < 0))
+            return (speed * np.cos(yaw), speed * np.sin(yaw), speed * curvature,
+                    np.where(saturated, 0.0, accel))
+
+        yaw, speed = self.yaw, self.speed
+        dx1, dy1, dw1, dv1 = derivatives(yaw, speed)
+        dx2, dy2, dw2, dv2 = derivatives(yaw + dw1 * (dt / 2), speed + dv1 * (dt / 2))
+        dx3, dy3, dw3, dv3 = derivatives(yaw + dw2 * (dt / 2), speed + dv2 * (dt / 2))
+        dx4, dy4, dw4, dv4 = derivatives(yaw + dw3 * dt, speed + dv3 * dt)
+
+        w = dt / 6
+        self.x += (dx1 + 2 * (dx2 + dx3) + dx4) * w
+        self.y += (dy1 + 2 * (dy2 + dy3) + dy4) * w
+        self.yaw += (dw1 + 2 * (dw2 + dw3) + dw4) * w
+        self.speed += (dv1 + 2 * (dv2 + dv3) + dv4) * w
+        np.maximum(np.minimum(self.speed, MAX_SPEED, out=self.speed), 0.0, out=self.speed)
+
+    def state(self, i: int, timestamp: float) -> VehicleState:
+        return VehicleState(x=float(self.x[i]), y=float(self.y[i]), yaw=float(self.yaw[i]),
+                            speed=float(self.speed[i]), timestamp=timestamp)
@@ -0,0 +1,95 @@
+"""Pure pursuit sobre la línea central, para un coche o para toda la flota a la vez.
+
+La usan controller3.py (un coche por proceso) y fleet_controller.py (toda la
+flota en un proceso), con las mismas constantes de este módulo: ajustarlas
+aquí, o con sweep.py sobre cualquiera de los dos, cambia ambos.
+"""
+
+import math
+from typing import Optional
+import numpy as np
+from messages import VehicleState, Controls
+from centerline import Centerline
+from physics import WHEEL_BASE, MAX_STEER_ANGLE
+
+# ============================
+#   Parámetros
+# ============================
+
+TARGET_SPEED = 8.0  # m/s
+K_SPEED = 0.6  # ganancia de velocidad
+LOOKAHEAD_MIN = 2.5  # m, distancia mínima al punto objetivo
+LOOKAHEAD_GAIN = 0.6  # s, la distancia de look-ahead crece con la velocidad
+MAX_LATERAL_ACCEL = 4.0  # m/s², limita la velocidad en las curvas
+BRAKE_HORIZON = 2.0  # s de línea por delante que se miran para frenar antes de una curva
+
+
+# ============================
+#   Un coche
+# ============================
+
+def compute_controls(s: VehicleState, line: Centerline, hint: Optional[int]):
+    """Pure pursuit sobre la línea central. Devuelve (controles, índice proyectado)."""
+
+    # Proyección del coche: búsqueda en una ventana alrededor del tick anterior
+    i = line.project(s.x, s.y, hint)
+
+    # Punto objetivo a una distancia que crece con la velocidad
+    lookahead = LOOKAHEAD_MIN + LOOKAHEAD_GAIN * max(s.speed, 0.0)
+    j = line.advance(i, lookahead)
+    dx = float(line.xs[j]) - s.x
+    dy = float(line.ys[j]) - s.y
+
+    # Objetivo en el marco del coche y arco que pasa por él
+    cos_yaw, sin_yaw = math.cos(s.yaw), math.sin(s.yaw)
+    x_rel = cos_yaw * dx + sin_yaw * dy
+    y_rel = -sin_yaw * dx + cos_yaw * dy
+    curvature = 2.0 * y_rel / max(x_rel * x_rel + y_rel * y_rel, 1e-6)
+    steer_angle = math.atan(WHEEL_BASE * curvature)
+    steer_cmd = max(-1.0, min(1.0, steer_angle / MAX_STEER_ANGLE))
+
+    # Velocidad limitada por la curva más cerrada del tramo siguiente
+    k = line.advance(i, max(lookahead, BRAKE_HORIZON * max(s.speed, 0.0)))
+    k_max = line.max_curvature(i, k)
+    speed_ref = TARGET_SPEED
+    if k_max > 1e-6:
+        speed_ref = min(speed_ref, math.sqrt(MAX_LATERAL_ACCEL / k_max))
+    throttle_cmd = K_SPEED * (speed_ref - s.speed)
+
+    return Controls(throttle=throttle_cmd, steer=steer_cmd), i
+
+
+# ============================
+#   Toda la flota
+# ============================
+
+def compute_controls_many(x: np.ndarray, y: np.ndarray, yaw: np.ndarray, speed: np.ndarray,
+                          line: Centerline, hints: np.ndarray):
+    """`compute_controls` de todos los coches (arrays por coche). Devuelve (throttle, steer, índices proyectados)."""
+
+    # Proyección de cada coche cerca de la del tick anterior (hint < 0: sin ella)
+    i = line.project_many(x, y, hints)
+
+    # Punto objetivo a una distancia que crece con la velocidad
+    forward = np.maximum(speed, 0.0)
+    lookahead = LOOKAHEAD_MIN + LOOKAHEAD_GAIN * forward
+    j = line.advance_many(i, lookahead)
+    dx = line.xs[j] - x
+    dy = line.ys[j] - y
+
+    # Objetivo en el marco de cada coche y arco que pasa por él
+    cos_yaw, sin_yaw = np.cos(yaw), np.sin(yaw)
+    x_rel = cos_yaw * dx + sin_yaw * dy
+    y_rel = -sin_yaw * dx + cos_yaw * dy
+    curvature = 2.0 * y_rel / np.maximum(x_rel * x_rel + y_rel * y_rel, 1e-6)
+    steer_cmd = np.clip(np.arctan(WHEEL_BASE * curvature) / MAX_STEER_ANGLE, -1.0, 1.0)
+
+    # Velocidad limitada por la curva más cerrada del tramo siguiente
+    k = line.advance_many(i, np.maximum(lookahead, BRAKE_HORIZON * forward))
+    k_max = line.max_curvature_many(i, k)
+    speed_ref = np.full(len(x), TARGET_SPEED)
+    curved = k_max > 1e-6
+    speed_ref[curved] = np.minimum(TARGET_SPEED, np.sqrt(MAX_LATERAL_ACCEL / k_max[curved]))
+    throttle_cmd = K_SPEED * (speed_ref - speed)
+
+    return throttle_cmd, steer_cmd, i
@@ -0,0 +1,79 @@
+"""Nodo grabador: guarda en disco los mensajes de varios topics, sin decodificar.
+
+Uso: `python recorder.py [--out DIR] [topic ...]`
+
+Cada mensaje se añade con su topic, codec y timestamp de recepción a los
+segmentos de `DIR` (ver recording.py). De los topics de snapshot (como
+`simulator.cones`) solo se publica `<topic>.version`: el grabador pide el
+snapshot en `<topic>.get` al arrancar y con cada versión nueva, y lo graba
+antes que la versión, así la grabación tiene el mapa aunque se empiece tarde.
+Se reproduce con `replay.py`.
+"""
+
+import argparse
+import asyncio
+import nats
+from starting_pack import SnapshotInfo, subscribe_raw, on_start, timer, start, now, decode, \
+    nats_connection, CODEC_HEADER
+from recording import RecordingWriter
+
+TOPICS = ["simulator.state", "simulator.*.state", "vehicle.controls", "vehicle.*.controls"]
+SNAPSHOT_TOPICS = ["simulator.cones", "simulator.conemap"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("topics", nargs="*", default=TOPICS,
+                        help="topics a grabar (se admiten comodines de NATS)")
+    parser.add_argument("--snapshot", nargs="*", default=SNAPSHOT_TOPICS,
+                        help="topics publicados con publish_snapshot")
+    parser.add_argument("--out", default="recording", help="directorio de la grabación")
+    args = parser.parse_args()
+
+    writer = RecordingWriter(args.out)
+
+    async def record(topic: str, data: bytes, codec: str):
+        writer.append(now(), topic, codec, data)
+
+    for topic in args.topics:
+        subscribe_raw(topic)(record)
+    # De los snapshots se guarda aparte el mensaje y cada cambio de versión
+    digests = {}
+
+    async def fetch_current(topic: str):
+        try:
+            reply = await nats_connection().request(f"{topic}.get", b"", timeout=2.0)
+        except (nats.errors.TimeoutError, nats.errors.NoRespondersError):
+            return
+        codec = reply.headers.get(CODEC_HEADER, "json") if reply.headers else "json"
+        writer.append(now(), topic, codec, reply.data, snapshot=True)
+
+    async def record_version(version_topic: str, data: bytes, codec: str):
+        topic = version_topic[:-len(".version")]
+        digest = decode(data, SnapshotInfo, codec).digest
+        changed = digests.get(topic) != digest
+        digests[topic] = digest
+        if changed:
+            # El mensaje antes que su versión: al reproducir, quien la reciba ya lo puede pedir
+            await fetch_current(topic)
+        writer.append(now(), version_topic, codec, data, snapshot=changed)
+
+    for topic in args.snapshot:
+        subscribe_raw(f"{topic}.version")(record_version)
+        on_start(lambda topic=topic: fetch_current(topic))
+
+    @timer(1.0)
+    async def flush():
+        writer.flush()
+        print(f"[LOG] {writer.records} mensajes grabados en {args.out}")
+
+    try:
+        asyncio.run(start())
+    except KeyboardInterrupt:
+        print("[LOG] Grabación terminada por el usuario.")
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
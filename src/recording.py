@@ -0,0 +1,199 @@
+"""Formato de las grabaciones de `recorder.py` y lectura para `replay.py`.
+
+Una grabación es un directorio con segmentos numerados:
+
+- `NNNNNN.seg`: registros uno detrás de otro, solo se añade al final. Cada
+  registro es una cabecera `RECORD_HEADER` (timestamp de recepción, longitud
+  del topic, codec, longitud del payload), el topic en utf-8 y el payload tal
+  y como llegó por NATS (sin decodificar).
+- `NNNNNN.idx`: índice disperso del segmento, entradas `INDEX_DTYPE`
+  (timestamp, offset del registro) como mucho una cada `INDEX_INTERVAL_S`.
+- `snapshots.seg`: copia de los registros de snapshot (el mensaje completo y
+  su `<topic>.version` cuando cambia), que son pocos. Al saltar a un instante
+  sirve para saber qué snapshot estaba vigente sin leer lo anterior.
+
+Los timestamps no decrecen dentro de una grabación, así que para buscar un
+instante basta una búsqueda binaria entre segmentos y otra en su índice, y
+luego recorrer como mucho `INDEX_INTERVAL_S` de registros.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+from typing import Iterator, List, NamedTuple, Optional
+import numpy as np
+from starting_pack import CODECS
+
+# ============================
+#   Formato
+# ============================
+
+RECORD_HEADER = struct.Struct("<dHBI")  # timestamp, len(topic), codec, len(payload)
+INDEX_DTYPE = np.dtype([("t", "<f8"), ("offset", "<u8")])
+INDEX_INTERVAL_S = 0.5  # s entre entradas del índice
+SEGMENT_BYTES = 64 << 20  # al pasar de este tamaño se empieza un segmento nuevo
+SNAPSHOTS_FILE = "snapshots.seg"
+
+
+class Record(NamedTuple):
+    t: float
+    topic: str
+    codec: str
+    data: bytes
+
+
+def pack_record(t: float, topic: str, codec: str, data: bytes) -> bytes:
+    topic_bytes = topic.encode()
+    return RECORD_HEADER.pack(t, len(topic_bytes), CODECS.index(codec), len(data)) + topic_bytes + data
+
+
+def segment_paths(directory: str, number: int):
+    base = os.path.join(directory, f"{number:06d}")
+    return base + ".seg", base + ".idx"
+
+
+def segment_numbers(directory: str) -> List[int]:
+    return sorted(int(name[:-4]) for name in os.listdir(directory)
+                  if name.endswith(".seg") and name[:-4].isdigit())
+
+
+# ============================
+#   Escritura
+# ============================
+
+class RecordingWriter:
+
+    """Añade registros al último segmento de `directory` (lo crea si no existe)."""
+
+    def __init__(self, directory: str, segment_bytes: int = SEGMENT_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        existing = segment_numbers(directory)
+        # Seguir a continuación de una grabación anterior, siempre en un segmento nuevo
+        self.number = existing[-1] + 1 if existing else 0
+        self.last_t = -float("inf")
+        self.records = 0
+        self.snapshots = open(os.path.join(directory, SNAPSHOTS_FILE), "ab")
+        self._open()
+
+    def _open(self):
+        seg_path, idx_path = segment_paths(self.directory, self.number)
+        self.seg = open(seg_path, "ab")
+        self.idx = open(idx_path, "ab")
+        self.offset = 0
+        self.last_indexed = -float("inf")
+
+    def append(self, t: float, topic: str, codec: str, data: bytes, snapshot: bool = False) -> None:
+        """Añade un registro; con `snapshot` también a `snapshots.seg`."""
+        # El reloj de pared puede ir hacia atrás: la búsqueda necesita tiempos ordenados
+        t = max(t, self.last_t)
+        self.last_t = t
+        if self.offset >= self.segment_bytes:
+            self.seg.close()
+            self.idx.close()
+            self.number += 1
+            self._open()
+        if t - self.last_indexed >= INDEX_INTERVAL_S:
+            self.idx.write(struct.pack("<dQ", t, self.offset))
+            self.last_indexed = t
+
+        record = pack_record(t, topic, codec, data)
+        self.seg.write(record)
+        if snapshot:
+            self.snapshots.write(record)
+        self.offset += len(record)
+        self.records += 1
+
+    def flush(self) -> None:
+        self.seg.flush()
+        self.idx.flush()
+        self.snapshots.flush()
+
+    def close(self) -> None:
+        self.seg.close()
+        self.idx.close()
+        self.snapshots.close()
+
+
+# ============================
+#   Lectura
+# ============================
+
+def map_file(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment:
+
+    def __init__(self, seg_path: str, idx_path: Optional[str] = None):
+        self.data = map_file(seg_path) if os.path.exists(seg_path) else None
+        self.index_map = map_file(idx_path) if idx_path and os.path.exists(idx_path) else None
+        # Solo entradas completas (el grabador puede estar escribiendo la última)
+        if self.index_map is not None:
+            n = len(self.index_map) // INDEX_DTYPE.itemsize
+            self.index = np.frombuffer(self.index_map, dtype=INDEX_DTYPE, count=n)
+        else:
+            self.index = np.empty(0, dtype=INDEX_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.data) if self.data is not None else 0
+
+    def seek(self, t: float) -> int:
+        """Offset del último registro indexado con timestamp <= t (0 si no hay)."""
+        i = int(np.searchsorted(self.index["t"], t, side="right")) - 1
+        return int(self.index["offset"][i]) if i >= 0 else 0
+
+    def records(self, offset: int = 0) -> Iterator[Record]:
+        data = self.data
+        end = len(self)
+        while offset + RECORD_HEADER.size <= end:
+            t, topic_len, codec, data_len = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            stop = start + topic_len + data_len
+            if stop > end:
+                return  # registro a medio escribir
+            topic = data[start:start + topic_len].decode()
+            yield Record(t, topic, CODECS[codec], data[start + topic_len:stop])
+            offset = stop
+
+
+class Recording:
+
+    """Grabación abierta para lectura, con los segmentos mapeados en memoria."""
+
+    def __init__(self, directory: str):
+        self.segments: List[Segment] = []
+        for number in segment_numbers(directory):
+            segment = Segment(*segment_paths(directory, number))
+            if len(segment) and len(segment.index):
+                self.segments.append(segment)
+        # Primer timestamp de cada segmento (su primera entrada del índice)
+        self.starts = [float(segment.index["t"][0]) for segment in self.segments]
+        self.snapshots = list(Segment(os.path.join(directory, SNAPSHOTS_FILE)).records())
+        self.snapshot_times = [record.t for record in self.snapshots]
+
+    @property
+    def start(self) -> float:
+        return self.starts[0] if self.starts else 0.0
+
+    def read(self, t: float = -float("inf")) -> Iterator[Record]:
+        """Registros con timestamp >= t, en orden."""
+        first = max(0, bisect.bisect_right(self.starts, t) - 1)
+        for k in range(first, len(self.segments)):
+            segment = self.segments[k]
+            offset = segment.seek(t) if k == first else 0
+            for record in segment.records(offset):
+                if record.t >= t:
+                    yield record
+
+    def snapshots_at(self, t: float) -> List[Record]:
+        """Último registro de snapshot de cada topic con timestamp < t."""
+        latest = {}
+        for record in self.snapshots[:bisect.bisect_left(self.snapshot_times, t)]:
+            latest[record.topic] = record
+        return list(latest.values())
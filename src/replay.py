@@ -0,0 +1,131 @@
+"""Reproduce por NATS una grabación de `recorder.py`.
+
+Uso: `python replay.py DIR [--speed X] [--start S] [--end S] [--topics T ...]`
+
+Los segmentos se leen mapeados en memoria y `--start` salta a ese instante
+(segundos desde el inicio de la grabación) con búsqueda binaria, sin leer lo
+anterior. Los payloads se vuelven a publicar tal cual, con su codec, respetando
+los tiempos originales a `--speed` veces la velocidad real (0 = tan rápido
+como se pueda). De los topics de snapshot se publica la versión y el mensaje
+se sirve en `<topic>.get`, así los nodos que usan `@subscribe_snapshot` reciben
+el mapa como con el simulador, también al empezar a mitad de la grabación. Al terminar se siguen
+sirviendo `--hold` segundos para los nodos que aún no lo hayan pedido.
+"""
+
+import argparse
+import asyncio
+import time
+from starting_pack import SnapshotInfo, on_start, start, send, publish, decode, nats_connection, \
+    CODEC_HEADER
+from recording import Recording
+
+SNAPSHOT_TOPICS = ["simulator.cones", "simulator.conemap"]
+
+
+class SnapshotServer:
+
+    """Último payload de un topic de snapshot y su versión, para responder en `<topic>.get`."""
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.data = None
+        self.codec = "json"
+        self.info = SnapshotInfo(version=0, digest="")
+
+    async def reply(self, request):
+        if self.data is None:
+            return
+        await nats_connection().publish(request.reply, self.data, headers={
+            CODEC_HEADER: self.codec,
+            "version": str(self.info.version),
+            "digest": self.info.digest,
+        })
+
+
+async def replay(recording: Recording, speed: float, start_s: float, end_s: float,
+                 topics, snapshot_topics) -> int:
+    servers = {topic: SnapshotServer(topic) for topic in snapshot_topics}
+    versions = {f"{topic}.version": server for topic, server in servers.items()}
+    for topic, server in servers.items():
+        await nats_connection().subscribe(f"{topic}.get", cb=server.reply)
+
+    t0 = recording.start + start_s
+    # Snapshots vigentes en t0: se anuncia su versión para que se pidan ya
+    for record in recording.snapshots_at(t0):
+        if record.topic in servers:
+            server = servers[record.topic]
+            server.data, server.codec = record.data, record.codec
+        elif record.topic in versions:
+            versions[record.topic].info = decode(record.data, SnapshotInfo, record.codec)
+    for topic, server in versions.items():
+        if server.data is not None:
+            await publish(topic, server.info)
+    t_end = recording.start + end_s
+    wall0 = time.monotonic()
+    sent = 0
+    for record in recording.read(t0):
+        if record.t > t_end:
+            break
+        if topics and record.topic not in topics and record.topic not in servers \
+                and record.topic not in versions:
+            continue
+        if speed > 0:
+            delay = wall0 + (record.t - t0) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif sent % 1000 == 0:
+            await asyncio.sleep(0)  # dejar que el cliente de NATS vacíe su buffer
+
+        if record.topic in servers:
+            # El mensaje de un snapshot no se publica: se sirve en `<topic>.get`
+            # a quien lo pida al recibir la versión, que viene después
+            server = servers[record.topic]
+            server.data, server.codec = record.data, record.codec
+            continue
+        elif record.topic in versions:
+            versions[record.topic].info = decode(record.data, SnapshotInfo, record.codec)
+        await send(record.topic, record.data, record.codec)
+        sent += 1
+    await nats_connection().flush()
+    return sent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", help="directorio de la grabación")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="factor de velocidad (1 = tiempo real, 0 = lo más rápido posible)")
+    parser.add_argument("--start", type=float, default=0.0, help="segundos desde el inicio")
+    parser.add_argument("--end", type=float, default=float("inf"), help="segundos desde el inicio")
+    parser.add_argument("--topics", nargs="*", default=[], help="solo estos topics (por defecto todos)")
+    parser.add_argument("--snapshot", nargs="*", default=SNAPSHOT_TOPICS,
+                        help="topics publicados con publish_snapshot")
+    parser.add_argument("--hold", type=float, default=2.0,
+                        help="segundos sirviendo snapshots tras terminar")
+    args = parser.parse_args()
+
+    recording = Recording(args.directory)
+    done = asyncio.Event()
+
+    @on_start
+    async def run():
+        started = time.monotonic()
+        sent = await replay(recording, args.speed, args.start, args.end,
+                            set(args.topics), args.snapshot)
+        print(f"[LOG] {sent} mensajes reproducidos en {time.monotonic() - started:.2f} s")
+        await asyncio.sleep(args.hold)
+        done.set()
+
+    async def run_until_done():
+        node = asyncio.create_task(start())
+        await done.wait()
+        node.cancel()
+
+    try:
+        asyncio.run(run_until_done())
+    except KeyboardInterrupt:
+        print("[LOG] Reproducción terminada por el usuario.")
+
+
+if __name__ == "__main__":
+    main()
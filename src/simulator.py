@@ -1,27 +1,50 @@
 import math
+import os
 import time
 from typing import List
 import msgspec
 from msgspec import Struct
-from starting_pack import subscribe, publish, timer, start
+from starting_pack import subscribe, publish, publish_many, publish_snapshot, timer, start, now, \
+    use_clock, set_time_scale, Clock
 import asyncio
-from messages import VehicleState, Controls, Cone, Cones
+from messages import VehicleState, Controls, Cone, Cones, TimeScale, Perception, TrackEvents
+from cone_index import ConeIndex, pack_cones
+from collisions import TrackMonitor
+from lidar import Lidar
+from physics import Fleet, INTEGRATORS
 
 # ============================
 #   Parámetros simulador
 # ============================
 
-PUBLISH_RATE = 20.0  # Hz
+PUBLISH_RATE = float(os.environ.get("PUBLISH_RATE") or 20.0)  # Hz
 DT = 1.0 / PUBLISH_RATE
-MAX_ACCEL = 3.0
-MAX_BRAKE = 6.0
-MAX_SPEED = 10.0
-MAX_STEER_ANGLE = math.radians(30)
-WHEEL_BASE = 2.5
 
-# Estado inicial del coche
-state = VehicleState(x=18.0, y=0.0, yaw=math.pi, speed=0.0, timestamp=time.time())
-current_controls = Controls()
+# Paso interno de la física, independiente de la frecuencia de publicación:
+# cada publicación integra round(DT / PHYSICS_DT) subpasos iguales con el
+# integrador INTEGRATOR ("semi-implicit" o "rk4", ver physics.py). Por defecto
+# un subpaso semi-implícito por publicación, como siempre
+PHYSICS_DT = float(os.environ.get("PHYSICS_DT") or DT)
+INTEGRATOR = os.environ.get("INTEGRATOR") or "semi-implicit"
+SUBSTEPS = max(1, round(DT / PHYSICS_DT))
+if INTEGRATOR not in INTEGRATORS:
+    raise SystemExit(f"INTEGRATOR={INTEGRATOR} no existe, usa uno de: {', '.join(INTEGRATORS)}")
+
+# Velocidad del tiempo simulado respecto al real (SIM_SPEED=5 -> 5x). El
+# simulador marca el tiempo: lo publica en `simulator.clock` en cada paso y
+# los nodos con STARTING_PACK_CLOCK=simulator.clock lo siguen. Se cambia en
+# marcha publicando un `TimeScale` en `simulator.speed` (0 = pausa)
+SIM_SPEED = float(os.environ.get("SIM_SPEED") or 1.0)
+use_clock("wall", SIM_SPEED)  # nunca sigue su propio topic aunque lo diga el entorno
+time_scale = SIM_SPEED
+
+# Número de coches simulados. Con 0 se simula un único coche en los topics de
+# siempre (`vehicle.controls` / `simulator.state`); con N > 0 cada coche tiene
+# los suyos: `vehicle.<id>.controls` y `simulator.<id>.state`, id = 0..N-1
+FLEET_SIZE = int(os.environ.get("FLEET_SIZE") or 0)
+
+# Estado de todos los coches (structure-of-arrays), todos parten de la misma pose
+fleet = Fleet(max(1, FLEET_SIZE))
 
 # Generar conos en forma de óvalo con mayor separación entre conos
 # Ajusta NUM_CONES para controlar el espacio entre conos (menos conos -> más separación)
@@ -33,57 +56,119 @@ cones = Cones(cones=[
     for a in [(i / NUM_CONES) * 2 * math.pi for i in range(NUM_CONES)]
 ])
 
+# Percepción por coche: con PERCEPTION=1 cada paso publica en
+# `simulator.perception` (o `simulator.<id>.perception` con flota) solo los
+# conos al alcance del sensor, ya en el marco del coche. El coste por coche
+# depende de los conos cercanos, no del tamaño del circuito
+PERCEPTION = bool(int(os.environ.get("PERCEPTION") or 0))
+SENSOR_RANGE = 20.0  # m
+SENSOR_FOV = math.radians(120)  # semiángulo del campo de visión
+cone_index = ConeIndex.from_cones(cones)
+# El mismo mapa empaquetado (ver messages.ConeMap), el que usan los nodos
+cone_map = pack_cones(cone_index.xs, cone_index.ys)
+
+# Lidar por coche: con LIDAR=1 cada paso publica en `simulator.lidar` (o
+# `simulator.<id>.lidar` con flota) un LidarScan de LIDAR_RAYS rayos en un
+# abanico de LIDAR_FOV grados (360 por defecto), con alcance LIDAR_RANGE (m),
+# ruido gaussiano LIDAR_NOISE (m) y probabilidad de rayo sin retorno LIDAR_DROPOUT.
+# Los rayos de toda la flota se lanzan juntos, solo contra los conos cercanos
+LIDAR = bool(int(os.environ.get("LIDAR") or 0))
+LIDAR_RAYS = int(os.environ.get("LIDAR_RAYS") or 1000)
+LIDAR_FOV = math.radians(float(os.environ.get("LIDAR_FOV") or 360))
+LIDAR_RANGE = float(os.environ.get("LIDAR_RANGE") or SENSOR_RANGE)
+LIDAR_NOISE = float(os.environ.get("LIDAR_NOISE") or 0.0)
+LIDAR_DROPOUT = float(os.environ.get("LIDAR_DROPOUT") or 0.0)
+lidar = Lidar(LIDAR_RAYS, LIDAR_FOV, LIDAR_RANGE, LIDAR_NOISE, LIDAR_DROPOUT)
+
+# Contactos con conos y salidas del circuito: con TRACK_EVENTS=1 cada paso
+# publica los nuevos de todos los coches en un único TrackEvents en `simulator.events`
+TRACK_EVENTS = bool(int(os.environ.get("TRACK_EVENTS") or 0))
+track_monitor = TrackMonitor(cone_index, len(fleet))
+
 
 # ============================
 #   Callbacks y simulación
 # ============================
 
-@subscribe("vehicle.controls", Controls)
-async def controls_callback(msg: Controls):
-    
-    global current_controls
-    current_controls = msg
+def perceive(vehicle_id: int, timestamp: float) -> Perception:
+    """Conos que ve el coche `vehicle_id`, en su marco."""
+    f = cone_index.visible(float(fleet.x[vehicle_id]), float(fleet.y[vehicle_id]),
+                           float(fleet.yaw[vehicle_id]), SENSOR_RANGE, SENSOR_FOV)
+    return Perception(timestamp=timestamp,
+                      cones=[Cone(x=x, y=y) for x, y in zip(f.x_rel.tolist(), f.y_rel.tolist())])
 
 
-@timer(1.0)
-async def publish_cones():
-    
-    await publish("simulator.cones", cones)
+def make_controls_callback(vehicle_id: int):
 
+    async def controls_callback(msg: Controls):
+        fleet.set_controls(vehicle_id, msg)
 
-@timer(DT)
-async def simulate_step():
-    
-    global state, current_controls
+    return controls_callback
 
-    throttle = max(-1.0, min(1.0, current_controls.throttle))
-    steer = max(-1.0, min(1.0, current_controls.steer))
 
-    if throttle >= 0:
-        accel = throttle * MAX_ACCEL
-    else:
-        accel = throttle * MAX_BRAKE  
+@subscribe("simulator.speed", TimeScale)
+async def speed_callback(msg: TimeScale):
+    global time_scale
+    time_scale = max(0.0, msg.scale)
+    set_time_scale(time_scale)
+    print(f"[LOG] Tiempo simulado a {time_scale:g}x")
 
-    # Actualizar velocidad
-    state.speed += accel * DT
-    state.speed = max(0.0, min(MAX_SPEED, state.speed))
 
-    # Calcular cambio de orientación (yaw rate )
-    steer_angle = steer * MAX_STEER_ANGLE
-    if abs(steer_angle) > 1e-3 and state.speed > 0.01:
-        R = WHEEL_BASE / math.tan(steer_angle)
-        yaw_rate = state.speed / R
-    else:
-        yaw_rate = 0.0
+STATE_TOPICS = [f"simulator.{vehicle_id}.state" for vehicle_id in range(FLEET_SIZE)]
+PERCEPTION_TOPICS = [f"simulator.{vehicle_id}.perception" for vehicle_id in range(FLEET_SIZE)]
+LIDAR_TOPICS = [f"simulator.{vehicle_id}.lidar" for vehicle_id in range(FLEET_SIZE)]
+
+if FLEET_SIZE:
+    for vehicle_id in range(FLEET_SIZE):
+        subscribe(f"vehicle.{vehicle_id}.controls", Controls)(make_controls_callback(vehicle_id))
+else:
+    subscribe("vehicle.controls", Controls)(make_controls_callback(0))
 
-    # Integrar estado
-    state.yaw += yaw_rate * DT
-    state.x += state.speed * math.cos(state.yaw) * DT
-    state.y += state.speed * math.sin(state.yaw) * DT
-    state.timestamp = time.time()
+
+@timer(1.0)
+async def publish_cones():
+
+    # El mapa no cambia: cada segundo solo se anuncia su versión (unos bytes) y
+    # cada nodo lo pide por `simulator.cones.get` cuando no tiene la última
+    await publish_snapshot("simulator.cones", cones)
+    await publish_snapshot("simulator.conemap", cone_map)
+
+
+# catch_up: si un paso llega tarde se recuperan los pendientes, así el tiempo
+# simulado (un DT por paso) sigue al tiempo real
+@timer(DT, overrun="catch_up")
+async def simulate_step():
+
+    # Integrar todos los coches a la vez
+    fleet.advance(DT, SUBSTEPS, INTEGRATOR)
+    timestamp = now()
+    events = track_monitor.update(fleet.x, fleet.y, fleet.yaw, timestamp) if TRACK_EVENTS else []
+    if LIDAR:
+        scans = lidar.scan(cone_index, fleet.x, fleet.y, fleet.yaw)
 
     # Publicar estado actual
-    await publish("simulator.state", state)
+    if FLEET_SIZE:
+        # Todos los coches en un solo envío
+        messages = [(STATE_TOPICS[vehicle_id], fleet.state(vehicle_id, timestamp))
+                    for vehicle_id in range(FLEET_SIZE)]
+        if PERCEPTION:
+            messages += [(PERCEPTION_TOPICS[vehicle_id], perceive(vehicle_id, timestamp))
+                         for vehicle_id in range(FLEET_SIZE)]
+        if LIDAR:
+            messages += [(LIDAR_TOPICS[vehicle_id], lidar.message(scans[vehicle_id], timestamp))
+                         for vehicle_id in range(FLEET_SIZE)]
+        await publish_many(messages)
+    else:
+        await publish("simulator.state", fleet.state(0, timestamp))
+        if PERCEPTION:
+            await publish("simulator.perception", perceive(0, timestamp))
+        if LIDAR:
+            await publish("simulator.lidar", lidar.message(scans[0], timestamp))
+    if events:
+        await publish("simulator.events", TrackEvents(timestamp=timestamp, events=events))
+
+    # Después del estado: quien despierta con este instante ya tiene el estado nuevo
+    await publish("simulator.clock", Clock(time=timestamp, scale=time_scale))
 
 
 # ============================
@@ -6,31 +6,177 @@ use @subscribe like this:
 def callback(msg : ConeArray):
 ...
 ```
-you can also use `encoder` and `decoder` to encode and decode messages
+you can also use `encode` and `decode` to encode and decode messages
 before sending them and after receiving them
 (though if you use @subscribe they are automatically decoded)
 
-remember to call `start` in the main function
+messages are json by default; `set_codec` (or the STARTING_PACK_CODEC env
+variable) switches a node or a single topic to msgpack. The codec travels in
+a message header, so nodes using different codecs still understand each other.
+
+remember to call `start` in the main function, or `run_lockstep` to run
+several nodes in one process on a simulated clock (see below)
 """
 
 import os
+import sys
+import time
+import heapq
+import typing
+import hashlib
 import nats
 import asyncio
 import msgspec
 from types import FunctionType
+import metrics
+import transports
 
 TOPIC_NAME_ERROR = """
 Error with topic name {topic} - NATS topics unlike ros do not use '/', they use '.',
 also no leading '/', for example: '/can/state' would be 'can.state' in nats """
 
+OVERRUN_ERROR = "Unknown overrun policy {overrun}, use one of: skip, catch_up, coalesce"
+
+CODEC_ERROR = "Unknown codec {codec}, use one of: json, msgpack, msgpack-array"
+
+# json: default, human readable
+# msgpack: binary, same map layout as json (field names included)
+# msgpack-array: binary, structs encoded as arrays (array_like=True), smallest payloads
+CODECS = ("json", "msgpack", "msgpack-array")
+CODEC_HEADER = "codec" # nats header telling the receiver how to decode the payload
+default_codec = os.environ.get("STARTING_PACK_CODEC") or "json"
+topic_codecs : dict[str,str] = {}
+
 encoder = msgspec.json.Encoder()
-# we create decoders for each type for faster decoding
-decoders : dict[type[msgspec.Struct],msgspec.json.Decoder] = {}
+encoders = {
+    "json": encoder,
+    "msgpack": msgspec.msgpack.Encoder(),
+    "msgpack-array": msgspec.msgpack.Encoder(),
+}
+# we create decoders for each (type, codec) for faster decoding
+decoders : dict[tuple[type[msgspec.Struct],str],typing.Union[msgspec.json.Decoder,msgspec.msgpack.Decoder]] = {}
+# array_like subclass of each message type (and back), used by msgpack-array
+array_types : dict[type[msgspec.Struct],type[msgspec.Struct]] = {}
+array_bases : dict[type[msgspec.Struct],type[msgspec.Struct]] = {}
+tuple_builders : dict[type[msgspec.Struct],FunctionType] = {}
+# reusable encode buffers, a publish takes one and gives it back when done
+buffers : list[bytearray] = []
+# name of this node, used in its `node.<name>.*` topics; the script name by default
+node_name = os.environ.get("STARTING_PACK_NODE") or \
+    os.path.splitext(os.path.basename(sys.argv[0]))[0] or "node"
+# latency instrumentation, off unless enable_metrics() or STARTING_PACK_METRICS=<interval s>
+metrics_enabled = False
+topic_metrics : dict[str,metrics.TopicMetrics] = {}
 nc = None # nats connection
 subscriptions = []
-timers = []
+timers : list[tuple[float,FunctionType,str]] = [] # (interval, callback, overrun policy)
+
+# lockstep mode: no nats, publish delivers straight to the subscribers in this process
+lockstep = False
+sim_time = 0.0
+# by topic, filled on first use: subscribers and on_message triggers, wildcard patterns included
+local_subscribers : dict[str,list[tuple[FunctionType,typing.Optional[type[msgspec.Struct]]]]] = {}
+local_triggers : dict[str,list["MessageTrigger"]] = {}
 
-subscribe_setup : list[tuple[str,FunctionType,type[msgspec.Struct]]] = []
+# (topic, callback, message type or None for raw payloads, extra nats subscribe arguments)
+subscribe_setup : list[tuple[str,FunctionType,typing.Optional[type[msgspec.Struct]],dict]] = []
+# messages thrown away per topic: overwritten in "latest" mode or dropped by nats (slow consumer)
+dropped_messages : dict[str,int] = {}
+startup_tasks : list[FunctionType] = [] # see on_start
+message_triggers : dict[str,list["MessageTrigger"]] = {} # see on_message, by topic
+
+"""
+Clock source: what `now()` returns and what `@timer` intervals are measured in.
+- "wall" (default): real time, optionally sped up or slowed down by a
+  scale (5.0 runs five seconds per real second, 0.0 pauses it)
+- a topic name, e.g. "simulator.clock": the time in the `Clock` messages
+  published there, so the node runs at whatever pace the publisher sets,
+  pauses included. Timers fire when the received time reaches their deadline
+The simulator keeps the wall clock and publishes `simulator.clock`; the
+other nodes follow it with `use_clock("simulator.clock")` or with the
+STARTING_PACK_CLOCK env variable (and STARTING_PACK_TIME_SCALE for the scale)
+"""
+class Clock(msgspec.Struct):
+    time : float # seconds
+    scale : float # simulated seconds per real second
+
+class WallClock:
+    """real time multiplied by `scale` since the clock was created"""
+    topic = None
+
+    def __init__(self, scale : float = 1.0) -> None:
+        self.scale = scale
+        self.origin = time.time()
+        self.origin_monotonic = time.monotonic()
+        self.waiters : list[asyncio.Future] = [] # sleepers to wake up when the scale changes
+
+    def time(self) -> float:
+        return self.origin + (time.monotonic() - self.origin_monotonic) * self.scale
+
+    def set_scale(self, scale : float) -> None:
+        self.origin, self.origin_monotonic = self.time(), time.monotonic()
+        self.scale = scale
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def ready(self) -> None:
+        return
+
+    async def sleep_until(self, deadline : float) -> None:
+        while (delay := deadline - self.time()) > 0:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await asyncio.wait([waiter], timeout = delay / self.scale if self.scale > 0 else None)
+            finally:
+                self.waiters.remove(waiter)
+
+class TopicClock:
+    """time of the last `Clock` message received on `topic`"""
+
+    def __init__(self, topic : str) -> None:
+        self.topic = topic
+        self.current : typing.Optional[float] = None
+        self.scale = 1.0
+        self.waiters : list[tuple[float,int,asyncio.Future]] = [] # heap of (deadline, order, future)
+        self.order = 0
+
+    def time(self) -> float:
+        # before the first message there is no simulated time yet
+        return self.current if self.current is not None else time.time()
+
+    async def update(self, msg : Clock) -> None:
+        self.current, self.scale = msg.time, msg.scale
+        while self.waiters and self.waiters[0][0] <= msg.time:
+            waiter = heapq.heappop(self.waiters)[2]
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def ready(self) -> None:
+        if self.current is None:
+            await self.sleep_until(-float("inf"))
+
+    async def sleep_until(self, deadline : float) -> None:
+        if self.current is not None and deadline <= self.current:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.order += 1
+        heapq.heappush(self.waiters, (deadline, self.order, waiter))
+        await waiter
+
+clock : typing.Union[WallClock,TopicClock] = WallClock()
+
+def use_clock(source : str = "wall", scale : float = 1.0) -> None:
+    """sets the clock source of this node, call it before start()"""
+    global clock  # noqa: PLW0603
+    clock = WallClock(scale) if source == "wall" else TopicClock(source)
+
+def set_time_scale(scale : float) -> None:
+    """changes the speed of the wall clock while running, 0.0 pauses it"""
+    if not isinstance(clock, WallClock):
+        raise Exception(f"the clock follows {clock.topic}, its speed is set by the publisher")
+    clock.set_scale(scale)
 
 """
 Decorator to execute a task every `interval_s` seconds
@@ -39,19 +185,57 @@ example usage:
 def printer():
     print uwu
 `
+Ticks happen on fixed deadlines (start + n * interval_s), so the rate does
+not drift when the callback takes a while. If a callback runs past one or
+more deadlines, `overrun` says what to do with the missed ticks:
+- "skip": forget them, wait for the next deadline
+- "catch_up": run them all back to back until back on schedule
+  (e.g. physics that must integrate every tick)
+- "coalesce": run a single tick right away for all of them, then go back
+  to the schedule
+`timer_stats[function.__name__]` keeps jitter, overrun and duration numbers.
+Intervals, deadlines and jitter are in clock time (see `use_clock`), the
+duration of the callback in real time.
 """
-def timer(interval_s : float) -> FunctionType:
+OVERRUN_POLICIES = ("skip", "catch_up", "coalesce")
+
+def timer(interval_s : float, overrun : str = "skip") -> FunctionType:
+    if overrun not in OVERRUN_POLICIES:
+        raise Exception(OVERRUN_ERROR.format(overrun=overrun))
     def decorator(function : FunctionType) -> FunctionType:
-        async def repeat(*args,**kwargs) -> None:
-            while True:
-                await asyncio.gather(
-                    function(*args, **kwargs),
-                    asyncio.sleep(interval_s),
-                )
-        timers.append(repeat) # append task so we can set it up on start()
+        timers.append((interval_s,function,overrun)) # append task so we can set it up on start()
         return function
     return decorator
 
+timer_stats : dict[str,metrics.TimerStats] = {}
+
+async def repeat(interval_s : float, function : FunctionType, overrun : str = "skip") -> None:
+    stats = timer_stats[function.__name__] = metrics.TimerStats(interval_s)
+    await clock.ready()
+    start_time = clock.time()
+    tick = 0
+    while True:
+        deadline = start_time + tick * interval_s
+        await clock.sleep_until(deadline)
+        started = clock.time()
+        started_real = time.monotonic()
+        await function()
+        finished = clock.time()
+        stats.record(started - deadline, time.monotonic() - started_real)
+
+        tick += 1
+        # deadlines that already went by without their tick
+        behind = int((finished - start_time) // interval_s) + 1 - tick
+        if behind > 0:
+            stats.overruns += 1
+            if overrun == "skip":
+                stats.missed += behind
+                tick += behind
+            elif overrun == "coalesce":
+                stats.missed += behind - 1
+                tick += behind - 1
+            # catch_up: the next deadlines are in the past, they run without sleeping
+
 """
 decorator to subscribe to a nats topic
 example:
@@ -60,47 +244,821 @@ example:
 def callback(msg : ConeArray):
 [...]
 ```
+with mode="latest" the subscription conflates: arriving messages are only
+stored (still encoded), overwriting the previous one, and the callback runs
+once with the newest message when the event loop gets to it. A node that falls
+behind then skips stale messages instead of decoding all of them. In this
+mode the decorator returns a `Latest`, whose `get()` also reads the newest
+message and `dropped` says how many were skipped.
+`pending_msgs_limit` / `pending_bytes_limit` bound the nats client queue
+of the subscription, what goes past them is dropped (and counted).
+Topics can have nats wildcards (`*` one token, `>` the rest): the callback
+then also gets the subject tokens they matched, one argument per `*` and
+the rest of the subject for `>`:
+```
+@subscribe("simulator.*.state", VehicleState)
+async def callback(msg : VehicleState, vehicle : str):
+[...]
+```
+With mode="latest" each subject keeps its own newest message (one `Latest`
+per subject, in the `Latests` the decorator returns).
 """
-def subscribe(topic : str, message_type : type[msgspec.Struct]) -> FunctionType:
+SUBSCRIBE_MODES = ("all", "latest")
+
+def subscribe(topic               : str,
+              message_type        : type[msgspec.Struct],
+              mode                : str = "all",
+              pending_msgs_limit  : typing.Optional[int] = None,
+              pending_bytes_limit : typing.Optional[int] = None) -> FunctionType:
     assert issubclass(message_type,msgspec.Struct)
+    assert mode in SUBSCRIBE_MODES
     if "/" in topic:
         raise Exception(TOPIC_NAME_ERROR)
-    def decorator(function : FunctionType) -> None:
-        decoders[message_type] = msgspec.json.Decoder(type=message_type)
-        subscribe_setup.append((topic,function,message_type))
+    limits = {}
+    if pending_msgs_limit is not None:
+        limits["pending_msgs_limit"] = pending_msgs_limit
+    if pending_bytes_limit is not None:
+        limits["pending_bytes_limit"] = pending_bytes_limit
+    def decorator(function : FunctionType) -> typing.Union["Latest","Latests",None]:
+        get_decoder(message_type, default_codec)
+        extract = wildcard_tokens(topic)
+        if mode == "latest":
+            if extract is not None:
+                latests = Latests(message_type, function, extract)
+                subscribe_setup.append((topic,latests.put,None,limits))
+                return latests
+            latest = Latest(topic, message_type, function)
+            subscribe_setup.append((topic,latest.put,None,limits))
+            return latest
+        if extract is not None:
+            # goes in raw to learn the subject, decoded here
+            async def deliver(subject : str, data : bytes, codec : str) -> None:
+                tokens = extract(subject)
+                if metrics_enabled:
+                    await deliver_measured(topic, lambda msg: function(msg, *tokens), message_type, data, codec)
+                else:
+                    await function(decode(data, message_type, codec), *tokens)
+            subscribe_setup.append((topic,deliver,None,limits))
+            return None
+        subscribe_setup.append((topic,function,message_type,limits))
+    return decorator
+
+def wildcard_tokens(topic : str) -> typing.Optional[FunctionType]:
+    """
+    for a topic with wildcards, function from a subject to the tokens they
+    matched: one per `*`, then for a final `>` the rest of the subject as one
+    string. None when `topic` has no wildcards
+    """
+    tokens = topic.split(".")
+    stars = [i for i, token in enumerate(tokens) if token == "*"]
+    rest = len(tokens) - 1 if tokens[-1] == ">" else None
+    if not stars and rest is None:
+        return None
+    def extract(subject : str) -> tuple[str, ...]:
+        parts = subject.split(".")
+        matched = tuple(parts[i] for i in stars)
+        return matched if rest is None else matched + (".".join(parts[rest:]),)
+    return extract
+
+"""
+decorator to subscribe to a nats topic without decoding: the callback gets
+`(topic, data, codec)` with the encoded payload as bytes
+"""
+def subscribe_raw(topic : str, **limits) -> FunctionType:
+    if "/" in topic:
+        raise Exception(TOPIC_NAME_ERROR)
+    def decorator(function : FunctionType) -> FunctionType:
+        subscribe_setup.append((topic,function,None,limits))
+        return function
     return decorator
 
+class Latest:
+    """newest message of a mode="latest" subscription, decoded only when read"""
+
+    def __init__(self, topic : str, message_type : type[msgspec.Struct], function : FunctionType) -> None:
+        self.topic = topic
+        self.message_type = message_type
+        self.function = function
+        self.data : typing.Optional[bytes] = None
+        self.codec = "json"
+        self.msg : typing.Optional[msgspec.Struct] = None # decoded self.data, once someone asks
+        self.unread = False # self.data has not reached the callback yet
+        self.scheduled = False
+
+    @property
+    def dropped(self) -> int:
+        return dropped_messages.get(self.topic, 0)
+
+    def get(self) -> typing.Optional[msgspec.Struct]:
+        if self.msg is None and self.data is not None:
+            self.msg = decode(self.data, self.message_type, self.codec)
+        return self.msg
+
+    async def put(self, topic : str, data : bytes, codec : str) -> None:
+        if self.unread:
+            dropped_messages[self.topic] = dropped_messages.get(self.topic, 0) + 1
+        # bytes(): with shm the payload is a view only valid during the delivery
+        self.data, self.codec, self.msg, self.unread = bytes(data), codec, None, True
+        if lockstep:
+            # nothing piles up in lockstep, keep it deterministic and deliver now
+            await self.dispatch()
+        elif not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().create_task(self.dispatch())
+
+    async def dispatch(self) -> None:
+        self.scheduled = False
+        if not self.unread:
+            return
+        self.unread = False
+        if metrics_enabled:
+            started = time.perf_counter()
+            msg = self.get()
+            decoded = time.perf_counter()
+            await self.function(msg)
+            record_delivery(self.topic, msg, started, decoded)
+        else:
+            await self.function(self.get())
+
+class Latests:
+    """mode="latest" subscription with wildcards: a `Latest` per subject, in `by_subject`"""
+
+    def __init__(self, message_type : type[msgspec.Struct], function : FunctionType,
+                 extract : FunctionType) -> None:
+        self.message_type = message_type
+        self.function = function
+        self.extract = extract
+        self.by_subject : dict[str,Latest] = {}
+
+    async def put(self, subject : str, data : bytes, codec : str) -> None:
+        latest = self.by_subject.get(subject)
+        if latest is None:
+            tokens = self.extract(subject)
+            async def deliver(msg : msgspec.Struct) -> None:
+                await self.function(msg, *tokens)
+            latest = self.by_subject[subject] = Latest(subject, self.message_type, deliver)
+        await latest.put(subject, data, codec)
+
+"""
+Selects the codec used to publish, for the whole node or only for `topic`.
+Receiving does not depend on this: every message says which codec it uses.
+"""
+def set_codec(codec : str, topic : typing.Optional[str] = None) -> None:
+    global default_codec  # noqa: PLW0603
+    if codec not in CODECS:
+        raise Exception(CODEC_ERROR.format(codec=codec))
+    if topic is None:
+        default_codec = codec
+    else:
+        topic_codecs[topic] = codec
+
+def array_type(message_type : type[msgspec.Struct]) -> type[msgspec.Struct]:
+    """array_like subclass of `message_type`, with nested structs replaced too"""
+    if message_type not in array_types:
+        hints = typing.get_type_hints(message_type)
+        fields = []
+        for field in msgspec.structs.fields(message_type):
+            hint = map_structs(hints[field.name], array_type)
+            if hint is hints[field.name]:
+                continue
+            if field.default is not msgspec.NODEFAULT:
+                fields.append((field.name, hint, field.default))
+            else:
+                fields.append((field.name, hint))
+        array_types[message_type] = msgspec.defstruct(
+            message_type.__name__, fields, bases=(message_type,), array_like=True)
+        array_bases[array_types[message_type]] = message_type
+    return array_types[message_type]
+
+def map_structs(hint, function : FunctionType):
+    """type hint `hint` with every Struct type inside it replaced by function(struct)"""
+    if isinstance(hint, type) and issubclass(hint, msgspec.Struct):
+        return function(hint)
+    args = typing.get_args(hint)
+    if not args:
+        return hint
+    new_args = tuple(map_structs(arg, function) for arg in args)
+    if all(new is old for new, old in zip(new_args, args)):
+        return hint
+    return typing.get_origin(hint)[new_args]
+
+def tuple_builder(message_type : type[msgspec.Struct]) -> FunctionType:
+    """
+    function turning a `message_type` into nested tuples with the msgpack-array
+    layout, cheaper than building the array_like subclass
+    """
+    if message_type in tuple_builders:
+        return tuple_builders[message_type]
+
+    def field_builder(hint):
+        if isinstance(hint, type) and issubclass(hint, msgspec.Struct):
+            return tuple_builder(hint)
+        if map_structs(hint, lambda struct: None) is hint:
+            return None # no structs inside, encode as is
+        origin, args = typing.get_origin(hint), typing.get_args(hint)
+        if origin in (list, tuple) and (len(args) == 1 or args[1:] == (...,)):
+            build = field_builder(args[0])
+            return lambda values: [build(v) for v in values]
+        if origin is typing.Union and type(None) in args and len(args) == 2:
+            build = field_builder(next(arg for arg in args if arg is not type(None)))
+            return lambda value: None if value is None else build(value)
+        # anything fancier goes through msgspec.convert, slower but always right
+        target = map_structs(hint, array_type)
+        return lambda value: msgspec.convert(value, target, from_attributes=True)
+
+    hints = typing.get_type_hints(message_type)
+    builders = [field_builder(hints[field.name]) for field in msgspec.structs.fields(message_type)]
+    if not any(builders):
+        build = msgspec.structs.astuple
+    else:
+        def build(msg : msgspec.Struct) -> tuple:
+            return tuple(value if builder is None else builder(value)
+                         for value, builder in zip(msgspec.structs.astuple(msg), builders))
+    tuple_builders[message_type] = build
+    return build
+
+def get_decoder(message_type : type[msgspec.Struct], codec : str):
+    key = (message_type, codec)
+    if key not in decoders:
+        if codec == "json":
+            decoders[key] = msgspec.json.Decoder(type=message_type)
+        elif codec == "msgpack":
+            decoders[key] = msgspec.msgpack.Decoder(type=message_type)
+        elif codec == "msgpack-array":
+            decoders[key] = msgspec.msgpack.Decoder(type=array_type(message_type))
+        else:
+            raise Exception(CODEC_ERROR.format(codec=codec))
+    return decoders[key]
+
+def wire_form(msg : msgspec.Struct, codec : str):
+    """what actually gets handed to the encoder of `codec`"""
+    if type(msg) in array_bases:
+        # received through msgpack-array, it is already laid out as an array
+        if codec == "msgpack-array":
+            return msg
+        return msgspec.convert(msg, array_bases[type(msg)], from_attributes=True)
+    if codec == "msgpack-array":
+        return tuple_builder(type(msg))(msg)
+    return msg
+
+def encode_into(msg : msgspec.Struct, buffer : bytearray, codec : str = "json") -> None:
+    encoders[codec].encode_into(wire_form(msg, codec), buffer)
+
+def encode(msg : msgspec.Struct, codec : str = "json") -> bytes:
+    return encoders[codec].encode(wire_form(msg, codec))
+
+"""
+Decodes a `message_type` encoded with `codec`. With msgpack-array you get an
+array_like subclass of `message_type`: same fields and isinstance works, but
+`==` against a plain `message_type` is False because the types differ
+"""
+def decode(data : bytes, message_type : type[msgspec.Struct], codec : str = "json") -> msgspec.Struct:
+    return get_decoder(message_type, codec).decode(data)
+
 """
 You should always call this at the start of your node, to:
-1. Connect to nats
+1. Connect to nats (waiting with backoff if the server is not up yet)
 2. Setup the subscriptions
-3. Keep async working until the program is terminated
+3. Announce on `node.<name>.ready` that the node is ready
+4. Keep async working until the program is terminated
 """
 async def start() -> None:
     global nc  # noqa: PLW0603
+    # nats://..., inproc:// or shm://<name>, see transports.py
     nats_url = os.environ.get("NATS_URL") or "nats://127.0.0.1:4222"
     try:
-        nc = await nats.connect(nats_url)
-    except ConnectionRefusedError:
-        print(f"Couldn't connect to nats server at {nats_url}")
+        # retries with backoff until the server is up or STARTING_PACK_CONNECT_TIMEOUT
+        nc = await transports.connect(nats_url, error_callback)
+    except ConnectionRefusedError as error:
+        raise SystemExit(f"Couldn't connect to nats server at {nats_url}: {error}") from None
+    if metrics_enabled:
+        nc.msg_class = metrics.TimedMsg
+
+    if clock.topic is not None:
+        # only the newest time matters, a node that falls behind jumps ahead
+        subscribe(clock.topic, Clock, mode="latest")(clock.update)
+
+    # on_message topics nobody subscribes to still need a subscription to notice messages
+    subscribed = {topic for topic, _, _, _ in subscribe_setup}
+    for topic in message_triggers:
+        if topic not in subscribed:
+            subscribe_raw(topic)(ignore)
+
+    notifying = set() # the first subscription of each topic notifies its triggers
+    for topic, function, message_type, limits in subscribe_setup:
+        topic_triggers = message_triggers.get(topic, ()) if topic not in notifying else ()
+        notifying.add(topic)
 
-    for topic, function, message_type in subscribe_setup:
         async def callback(msg          : bytes,
+                     topic        : str = topic,
                      function     : FunctionType = function,
-                     message_type : type[msgspec.Struct] = message_type) -> None:
-            msg = decoders[message_type].decode(msg.data)
-            await function(msg)
+                     message_type : type[msgspec.Struct] = message_type,
+                     topic_triggers : typing.Sequence["MessageTrigger"] = topic_triggers) -> None:
+            codec = msg.headers.get(CODEC_HEADER, "json") if msg.headers else "json"
+            if message_type is None:
+                await function(msg.subject, msg.data, codec)
+            elif metrics_enabled:
+                await deliver_measured(topic, function, message_type, msg.data, codec,
+                                       getattr(msg, "received_at", None))
+            else:
+                await function(decode(msg.data, message_type, codec))
+            for trigger in topic_triggers:
+                await trigger.notify()
+
+        subscriptions.append(await nc.subscribe(topic, cb = callback, **limits))
+
+    # the announcement can be missed (nobody listening yet, a lossy transport):
+    # `node.<name>.ready.get` answers it again on request
+    ready = NodeReady(node = node_name, pid = os.getpid(), timestamp = now())
+    async def answer_ready(request) -> None:
+        await nc.publish(request.reply, encode(ready), headers = {CODEC_HEADER: "json"})
+    subscriptions.append(await nc.subscribe(f"node.{node_name}.ready.get", cb = answer_ready))
 
-        subscriptions.append(await nc.subscribe(topic, cb = callback))
+    # the server has all the subscriptions once it answers a flush
+    await nc.flush()
+    await publish(f"node.{node_name}.ready", ready)
+
+    for function in startup_tasks:
+        asyncio.create_task(function())
 
     if timers:
-        await asyncio.gather(*[timer() for timer in timers])
+        await asyncio.gather(*[repeat(interval_s, function, overrun)
+                               for interval_s, function, overrun in timers])
     else:
         # infinite wait
         await asyncio.Event().wait()
 
+"""
+Readiness: once its subscriptions are live, start() publishes a `NodeReady`
+on `node.<name>.ready`, so a launcher (launcher.py) can start the nodes
+that depend on it right away instead of sleeping. That announcement is sent
+once; `query_ready(name)` asks the node for it again on `node.<name>.ready.get`
+"""
+class NodeReady(msgspec.Struct):
+    node : str
+    pid : int
+    timestamp : float
+
+READY_QUERY_TIMEOUT = 0.5 # seconds to wait for a `node.<name>.ready.get` reply
+
+async def query_ready(node : str, timeout : float = READY_QUERY_TIMEOUT) -> typing.Optional[NodeReady]:
+    """asks node `node` whether it is ready, None if it does not answer (not started yet)"""
+    try:
+        reply = await nats_connection().request(f"node.{node}.ready.get", b"", timeout = timeout)
+    except (nats.errors.TimeoutError, nats.errors.NoRespondersError):
+        return None
+    return decode(reply.data, NodeReady, (reply.headers or {}).get(CODEC_HEADER, "json"))
+
+"""
+decorator for coroutines that start() runs once, as tasks, after connecting
+and setting up the subscriptions (so they can already publish and request)
+"""
+def on_start(function : FunctionType) -> FunctionType:
+    startup_tasks.append(function)
+    return function
+
+"""
+decorator for coroutines that run when a new message arrives on any of
+`topics`, instead of on a timer. It runs after the subscriptions of that
+topic got the message, so e.g. a mode="latest" callback already stored it:
+```
+@on_message("simulator.state")
+async def control_loop():
+[...]
+```
+Messages that arrive while it is running are coalesced into a single run
+right after it. With `min_interval_s` it runs at most once per interval
+(in clock time, see use_clock): what arrives in between is coalesced into
+one run when the interval is over. In lockstep it runs inline like the
+subscribers; a rate-limited run waits for the next message after the interval.
+`triggers[function.__name__]` counts runs and coalesced messages.
+"""
+class MessageTrigger:
+
+    def __init__(self, function : FunctionType, min_interval_s : float) -> None:
+        self.function = function
+        self.min_interval_s = min_interval_s
+        self.last_run = -float("inf")
+        self.pending = False # a message arrived that no run has seen yet
+        self.running = False
+        self.runs = 0
+        self.coalesced = 0 # messages folded into the run of another one
+
+    async def notify(self) -> None:
+        if self.pending:
+            self.coalesced += 1
+        self.pending = True
+        if self.running:
+            return
+        if lockstep:
+            await self.run()
+        else:
+            self.running = True
+            asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self) -> None:
+        self.running = True
+        try:
+            while self.pending:
+                due = self.last_run + self.min_interval_s
+                if now() < due:
+                    if lockstep:
+                        return # stays pending until a message arrives after `due`
+                    await clock.sleep_until(due)
+                self.pending = False
+                self.last_run = now()
+                self.runs += 1
+                await self.function()
+        finally:
+            self.running = False
+
+triggers : dict[str,MessageTrigger] = {}
+
+def on_message(*topics : str, min_interval_s : float = 0.0) -> FunctionType:
+    for topic in topics:
+        if "/" in topic:
+            raise Exception(TOPIC_NAME_ERROR)
+    def decorator(function : FunctionType) -> FunctionType:
+        trigger = triggers[function.__name__] = MessageTrigger(function, min_interval_s)
+        for topic in topics:
+            message_triggers.setdefault(topic, []).append(trigger)
+        return function
+    return decorator
+
+async def ignore(topic : str, data : bytes, codec : str) -> None:
+    return
+
+"""
+Runs every node imported in this process in lockstep, without nats:
+- `@timer` callbacks fire on a simulated clock, in deadline order (ties in
+  registration order, so import the simulator before the controller)
+- `publish` delivers the message to the local subscribers before returning,
+  so everything a timer tick triggers runs before time advances
+- `now()` returns the simulated time, starting at 0
+
+The run is deterministic and goes as fast as the callbacks allow, e.g.
+`asyncio.run(run_lockstep(600.0))` simulates 10 minutes.
+"""
+async def run_lockstep(duration_s : float) -> None:
+    global lockstep, sim_time  # noqa: PLW0603
+    lockstep = True
+    sim_time = 0.0
+
+    local_subscribers.clear()
+    local_triggers.clear()
+
+    # (deadline, registration order, tick count, interval, callback); the
+    # deadline is tick * interval so it does not accumulate rounding errors
+    queue = [(0.0, order, 0, interval_s, function)
+             for order, (interval_s, function, _) in enumerate(timers)]
+    heapq.heapify(queue)
+    while queue and queue[0][0] <= duration_s:
+        deadline, order, tick, interval_s, function = heapq.heappop(queue)
+        sim_time = deadline
+        await function()
+        heapq.heappush(queue, ((tick + 1) * interval_s, order, tick + 1, interval_s, function))
+
+async def error_callback(error : Exception) -> None:
+    if isinstance(error, nats.errors.SlowConsumerError):
+        topic = error.sub.subject
+        dropped_messages[topic] = dropped_messages.get(topic, 0) + 1
+    else:
+        print(f"nats error: {error!r}")
+
+def local_routes(topic : str) -> list[tuple[FunctionType,typing.Optional[type[msgspec.Struct]]]]:
+    """lockstep: subscribers of `topic` in registration order, wildcard subscriptions included"""
+    routes = local_subscribers.get(topic)
+    if routes is None:
+        tokens = topic.split(".")
+        routes = local_subscribers[topic] = [
+            (function, message_type) for pattern, function, message_type, _ in subscribe_setup
+            if transports.subject_matches(pattern.split("."), tokens)]
+    return routes
+
+def matching_triggers(topic : str) -> list["MessageTrigger"]:
+    """lockstep: on_message triggers of `topic`, wildcard topics included"""
+    found = local_triggers.get(topic)
+    if found is None:
+        tokens = topic.split(".")
+        found = local_triggers[topic] = [
+            trigger for pattern, pattern_triggers in message_triggers.items()
+            if transports.subject_matches(pattern.split("."), tokens) for trigger in pattern_triggers]
+    return found
+
+def now() -> float:
+    """current time in seconds: the clock source (see use_clock), or the simulated clock in lockstep mode"""
+    return sim_time if lockstep else clock.time()
+
 def nats_connection() -> nats.NATS:
     return nc
 
 async def publish(topic : str, msg : msgspec.Struct) -> None:
-    await nats_connection().publish(topic,encoder.encode(msg))
+    codec = topic_codecs.get(topic, default_codec)
+    if batcher is not None and not lockstep:
+        # queued until the batch goes out, so its own bytes instead of a pooled buffer
+        if metrics_enabled:
+            started = time.perf_counter()
+            data = encode(msg, codec)
+            encoded = time.perf_counter()
+            await batcher.add(topic, data, codec)
+            measured = get_topic_metrics(topic)
+            measured.encode.record(encoded - started)
+            measured.publish.record(time.perf_counter() - encoded)
+        else:
+            await batcher.add(topic, encode(msg, codec), codec)
+        return
+    buffer = buffers.pop() if buffers else bytearray()
+    try:
+        if metrics_enabled:
+            started = time.perf_counter()
+            encode_into(msg, buffer, codec)
+            encoded = time.perf_counter()
+            await send(topic, buffer, codec)
+            measured = get_topic_metrics(topic)
+            measured.encode.record(encoded - started)
+            measured.publish.record(time.perf_counter() - encoded)
+        else:
+            encode_into(msg, buffer, codec)
+            await send(topic, buffer, codec)
+    finally:
+        buffers.append(buffer)
+
+async def send(topic : str, data : bytearray, codec : str) -> None:
+    if lockstep:
+        for function, message_type in local_routes(topic):
+            if message_type is None:
+                await function(topic, bytes(data), codec)
+            elif metrics_enabled:
+                await deliver_measured(topic, function, message_type, data, codec)
+            else:
+                await function(decode(data, message_type, codec))
+        for trigger in matching_triggers(topic):
+            await trigger.notify()
+    else:
+        # nats copies the payload before the first await, the buffer can be reused afterwards
+        await nats_connection().publish(topic, data, headers=codec_headers[codec])
+
+codec_headers = {codec: {CODEC_HEADER: codec} for codec in CODECS} # shared, never modified
+
+"""
+Publishes several `(topic, msg)` at once: they are encoded and handed to the
+transport in a single call (see transports.publish_many), which on nats saves
+most of the per message overhead of `publish`. Order is kept, also with
+batching on: what `publish` queued before goes out first, in the same call.
+Useful when a node publishes many messages per tick, like the simulator with
+a fleet
+"""
+async def publish_many(messages : typing.Iterable[tuple[str,msgspec.Struct]]) -> None:
+    batch = []
+    for topic, msg in messages:
+        codec = topic_codecs.get(topic, default_codec)
+        batch.append((topic, encode(msg, codec), codec))
+    if batcher is not None and not lockstep:
+        await batcher.flush(batch)
+    else:
+        await send_many(batch)
+
+async def send_many(batch : list[tuple[str,bytes,str]]) -> None:
+    if lockstep:
+        for topic, data, codec in batch:
+            await send(topic, data, codec)
+    elif batch:
+        await transports.publish_many(nats_connection(),
+                                      [(topic, data, codec_headers[codec]) for topic, data, codec in batch])
+
+"""
+Outgoing batching: after `batch_publishing(...)`, `publish` only encodes and
+queues the message, and the queue goes out with one `send_many` when
+- `max_messages` are queued (size policy), or
+- `max_delay_s` went by since the first queued message (latency policy).
+  With 0 (default) the queue is sent at the end of the current event loop
+  turn, so everything one tick or callback publishes leaves together;
+  with None only the size policy and `flush` send it
+- `await flush()` is called (explicit policy)
+Lockstep delivers right away as always. `batch_publishing(enabled=False)` turns it off
+"""
+class Batcher:
+
+    def __init__(self, max_messages : typing.Optional[int], max_delay_s : typing.Optional[float]) -> None:
+        self.max_messages = max_messages
+        self.max_delay_s = max_delay_s
+        self.pending : list[tuple[str,bytes,str]] = []
+        self.handle : typing.Optional[asyncio.Handle] = None # scheduled latency flush
+        self.batches = 0
+
+    async def add(self, topic : str, data : bytes, codec : str) -> None:
+        self.pending.append((topic, data, codec))
+        if self.max_messages is not None and len(self.pending) >= self.max_messages:
+            await self.flush()
+        elif self.handle is None and self.max_delay_s is not None:
+            loop = asyncio.get_running_loop()
+            if self.max_delay_s > 0:
+                self.handle = loop.call_later(self.max_delay_s, self.flush_later)
+            else:
+                self.handle = loop.call_soon(self.flush_later)
+
+    def flush_later(self) -> None:
+        self.handle = None
+        asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self, extra : typing.Sequence[tuple[str,bytes,str]] = ()) -> None:
+        """sends the queue, followed by `extra` (sent right away, not queued)"""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if not self.pending and not extra:
+            return
+        batch, self.pending = self.pending + list(extra), []
+        self.batches += 1
+        await send_many(batch)
+
+batcher : typing.Optional[Batcher] = None
+
+def batch_publishing(max_messages : typing.Optional[int] = None,
+                     max_delay_s : typing.Optional[float] = 0.0,
+                     enabled : bool = True) -> None:
+    global batcher  # noqa: PLW0603
+    if max_messages is not None and max_messages < 1:
+        raise Exception("max_messages has to be at least 1")
+    batcher = Batcher(max_messages, max_delay_s) if enabled else None
+
+async def flush() -> None:
+    """sends what the batcher has queued (does nothing without batching)"""
+    if batcher is not None:
+        await batcher.flush()
+
+"""
+Latency instrumentation: with metrics enabled every subscription and publish
+records how long it spends queued, decoding, in the handler, encoding and
+publishing, plus the age of messages with a `timestamp` field, into
+histograms (see metrics.py). Every `interval_s` a `metrics.NodeMetrics`
+with the summaries since the previous one goes out on `node.<name>.metrics`.
+Disabled, the only cost is one `if` per message.
+"""
+def enable_metrics(interval_s : float = 1.0) -> None:
+    global metrics_enabled  # noqa: PLW0603
+    if metrics_enabled:
+        return
+    metrics_enabled = True
+
+    @timer(interval_s)
+    async def publish_metrics() -> None:
+        report = metrics.NodeMetrics(
+            node = node_name,
+            timestamp = now(),
+            topics = {topic: measured.summaries() for topic, measured in topic_metrics.items()},
+            timers = dict(timer_stats),
+            dropped = dict(dropped_messages),
+        )
+        topic_metrics.clear()
+        await publish(f"node.{node_name}.metrics", report)
+
+def get_topic_metrics(topic : str) -> metrics.TopicMetrics:
+    if topic not in topic_metrics:
+        topic_metrics[topic] = metrics.TopicMetrics()
+    return topic_metrics[topic]
+
+async def deliver_measured(topic        : str,
+                           function     : FunctionType,
+                           message_type : type[msgspec.Struct],
+                           data         : bytes,
+                           codec        : str,
+                           received_at  : typing.Optional[float] = None) -> None:
+    started = time.perf_counter()
+    msg = decode(data, message_type, codec)
+    decoded = time.perf_counter()
+    await function(msg)
+    record_delivery(topic, msg, started, decoded, received_at)
+
+def record_delivery(topic       : str,
+                    msg         : msgspec.Struct,
+                    started     : float,
+                    decoded     : float,
+                    received_at : typing.Optional[float] = None) -> None:
+    measured = get_topic_metrics(topic)
+    measured.handler.record(time.perf_counter() - decoded)
+    measured.decode.record(decoded - started)
+    if received_at is not None:
+        measured.queue.record(started - received_at)
+    age = metrics.message_age(msg, now())
+    if age is not None:
+        measured.age.record(age)
+
+"""
+Snapshots: for messages that rarely change (like the cone map). The
+publisher calls `publish_snapshot` as often as it likes; only when the content
+changes does the version go up. Every call announces the current
+`SnapshotInfo` on `<topic>.version`, which is tiny, and the full message is
+served on request on `<topic>.get`, so each subscriber gets it once per change
+and never twice. Subscribers use `@subscribe_snapshot`: the callback only
+runs when the content changes, and a node started late asks for it on start().
+"""
+SNAPSHOT_TIMEOUT = 2.0 # seconds to wait for a `<topic>.get` reply
+
+class SnapshotInfo(msgspec.Struct):
+    version : int
+    digest : str # hash of the json encoding, the same content always has the same digest
+
+class Snapshot(msgspec.Struct):
+    info : SnapshotInfo
+    msg : msgspec.Struct
+    data : dict[str,bytes] # encoded msg per codec, filled on demand
+
+class SnapshotSubscription(msgspec.Struct):
+    digest : typing.Optional[str] = None # digest of the last snapshot handed to the callback
+    fetching : bool = False
+
+snapshots : dict[str,Snapshot] = {} # snapshots this node publishes, by topic
+
+def snapshot_data(snapshot : Snapshot, codec : str) -> bytes:
+    if codec not in snapshot.data:
+        snapshot.data[codec] = encode(snapshot.msg, codec)
+    return snapshot.data[codec]
+
+async def publish_snapshot(topic : str, msg : msgspec.Struct) -> None:
+    """
+    publishes `msg` as the current snapshot of `topic`. The content is only
+    hashed when `msg` is a different object from the last call, so pass a new
+    message when it changes instead of modifying it in place
+    """
+    snapshot = snapshots.get(topic)
+    if snapshot is None or snapshot.msg is not msg:
+        digest = hashlib.blake2b(encode(msg), digest_size=16).hexdigest()
+        if snapshot is not None and snapshot.info.digest == digest:
+            snapshot.msg = msg
+        else:
+            version = snapshot.info.version + 1 if snapshot is not None else 1
+            if snapshot is None and not lockstep:
+                await serve_snapshot(topic)
+            snapshot = snapshots[topic] = Snapshot(SnapshotInfo(version, digest), msg, {})
+    await publish(f"{topic}.version", snapshot.info)
+
+async def serve_snapshot(topic : str) -> None:
+    async def reply(request) -> None:
+        snapshot = snapshots[topic]
+        codec = topic_codecs.get(topic, default_codec)
+        await nats_connection().publish(request.reply, snapshot_data(snapshot, codec), headers={
+            CODEC_HEADER: codec,
+            "version": str(snapshot.info.version),
+            "digest": snapshot.info.digest,
+        })
+    subscriptions.append(await nats_connection().subscribe(f"{topic}.get", cb = reply))
+
+async def fetch_snapshot(topic : str, message_type : type[msgspec.Struct]) \
+        -> typing.Optional[tuple[msgspec.Struct,SnapshotInfo]]:
+    """asks the publisher of `topic` for its snapshot, None if nobody answers"""
+    if lockstep:
+        snapshot = snapshots.get(topic)
+        if snapshot is None:
+            return None
+        codec = topic_codecs.get(topic, default_codec)
+        return decode(snapshot_data(snapshot, codec), message_type, codec), snapshot.info
+    try:
+        reply = await nats_connection().request(f"{topic}.get", b"", timeout = SNAPSHOT_TIMEOUT)
+    except (nats.errors.TimeoutError, nats.errors.NoRespondersError):
+        return None
+    headers = reply.headers or {}
+    info = SnapshotInfo(version = int(headers.get("version", 0)), digest = headers.get("digest", ""))
+    return decode(reply.data, message_type, headers.get(CODEC_HEADER, "json")), info
+
+"""
+decorator to receive the snapshot published on `topic`, only when it changes
+example:
+```
+@subscribe_snapshot("simulator.cones",Cones)
+def callback(msg : Cones):
+[...]
+```
+"""
+def subscribe_snapshot(topic : str, message_type : type[msgspec.Struct]) -> FunctionType:
+    assert issubclass(message_type,msgspec.Struct)
+    if "/" in topic:
+        raise Exception(TOPIC_NAME_ERROR)
+    def decorator(function : FunctionType) -> None:
+        subscription = SnapshotSubscription()
+
+        async def refresh(digest : typing.Optional[str] = None) -> None:
+            if subscription.fetching or (digest is not None and digest == subscription.digest):
+                return
+            subscription.fetching = True
+            try:
+                fetched = await fetch_snapshot(topic, message_type)
+            finally:
+                subscription.fetching = False
+            if fetched is not None and fetched[1].digest != subscription.digest:
+                subscription.digest = fetched[1].digest
+                await function(fetched[0])
+
+        async def on_version(info : SnapshotInfo) -> None:
+            await refresh(info.digest)
+
+        subscribe(f"{topic}.version", SnapshotInfo)(on_version)
+        on_start(refresh) # so a node started late asks for it
+    return decorator
+
+if os.environ.get("STARTING_PACK_CLOCK") or os.environ.get("STARTING_PACK_TIME_SCALE"):
+    use_clock(os.environ.get("STARTING_PACK_CLOCK") or "wall",
+              float(os.environ.get("STARTING_PACK_TIME_SCALE") or 1.0))
+
+if os.environ.get("STARTING_PACK_METRICS"):
+    enable_metrics(float(os.environ["STARTING_PACK_METRICS"]))
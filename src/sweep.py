@@ -0,0 +1,232 @@
+"""Barrido de parámetros de un controlador con episodios headless en paralelo.
+
+Uso:
+  python sweep.py --controller controller K_STEER=0.8,1.2,1.6 TARGET_SPEED=4,6,8
+  python sweep.py --controller controller2 --random 64 K_STEER=0.5:2 BRAKE_DISTANCE=1:3
+
+Cada parámetro es una constante del módulo del controlador (`TARGET_SPEED`,
+`K_STEER`, `K_SPEED`, `LATERAL_OFFSET_M`, `BRAKE_DISTANCE`, `MIN_PROGRESS`, `LOOKAHEAD_GAIN`...):
+- `NOMBRE=a,b,c`: valores de la rejilla (todas las combinaciones)
+- `NOMBRE=min:max`: intervalo, solo con `--random N` (N muestras uniformes)
+
+Cada configuración es un episodio simulador + controlador en lockstep (como
+headless.py) en su propio proceso: el pool arranca un intérprete nuevo por
+episodio, así ningún estado global de un nodo pasa al siguiente. Los episodios
+son independientes, así que el barrido escala con el número de núcleos.
+Cada fila se imprime (y se añade a `--out`, en CSV) según acaba su episodio.
+"""
+
+import argparse
+import asyncio
+import csv
+import importlib
+import itertools
+import math
+import os
+import random
+import sys
+import time
+import types
+from multiprocessing import Pool
+from typing import Dict, List, NamedTuple
+
+
+class EpisodeResult(NamedTuple):
+    laps: int  # vueltas completas alrededor del centro del circuito
+    lap_time: float  # s, media de las vueltas completas (nan si ninguna)
+    min_clearance: float  # m, distancia mínima del coche a un cono
+    hits: int  # conos tocados (eventos hit de `simulator.events`)
+    off_track: int  # salidas del circuito (eventos off_track)
+    effort: float  # RMS de (throttle, steer) por mensaje de control
+    steer_rate: float  # RMS del cambio de steer entre mensajes, por segundo
+    mean_speed: float  # m/s
+    wall_s: float  # s reales que tardó el episodio
+
+
+def run_job(job):
+    """`run_episode` para Pool.imap_unordered: devuelve también los parámetros."""
+    controller, params, duration = job
+    return params, run_episode(controller, params, duration)
+
+
+def parameter_owner(module, name: str):
+    """Módulo que define el parámetro `name` del controlador: el propio, o un
+    módulo del proyecto que importa y del que lee sus constantes (pure_pursuit.py)."""
+    if hasattr(module, name):
+        return module
+    here = os.path.dirname(os.path.abspath(module.__file__))
+    for value in vars(module).values():
+        path = getattr(value, "__file__", None)
+        if isinstance(value, types.ModuleType) and path and \
+                os.path.dirname(os.path.abspath(path)) == here and hasattr(value, name):
+            return value
+    raise AttributeError(f"{module.__name__} no tiene el parámetro {name}")
+
+
+def run_episode(controller: str, params: Dict[str, float], duration: float) -> EpisodeResult:
+    """Un episodio completo; se ejecuta en un proceso recién creado."""
+    t0 = time.perf_counter()
+    import starting_pack
+    from starting_pack import subscribe
+    from messages import VehicleState, Controls, TrackEvents
+    from cone_index import ConeIndex
+
+    # El simulador antes que el controlador, igual que en headless.py; con los
+    # eventos de contacto y salida, que cuentan en el resultado
+    os.environ["TRACK_EVENTS"] = "1"
+    simulator = importlib.import_module("simulator")
+    module = importlib.import_module(controller)
+    for name, value in params.items():
+        setattr(parameter_owner(module, name), name, value)
+
+    # Periodo del control_loop del controlador, para pasar el cambio de steer a /s;
+    # si no va en un @timer se ejecuta con cada estado, al ritmo del simulador
+    period = next((interval for interval, function, _ in starting_pack.timers
+                   if function.__module__ == module.__name__), simulator.DT)
+
+    index = ConeIndex.from_cones(simulator.cones)
+    cx, cy = float(index.xs.mean()), float(index.ys.mean())
+
+    # Monitor: se suscribe como un nodo más a estado y controles
+    track = {"angle": None, "turned": 0.0, "lap_start": 0.0, "laps": [],
+             "clearance": math.inf, "hits": 0, "off_track": 0, "speed": 0.0, "states": 0,
+             "effort": 0.0, "rate": 0.0, "controls": 0, "last_steer": None}
+
+    @subscribe("simulator.state", VehicleState)
+    async def on_state(s: VehicleState):
+        angle = math.atan2(s.y - cy, s.x - cx)
+        if track["angle"] is not None:
+            track["turned"] += (angle - track["angle"] + math.pi) % (2 * math.pi) - math.pi
+            if abs(track["turned"]) >= 2 * math.pi:
+                track["turned"] -= math.copysign(2 * math.pi, track["turned"])
+                track["laps"].append(s.timestamp - track["lap_start"])
+                track["lap_start"] = s.timestamp
+        track["angle"] = angle
+        nearest = index.nearest(s.x, s.y)
+        if nearest >= 0:
+            clearance = math.hypot(float(index.xs[nearest]) - s.x, float(index.ys[nearest]) - s.y)
+            track["clearance"] = min(track["clearance"], clearance)
+        track["speed"] += s.speed
+        track["states"] += 1
+
+    @subscribe("simulator.events", TrackEvents)
+    async def on_events(msg: TrackEvents):
+        for event in msg.events:
+            if event.kind in ("hit", "off_track"):
+                track["hits" if event.kind == "hit" else "off_track"] += 1
+
+    @subscribe("vehicle.controls", Controls)
+    async def on_controls(c: Controls):
+        track["effort"] += c.throttle ** 2 + c.steer ** 2
+        if track["last_steer"] is not None:
+            track["rate"] += ((c.steer - track["last_steer"]) / period) ** 2
+        track["last_steer"] = c.steer
+        track["controls"] += 1
+
+    asyncio.run(starting_pack.run_lockstep(duration))
+
+    laps = track["laps"]
+    controls = max(1, track["controls"])
+    return EpisodeResult(
+        laps=len(laps),
+        lap_time=sum(laps) / len(laps) if laps else math.nan,
+        min_clearance=track["clearance"],
+        hits=track["hits"],
+        off_track=track["off_track"],
+        effort=math.sqrt(track["effort"] / controls),
+        steer_rate=math.sqrt(track["rate"] / max(1, controls - 1)),
+        mean_speed=track["speed"] / max(1, track["states"]),
+        wall_s=time.perf_counter() - t0,
+    )
+
+
+# ============================
+#   Espacio de búsqueda
+# ============================
+
+def parse_space(specs: List[str]):
+    """`NOMBRE=a,b,c` -> lista de valores; `NOMBRE=min:max` -> (min, max)."""
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if not values:
+            raise SystemExit(f"parámetro mal escrito: {spec} (NOMBRE=a,b,c o NOMBRE=min:max)")
+        if ":" in values:
+            lo, hi = values.split(":")
+            space[name] = (float(lo), float(hi))
+        else:
+            space[name] = [float(v) for v in values.split(",")]
+    return space
+
+
+def configurations(space, samples: int, seed: int) -> List[Dict[str, float]]:
+    if samples:
+        rng = random.Random(seed)
+        return [{name: rng.uniform(*values) if isinstance(values, tuple) else rng.choice(values)
+                 for name, values in space.items()}
+                for _ in range(samples)]
+    if any(isinstance(values, tuple) for values in space.values()):
+        raise SystemExit("los intervalos min:max solo valen con --random N")
+    names = list(space)
+    return [dict(zip(names, combo)) for combo in itertools.product(*space.values())]
+
+
+# ============================
+#   Ejecución
+# ============================
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("params", nargs="*", help="NOMBRE=a,b,c o NOMBRE=min:max")
+    parser.add_argument("--controller", default="controller", help="módulo del controlador")
+    parser.add_argument("--duration", type=float, default=120.0, help="segundos simulados por episodio")
+    parser.add_argument("--random", type=int, default=0, metavar="N",
+                        help="N configuraciones aleatorias en lugar de la rejilla")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="procesos en paralelo")
+    parser.add_argument("--out", default=None, help="CSV donde añadir los resultados")
+    args = parser.parse_args()
+
+    space = parse_space(args.params)
+    configs = configurations(space, args.random, args.seed)
+    names = list(space)
+    columns = names + list(EpisodeResult._fields)
+
+    out = open(args.out, "a", newline="") if args.out else None
+    writer = csv.writer(out) if out else None
+    if writer and out.tell() == 0:
+        writer.writerow(columns)
+
+    print(" ".join(f"{c:>13}" for c in columns))
+    t0 = time.perf_counter()
+    results = []
+    # Un proceso nuevo por episodio: los nodos se configuran con variables de módulo
+    # (maxtasksperchild de multiprocessing.Pool, ProcessPoolExecutor solo lo tiene desde 3.11)
+    jobs = [(args.controller, params, args.duration) for params in configs]
+    with Pool(args.workers, maxtasksperchild=1) as pool:
+        for params, result in pool.imap_unordered(run_job, jobs):
+            results.append((params, result))
+            row = [params[name] for name in names] + list(result)
+            print(" ".join(f"{v:>13.4g}" for v in row))
+            sys.stdout.flush()
+            if writer:
+                writer.writerow(row)
+                out.flush()
+    wall = time.perf_counter() - t0
+    if out:
+        out.close()
+
+    episodes = sum(r.wall_s for _, r in results)
+    print(f"[LOG] {len(results)} episodios en {wall:.1f} s con {args.workers} procesos "
+          f"({episodes / wall:.2f} episodios en paralelo de media)")
+    finished = [(p, r) for p, r in results if r.laps]
+    if finished:
+        params, best = min(finished, key=lambda pr: pr[1].lap_time)
+        print(f"[LOG] Mejor vuelta: {best.lap_time:.2f} s con {params} "
+              f"(distancia mínima a un cono {best.min_clearance:.2f} m, "
+              f"{best.hits} conos tocados, {best.off_track} salidas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Tests of the shm transport with a second process (run with `python -m pytest -q` from src/)."""
+
+import asyncio
+import os
+import subprocess
+import sys
+import uuid
+import transports
+
+# The second process: its very first message is a request, sent right after
+# connecting; it prints the answer and how long it took
+PEER = """
+import asyncio, sys, time, transports
+async def main():
+    connection = await transports.connect(sys.argv[1], None)
+    started = time.monotonic()
+    reply = await connection.request("test.first", b"hello", timeout = 2.0)
+    print(bytes(reply.data).decode(), time.monotonic() - started)
+asyncio.run(main())
+"""
+
+
+def test_shm_first_message_of_late_peer():
+    url = f"shm://test-{uuid.uuid4().hex[:8]}?size=1"
+
+    async def main():
+        connection = await transports.connect(url, None)
+        received = []
+
+        async def on_first(msg):
+            received.append(bytes(msg.data))
+            await connection.publish(msg.reply, b"back")
+
+        await connection.subscribe("test.first", cb = on_first)
+        await asyncio.sleep(0.1) # the reader is idle when the peer joins
+        peer = subprocess.Popen([sys.executable, "-c", PEER, url], cwd = os.path.dirname(__file__),
+                                stdout = subprocess.PIPE, text = True)
+        while peer.poll() is None:
+            await asyncio.sleep(0.01)
+        await connection.close()
+        return peer.returncode, peer.stdout.read().split(), received
+
+    returncode, output, received = asyncio.run(main())
+    assert returncode == 0
+    assert received == [b"hello"]
+    answer, elapsed = output
+    assert answer == "back"
+    # the JOINED datagram makes the reader attach at once, not at its next periodic refresh
+    assert float(elapsed) < transports.IDLE_CHECK_S
@@ -0,0 +1,270 @@
+import math
+import numpy as np
+
+# ============================
+#   Parámetros de la estela
+# ============================
+
+TRAIL_SECONDS = 120.0  # s de trayectoria que se conservan
+SAMPLE_DT = 0.1  # s, como mucho una muestra por coche cada SAMPLE_DT
+
+
+class Trajectories:
+
+    """
+    Últimas posiciones de N vehículos en buffers circulares de NumPy de
+    capacidad fija: una fila por coche en `x`, `y` y `t`.
+
+    `total[i]` cuenta las muestras añadidas al coche i desde el inicio; de
+    ahí salen la posición de escritura (total % capacity) y cuántas son
+    válidas. Solo un hilo escribe (`append`); un lector en otro hilo puede
+    ver a lo sumo la muestra más antigua a medio sobrescribir.
+    """
+
+    def __init__(self, n: int, seconds: float = TRAIL_SECONDS, sample_dt: float = SAMPLE_DT):
+        self.seconds = seconds
+        self.sample_dt = sample_dt
+        self.capacity = max(2, math.ceil(seconds / sample_dt))
+        self.x = np.zeros((n, self.capacity))
+        self.y = np.zeros((n, self.capacity))
+        self.t = np.full((n, self.capacity), -np.inf)
+        self.total = np.zeros(n, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.total)
+
+    def grown(self, n: int) -> "Trajectories":
+        """Copia con sitio para n coches (los existentes conservan su estela)."""
+        out = Trajectories(n, self.seconds, self.sample_dt)
+        k = len(self)
+        out.x[:k] = self.x
+        out.y[:k] = self.y
+        out.t[:k] = self.t
+        out.total[:k] = self.total
+        return out
+
+    def append(self, i: int, x: float, y: float, t: float) -> bool:
+        """Guarda la muestra si es la primera de su franja de SAMPLE_DT; dice si la ha guardado."""
+        total = self.total[i]
+        if total:
+            # Una muestra por franja de SAMPLE_DT (más robusto al jitter que comparar diferencias)
+            last = self.t[i, (total - 1) % self.capacity]
+            if t // self.sample_dt == last // self.sample_dt:
+                return False
+        head = total % self.capacity
+        self.x[i, head] = x
+        self.y[i, head] = y
+        self.t[i, head] = t
+        self.total[i] = total + 1  # al final: la muestra solo es visible ya escrita
+        return True
+
+    def ordered(self):
+        """(x, y, t) de cada coche de la más antigua a la más reciente, shape (N, capacity)."""
+        cols = (self.total % self.capacity)[:, None] + np.arange(self.capacity)
+        cols %= self.capacity
+        rows = np.arange(len(self))[:, None]
+        return self.x[rows, cols], self.y[rows, cols], self.t[rows, cols]
+
+
+def cell_key(cx: int, cy: int) -> int:
+    """Celda de pantalla (cx, cy) como un único entero."""
+    return (cx << 32) + (cy & 0xFFFFFFFF)
+
+
+class TrailLines:
+
+    """
+    Estelas ya reducidas a puntos de pantalla, en el formato que dibuja el
+    visualizador: una fila por coche en `x` e `y`, y `x.ravel()`, `y.ravel()`
+    (vistas, sin copia) son la línea de toda la flota.
+
+    Cada fila es un buffer circular de `slots` huecos más dos columnas: una
+    copia del hueco 0, para que la línea siga del último hueco al primero, y
+    un NaN que la corta antes del coche siguiente. Los huecos vacíos o
+    borrados son NaN y también la cortan.
+    """
+
+    def __init__(self, n: int, slots: int):
+        self.slots = slots
+        self.x = np.full((n, slots + 2), np.nan)
+        self.y = np.full((n, slots + 2), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def grown(self, n: int) -> "TrailLines":
+        """Copia con sitio para n coches."""
+        out = TrailLines(n, self.slots)
+        out.x[:len(self)] = self.x
+        out.y[:len(self)] = self.y
+        return out
+
+    def copy(self) -> "TrailLines":
+        return self.grown(len(self))
+
+    def write(self, i: int, slot: int, x: float, y: float) -> None:
+        self.x[i, slot] = x
+        self.y[i, slot] = y
+        if slot == 0:
+            self.x[i, self.slots] = x
+            self.y[i, self.slots] = y
+
+    def apply(self, log) -> None:
+        """Repite en esta copia las escrituras (coche, hueco, x, y) de `log`, en orden."""
+        if not log:
+            return
+        rows, slots, xs, ys = (np.array(v) for v in zip(*log))
+        # Si un hueco se escribe varias veces, vale la última
+        key = rows * (self.slots + 2) + slots
+        _, last = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - last
+        rows, slots = rows[last], slots[last]
+        self.x[rows, slots] = xs[last]
+        self.y[rows, slots] = ys[last]
+        first = slots == 0
+        self.x[rows[first], self.slots] = xs[last][first]
+        self.y[rows[first], self.slots] = ys[last][first]
+
+
+class ScreenTrails:
+
+    """
+    Decimado incremental de las estelas de `Trajectories` a puntos de pantalla.
+
+    Cada muestra nueva de un coche (`add`) solo se guarda si cae en otra celda
+    de pantalla de lado `step` que la anterior guardada, y si el coche ya tenía
+    una visita anterior a esa celda, esa se borra (NaN): de cada celda solo se
+    dibuja la visita más reciente, así que los puntos dependen de lo que ocupa
+    la estela en pantalla y no de las muestras. Cada muestra cuesta lo mismo
+    por larga que sea la ejecución y cada frame dibuja directamente `lines`;
+    solo al cambiar el zoom (`rebuild`) se recalcula todo desde las muestras.
+
+    El buffer de cada coche tiene un hueco más que `Trajectories`: el que
+    sigue al más reciente siempre está vacío y corta la línea entre el punto
+    más reciente y el más antiguo. Los puntos de más de `seconds` se borran.
+
+    `log` apunta las escrituras en `lines` desde que se vació, para repetirlas
+    en otra copia (`TrailLines.apply`); es None cuando `lines` se ha sustituido
+    entera (`grow`, `rebuild`) y otra copia tiene que copiarla toda.
+    """
+
+    def __init__(self, n: int, step: float, capacity: int, seconds: float = TRAIL_SECONDS):
+        self.step = step
+        self.seconds = seconds
+        self.slots = capacity + 1
+        self.lines = TrailLines(n, self.slots)
+        self.log = []
+        self.clear_state(n)
+
+    def __len__(self) -> int:
+        return len(self.head)
+
+    def clear_state(self, n: int) -> None:
+        self.t = np.full((n, self.slots), -np.inf)  # instante de cada hueco
+        self.keys = np.zeros((n, self.slots), dtype=np.int64)  # celda de cada hueco
+        self.head = [0] * n  # siguiente hueco a escribir (siempre vacío)
+        self.oldest = [0] * n  # hueco más antiguo aún en uso; == head: ninguno
+        self.last = [None] * n  # celda del último punto guardado
+        self.cells = [{} for _ in range(n)]  # celda -> hueco de su visita más reciente
+
+    def grow(self, n: int) -> None:
+        """Sitio para n coches (los existentes conservan su estela)."""
+        k = len(self)
+        t, keys = self.t, self.keys
+        self.lines = self.lines.grown(n)
+        self.log = None
+        self.t = np.full((n, self.slots), -np.inf)
+        self.t[:k] = t
+        self.keys = np.zeros((n, self.slots), dtype=np.int64)
+        self.keys[:k] = keys
+        self.head += [0] * (n - k)
+        self.oldest += [0] * (n - k)
+        self.last += [None] * (n - k)
+        self.cells += [{} for _ in range(n - k)]
+
+    def write(self, i: int, slot: int, x: float, y: float) -> None:
+        self.lines.write(i, slot, x, y)
+        if self.log is not None:
+            self.log.append((i, slot, x, y))
+
+    def drop(self, i: int) -> None:
+        """Borra el hueco más antiguo del coche i."""
+        slot = self.oldest[i]
+        cells = self.cells[i]
+        key = int(self.keys[i, slot])
+        if cells.get(key) == slot:
+            del cells[key]
+        self.write(i, slot, np.nan, np.nan)
+        self.oldest[i] = (slot + 1) % self.slots
+
+    def add(self, i: int, x: float, y: float, t: float) -> None:
+        """Una muestra nueva del coche i (la más reciente)."""
+        # Fuera los puntos de más de `seconds`
+        while self.oldest[i] != self.head[i] and self.t[i, self.oldest[i]] < t - self.seconds:
+            self.drop(i)
+
+        key = cell_key(math.floor(x / self.step), math.floor(y / self.step))
+        if key == self.last[i]:
+            return  # misma celda que el último punto guardado
+        self.last[i] = key
+
+        # La visita anterior a la misma celda deja de dibujarse
+        cells = self.cells[i]
+        previous = cells.get(key)
+        if previous is not None:
+            self.write(i, previous, np.nan, np.nan)
+
+        slot = self.head[i]
+        self.write(i, slot, x, y)
+        self.t[i, slot] = t
+        self.keys[i, slot] = key
+        cells[key] = slot
+        self.head[i] = (slot + 1) % self.slots
+        if self.head[i] == self.oldest[i]:
+            self.drop(i)  # buffer lleno: el siguiente hueco tiene que quedar vacío
+
+    def rebuild(self, trails: Trajectories, step: float) -> None:
+        """Vuelve a decimar todas las estelas con un nuevo `step` (cambio de zoom)."""
+        self.step = step
+        n = len(trails)
+        self.lines = TrailLines(n, self.slots)
+        self.log = None
+        self.clear_state(n)
+        xs, ys, ts = trails.ordered()
+        valid = np.isfinite(ts)
+        valid &= ts >= ts.max(axis=1, keepdims=True) - self.seconds
+        if n == 0 or not valid.any():
+            return
+        m = xs.shape[1]
+        qx = np.floor(xs / step).astype(np.int64)
+        qy = np.floor(ys / step).astype(np.int64)
+
+        # 1) Quitar muestras seguidas en la misma celda (las que no guardaría `add`)
+        keep = valid.copy()
+        keep[:, 1:] &= (qx[:, 1:] != qx[:, :-1]) | (qy[:, 1:] != qy[:, :-1]) | ~valid[:, :-1]
+        idx = np.flatnonzero(keep)
+        rows = idx // m
+        counts = np.bincount(rows, minlength=n)
+        slots = np.arange(len(idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = (qx.ravel()[idx] << 32) + (qy.ravel()[idx] & 0xFFFFFFFF)
+
+        # 2) De cada (coche, celda) solo se dibuja la última visita
+        order = np.lexsort((-np.arange(len(idx)), keys, rows))
+        first = np.ones(len(idx), dtype=bool)
+        first[1:] = (rows[order][1:] != rows[order][:-1]) | (keys[order][1:] != keys[order][:-1])
+        live = np.zeros(len(idx), dtype=bool)
+        live[order[first]] = True
+
+        # Los puntos de cada coche desde el hueco 0, en orden
+        self.t[rows, slots] = ts.ravel()[idx]
+        self.keys[rows, slots] = keys
+        self.lines.x[rows[live], slots[live]] = xs.ravel()[idx[live]]
+        self.lines.y[rows[live], slots[live]] = ys.ravel()[idx[live]]
+        self.lines.x[:, self.slots] = self.lines.x[:, 0]
+        self.lines.y[:, self.slots] = self.lines.y[:, 0]
+        ends = np.cumsum(counts)
+        for i in np.flatnonzero(counts).tolist():
+            self.head[i] = int(counts[i])
+            self.last[i] = int(keys[ends[i] - 1])
+        for i, key, slot in zip(rows[live].tolist(), keys[live].tolist(), slots[live].tolist()):
+            self.cells[i][key] = slot
@@ -0,0 +1,650 @@
+"""transports behind starting_pack's start/subscribe/publish.
+
+`connect(url, error_cb)` picks one from the scheme of the url (NATS_URL):
+- `nats://host:port` (or tls://, ws://...): a NATS server, through nats-py
+- `inproc://`: an asyncio bus inside this process, for several nodes
+  imported into one interpreter and run by a single start()
+- `shm://name[?size=MiB]`: shared memory ring buffers, for processes on the
+  same machine that connect with the same name
+
+inproc and shm implement the part of the nats client that starting_pack uses
+(subscribe with wildcards and pending limits, publish with reply and headers,
+request, flush) and deliver `Message`s with the attributes of a nats message,
+so starting_pack and the nodes work the same with any of them.
+"""
+
+import asyncio
+import atexit
+import fcntl
+import os
+import socket
+import struct
+import tempfile
+import time
+import types
+import uuid
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import msgspec
+import nats
+
+# same defaults as nats-py
+DEFAULT_PENDING_MSGS = 512 * 1024
+DEFAULT_PENDING_BYTES = 128 * 1024 * 1024
+
+async def connect(url : str, error_cb):
+    parsed = urlparse(url)
+    if parsed.scheme == "inproc":
+        return InProcessTransport(error_cb)
+    if parsed.scheme == "shm":
+        size = int(parse_qs(parsed.query).get("size", [RING_MB])[0]) << 20
+        transport = SharedMemoryTransport(parsed.netloc or "starting_pack", size, error_cb)
+        transport.connect()
+        return transport
+    await wait_for_server(parsed.hostname or "127.0.0.1", parsed.port or 4222,
+                          float(os.environ.get("STARTING_PACK_CONNECT_TIMEOUT") or CONNECT_TIMEOUT))
+    return await nats.connect(url, error_cb = error_cb)
+
+CONNECT_TIMEOUT = 30.0 # seconds to wait for the nats server to accept connections
+CONNECT_BACKOFF = (0.05, 1.0) # first and longest wait between attempts, doubling in between
+
+async def wait_for_server(host : str, port : int, timeout : float) -> None:
+    """
+    waits until something accepts tcp connections on host:port, retrying with
+    exponential backoff; nats.connect alone would keep retrying every 2 s
+    """
+    deadline = time.monotonic() + timeout
+    delay = CONNECT_BACKOFF[0]
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() + delay > deadline:
+                raise ConnectionRefusedError(f"nothing listening on {host}:{port} after {timeout:g} s") from None
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, CONNECT_BACKOFF[1])
+
+class Message:
+    """what subscription callbacks get, like a nats message"""
+    __slots__ = ("subject", "data", "reply", "headers", "received_at")
+
+    def __init__(self, subject : str, data, reply : str = "", headers : Optional[dict] = None) -> None:
+        self.subject = subject
+        self.data = data
+        self.reply = reply
+        self.headers = headers
+        self.received_at = time.perf_counter()
+
+def subject_matches(pattern : list[str], tokens : list[str]) -> bool:
+    """nats wildcards: `*` matches one token, `>` the rest (at least one)"""
+    for i, token in enumerate(pattern):
+        if token == ">":
+            return len(tokens) > i
+        if i >= len(tokens) or (token != "*" and token != tokens[i]):
+            return False
+    return len(pattern) == len(tokens)
+
+class Subscription:
+    """pending queue plus a task running the callback, one message at a time (like nats-py)"""
+
+    def __init__(self,
+                 transport,
+                 subject             : str,
+                 cb,
+                 pending_msgs_limit  : int = DEFAULT_PENDING_MSGS,
+                 pending_bytes_limit : int = DEFAULT_PENDING_BYTES) -> None:
+        self.transport = transport
+        self.subject = subject
+        self.pattern = subject.split(".")
+        self.cb = cb
+        self.pending_msgs_limit = pending_msgs_limit
+        self.pending_bytes_limit = pending_bytes_limit
+        self.pending : deque[Message] = deque()
+        self.pending_bytes = 0
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def deliver(self, msg : Message) -> None:
+        size = len(msg.data)
+        if len(self.pending) >= self.pending_msgs_limit or \
+                self.pending_bytes + size > self.pending_bytes_limit:
+            self.transport.report(nats.errors.SlowConsumerError(msg.subject, msg.reply, 0, self))
+            self.transport.release(msg)
+            return
+        self.pending.append(msg)
+        self.pending_bytes += size
+        self.wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            msg = self.pending.popleft()
+            self.pending_bytes -= len(msg.data)
+            try:
+                if not self.transport.valid(msg):
+                    self.transport.report(nats.errors.SlowConsumerError(msg.subject, msg.reply, 0, self))
+                    continue
+                await self.cb(msg)
+                if not self.transport.valid(msg):
+                    # overwritten while the callback was reading it
+                    self.transport.report(nats.errors.SlowConsumerError(msg.subject, msg.reply, 0, self))
+            except Exception as error:
+                self.transport.report(error)
+            finally:
+                self.transport.release(msg)
+
+    async def unsubscribe(self) -> None:
+        self.task.cancel()
+        self.transport.remove(self)
+
+class Transport:
+    """subscriptions, routing and request/reply shared by inproc and shm"""
+
+    def __init__(self, error_cb) -> None:
+        self.error_cb = error_cb
+        self.subscriptions : list[Subscription] = []
+        self.routes : dict[str,list[Subscription]] = {} # subject -> matching subscriptions
+        self.replies : dict[str,asyncio.Future] = {} # inbox -> pending request
+        self.msg_class = None # set by starting_pack for nats, every Message has received_at
+
+    async def subscribe(self, subject : str, cb = None, **limits) -> Subscription:
+        subscription = Subscription(self, subject, cb, **limits)
+        self.subscriptions.append(subscription)
+        self.routes.clear()
+        return subscription
+
+    def remove(self, subscription : Subscription) -> None:
+        self.subscriptions.remove(subscription)
+        self.routes.clear()
+
+    def route(self, subject : str) -> list[Subscription]:
+        matching = self.routes.get(subject)
+        if matching is None:
+            tokens = subject.split(".")
+            matching = self.routes[subject] = [subscription for subscription in self.subscriptions
+                                               if subject_matches(subscription.pattern, tokens)]
+        return matching
+
+    async def request(self, subject : str, payload : bytes = b"", timeout : float = 0.5,
+                      headers : Optional[dict] = None) -> Message:
+        inbox = f"_INBOX.{uuid.uuid4().hex}"
+        future = self.replies[inbox] = asyncio.get_running_loop().create_future()
+        try:
+            await self.publish(subject, payload, reply = inbox, headers = headers)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise nats.errors.TimeoutError from None
+        finally:
+            self.replies.pop(inbox, None)
+
+    def reply_to(self, msg : Message) -> bool:
+        """hands `msg` to a pending request if it is an answer to one"""
+        future = self.replies.get(msg.subject)
+        if future is None:
+            return False
+        if not future.done():
+            data = msg.data
+            msg.data = bytes(data) # it outlives the delivery
+            self.release(Message(msg.subject, data))
+            future.set_result(msg)
+        else:
+            self.release(msg)
+        return True
+
+    def report(self, error : Exception) -> None:
+        if self.error_cb is not None:
+            asyncio.get_running_loop().create_task(self.error_cb(error))
+
+    def valid(self, msg : Message) -> bool:
+        return True
+
+    def release(self, msg : Message) -> None:
+        pass
+
+    async def publish_many(self, messages : list[tuple[str,bytes,Optional[dict]]]) -> None:
+        for subject, payload, headers in messages:
+            await self.publish(subject, payload, headers = headers)
+
+    async def flush(self, timeout : float = 10) -> None:
+        await asyncio.sleep(0)
+
+    async def drain(self) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        for subscription in list(self.subscriptions):
+            await subscription.unsubscribe()
+
+"""
+publish_many: several messages (subject, payload, headers) in one call. On
+nats the HPUB commands are built here, with the header block of each headers
+dict encoded once and reused, and go to the client as a single pending write
+and one flush, instead of one publish (validation, headers, flush kick) each.
+It skips subject validation and uses two internals of the nats-py client
+(`_send_command`, `_flush_pending`, there since 2.0, see requirements.txt);
+when the client is not connected or lacks them it falls back to publishing
+them one by one
+"""
+nats_headers : dict[tuple,bytes] = {} # headers dict items -> NATS/1.0 header block
+nats_subjects : dict[str,bytes] = {}
+
+async def publish_many(connection, messages : list[tuple[str,bytes,Optional[dict]]]) -> None:
+    if isinstance(connection, Transport):
+        await connection.publish_many(messages)
+        return
+    if not connection.is_connected or not hasattr(connection, "_send_command") \
+            or not hasattr(connection, "_flush_pending"):
+        for subject, payload, headers in messages:
+            await connection.publish(subject, payload, headers = headers)
+        return
+
+    frames = []
+    out_bytes = 0
+    for subject, payload, headers in messages:
+        if len(payload) > connection.max_payload:
+            raise nats.errors.MaxPayloadError
+        subject_bytes = nats_subjects.get(subject)
+        if subject_bytes is None:
+            if len(nats_subjects) > 65536:
+                nats_subjects.clear()
+            subject_bytes = nats_subjects[subject] = subject.encode()
+        if headers:
+            key = tuple(headers.items())
+            header_block = nats_headers.get(key)
+            if header_block is None:
+                header_block = nats_headers[key] = (
+                    b"NATS/1.0\r\n" + b"".join(f"{k}: {v}\r\n".encode() for k, v in headers.items()) + b"\r\n")
+            frames.append(b"HPUB %b %d %d\r\n%b%b\r\n" % (
+                subject_bytes, len(header_block), len(header_block) + len(payload), header_block, payload))
+        else:
+            frames.append(b"PUB %b %d\r\n%b\r\n" % (subject_bytes, len(payload), payload))
+        out_bytes += len(payload)
+    connection.stats["out_msgs"] += len(frames)
+    connection.stats["out_bytes"] += out_bytes
+    await connection._send_command(b"".join(frames))
+    await connection._flush_pending()
+
+"""
+inproc: publish hands a copy of the payload (starting_pack reuses its
+buffers) to the matching subscriptions of this same process
+"""
+class InProcessTransport(Transport):
+
+    async def publish(self, subject : str, payload : bytes = b"", reply : str = "",
+                      headers : Optional[dict] = None) -> None:
+        msg = Message(subject, bytes(payload), reply, headers)
+        if self.reply_to(msg):
+            return
+        matching = self.route(subject)
+        if not matching and reply.startswith("_INBOX."):
+            future = self.replies.get(reply)
+            if future is not None and not future.done():
+                future.set_exception(nats.errors.NoRespondersError)
+            return
+        for subscription in matching:
+            subscription.deliver(msg)
+
+"""
+shm: every process writes what it publishes to its own ring buffer in shared
+memory (`<name>-<pid>`, single writer) and reads the rings of all the
+processes registered in the `<name>` segment, its own included. Readers
+keep their own position: a slow reader never blocks a writer, if it falls
+too far behind it skips ahead and the lost messages count as dropped.
+
+Ring layout: RING_HEADER bytes with the write position (total bytes written,
+it only grows) and the capacity, then the data. Each record is RECORD
+(record size, subject/reply/headers/payload lengths) followed by those
+fields, padded to ALIGN bytes; a record that would not fit before the end
+leaves a PADDING record and starts again at 0.
+
+Payloads reach the callbacks as memoryviews into the ring (zero copy), so
+they are only valid inside the callback: copy what has to outlive it. A
+message the writer may have overwritten by the time its callback runs (or
+while it ran) is reported as dropped.
+
+A reader with nothing to read marks itself as sleeping in the registry and
+waits on a unix datagram socket; writers send it a byte after publishing.
+A process that joins sends JOINED to every peer, so they attach to its ring
+right away instead of at their next periodic refresh. The rings that exist
+when a process connects are read from their current end (what was written
+before is not for it); a ring that appears later belongs to a process that
+joined afterwards and is read from the start, so its first messages are not
+lost.
+"""
+RING_MB = 16 # default ring size per process
+RING_HEADER = 64
+POSITION = struct.Struct("<QQ") # write position, capacity
+RECORD = struct.Struct("<IHHII") # record size, subject, reply, headers and payload lengths
+ALIGN = 16
+PADDING = 0xFFFF # subject length of padding records
+REGISTRY_SLOTS = 64
+SLOT = struct.Struct("<IB3x") # pid (0 = free), sleeping
+IDLE_CHECK_S = 0.5 # a sleeping reader still wakes up this often to look for new processes
+WAKEUP = b"\0" # datagram after a publish
+JOINED = b"\1" # datagram from a process that just joined: look for new rings
+
+def open_shared(name : str, size : int = 0, track : bool = False) -> shared_memory.SharedMemory:
+    """
+    creates (size > 0) or attaches to a segment. Python's resource tracker
+    would unlink it when this process exits even if others still use it, so
+    only the segments a process owns and must not outlive it stay tracked
+    """
+    segment = shared_memory.SharedMemory(name = name, create = size > 0, size = size)
+    if not track:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+def process_alive(pid : int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Ring:
+    def __init__(self, segment : shared_memory.SharedMemory, pid : int, from_start : bool = False) -> None:
+        self.segment = segment
+        self.buf = segment.buf
+        self.pid = pid
+        self.position, self.capacity = POSITION.unpack_from(self.buf, 0)
+        # a reader starts at the end, or at the first record for a ring created after it joined
+        self.read_position = 0 if from_start else self.position
+
+    def write_position(self) -> int:
+        return POSITION.unpack_from(self.buf, 0)[0]
+
+class RingMessage(Message):
+    __slots__ = ("ring", "position")
+
+class SharedMemoryTransport(Transport):
+
+    def __init__(self, name : str, ring_bytes : int, error_cb) -> None:
+        super().__init__(error_cb)
+        self.name = name
+        self.ring_bytes = (ring_bytes + ALIGN - 1) & -ALIGN
+        self.pid = os.getpid()
+        self.rings : dict[int,Ring] = {} # pid -> ring, this process' own included
+        self.peers : list[tuple[int,int,str]] = [] # (slot offset, pid, socket path)
+        self.headers_cache : dict[bytes,dict] = {}
+        self.subject_bytes : dict[str,bytes] = {}
+        self.subject_names : dict[bytes,str] = {}
+        self.encoded_headers : dict[tuple,bytes] = {}
+        self.wakeup : Optional[asyncio.Future] = None
+        self.joined = False # a JOINED datagram arrived, refresh before reading
+
+    def socket_path(self, pid : int) -> str:
+        return os.path.join(tempfile.gettempdir(), f"{self.name}-{pid}.sock")
+
+    def connect(self) -> None:
+        try:
+            self.registry = open_shared(self.name, REGISTRY_SLOTS * SLOT.size)
+        except FileExistsError:
+            self.registry = open_shared(self.name)
+
+        lock_path = os.path.join(tempfile.gettempdir(), f"{self.name}.lock")
+        with open(lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.slot = None
+            for slot in range(REGISTRY_SLOTS):
+                pid, _ = SLOT.unpack_from(self.registry.buf, slot * SLOT.size)
+                if pid and process_alive(pid) and pid != self.pid:
+                    continue
+                if pid:
+                    self.cleanup(pid) # left behind by a process that died
+                if self.slot is None:
+                    self.slot = slot
+            if self.slot is None:
+                raise RuntimeError(f"no free slots in shared memory transport {self.name}")
+
+            # own ring, tracked so it goes away with this process
+            segment = open_shared(f"{self.name}-{self.pid}", RING_HEADER + self.ring_bytes, track = True)
+            POSITION.pack_into(segment.buf, 0, 0, self.ring_bytes)
+            self.ring = Ring(segment, self.pid)
+            self.write_position = 0
+
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
+            self.socket.bind(self.socket_path(self.pid))
+            SLOT.pack_into(self.registry.buf, self.slot * SLOT.size, self.pid, 0)
+
+        self.sleeping = self.slot * SLOT.size + 4 # byte of our sleeping flag in the registry
+        self.refresh(from_start = False)
+        for _, pid, path in self.peers:
+            if pid != self.pid:
+                try:
+                    self.socket.sendto(JOINED, path)
+                except OSError:
+                    pass # its periodic refresh finds us anyway
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.socket.fileno(), self.on_wakeup)
+        self.reader = loop.create_task(self.read_loop())
+        atexit.register(self.shutdown)
+
+    def cleanup(self, pid : int) -> None:
+        try:
+            open_shared(f"{self.name}-{pid}").unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            os.unlink(self.socket_path(pid))
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self) -> None:
+        SLOT.pack_into(self.registry.buf, self.slot * SLOT.size, 0, 0)
+        self.ring.segment.unlink()
+        self.socket.close()
+        try:
+            os.unlink(self.socket_path(self.pid))
+        except FileNotFoundError:
+            pass
+
+    def refresh(self, from_start : bool = True) -> None:
+        """
+        attaches to the rings of processes that joined, forgets those that
+        left. New rings are read from the start, except on connect
+        """
+        alive = {}
+        for slot in range(REGISTRY_SLOTS):
+            pid, _ = SLOT.unpack_from(self.registry.buf, slot * SLOT.size)
+            if pid:
+                alive[pid] = slot * SLOT.size
+        for pid in list(self.rings):
+            if pid not in alive:
+                del self.rings[pid]
+        for pid in alive:
+            if pid not in self.rings:
+                try:
+                    self.rings[pid] = self.ring if pid == self.pid else \
+                        Ring(open_shared(f"{self.name}-{pid}"), pid, from_start)
+                except FileNotFoundError:
+                    pass # still starting, next time
+        self.peers = [(offset, pid, self.socket_path(pid)) for pid, offset in alive.items()]
+
+    # ============================
+    #   Writing
+    # ============================
+
+    async def publish(self, subject : str, payload : bytes = b"", reply : str = "",
+                      headers : Optional[dict] = None) -> None:
+        self.write(subject, payload, reply, headers)
+        self.commit()
+
+    async def publish_many(self, messages : list[tuple[str,bytes,Optional[dict]]]) -> None:
+        # readers see the whole batch at once and sleepers are woken up once
+        for subject, payload, headers in messages:
+            self.write(subject, payload, "", headers)
+        self.commit()
+
+    def write(self, subject : str, payload : bytes, reply : str, headers : Optional[dict]) -> None:
+        """appends a record to the ring, readers do not see it until commit()"""
+        subject_bytes = self.subject_bytes.get(subject)
+        if subject_bytes is None:
+            if len(self.subject_bytes) > 1024: # reply inboxes are all different
+                self.subject_bytes.clear()
+            subject_bytes = self.subject_bytes[subject] = subject.encode()
+        reply_bytes = reply.encode()
+        if headers:
+            key = tuple(headers.items())
+            headers_bytes = self.encoded_headers.get(key)
+            if headers_bytes is None:
+                if len(self.encoded_headers) > 1024:
+                    self.encoded_headers.clear()
+                headers_bytes = self.encoded_headers[key] = msgspec.msgpack.encode(headers)
+        else:
+            headers_bytes = b""
+
+        length = RECORD.size + len(subject_bytes) + len(reply_bytes) + len(headers_bytes) + len(payload)
+        size = (length + ALIGN - 1) & -ALIGN
+        capacity = self.ring_bytes
+        if size > capacity // 4:
+            raise ValueError(f"message on {subject} too big for the shm ring ({len(payload)} bytes), "
+                             "use a bigger ?size=")
+        buf = self.ring.buf
+        position = self.write_position
+        offset = position % capacity
+        if offset + size > capacity:
+            RECORD.pack_into(buf, RING_HEADER + offset, capacity - offset, PADDING, 0, 0, 0)
+            position += capacity - offset
+            offset = 0
+        at = RING_HEADER + offset
+        RECORD.pack_into(buf, at, size, len(subject_bytes), len(reply_bytes), len(headers_bytes), len(payload))
+        at += RECORD.size
+        for field in (subject_bytes, reply_bytes, headers_bytes, payload):
+            if field:
+                buf[at:at + len(field)] = field
+                at += len(field)
+        self.write_position = position + size
+
+    def commit(self) -> None:
+        """makes the records written so far visible and wakes up sleeping readers"""
+        # the records are complete before readers can see the new position
+        struct.pack_into("<Q", self.ring.buf, 0, self.write_position)
+
+        registry = self.registry.buf
+        for offset, pid, path in self.peers:
+            if registry[offset + 4]:
+                if pid == self.pid:
+                    self.on_wakeup()
+                else:
+                    try:
+                        self.socket.sendto(WAKEUP, path)
+                    except OSError:
+                        pass # gone or its socket is full, it wakes up anyway
+
+    # ============================
+    #   Reading
+    # ============================
+
+    def on_wakeup(self) -> None:
+        try:
+            while True:
+                if self.socket.recv(64) == JOINED:
+                    self.joined = True
+        except (BlockingIOError, OSError):
+            pass
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(None)
+
+    async def read_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        registry = self.registry.buf
+        last_refresh = time.monotonic()
+        while True:
+            if self.joined:
+                self.joined = False
+                self.refresh()
+                last_refresh = time.monotonic()
+            if [ring for ring in list(self.rings.values()) if self.poll(ring)]:
+                await asyncio.sleep(0) # let the subscriptions run
+            else:
+                # say we are going to sleep, then look once more so no write is missed
+                registry[self.sleeping] = 1
+                if not [ring for ring in list(self.rings.values()) if self.poll(ring)]:
+                    self.wakeup = loop.create_future()
+                    try:
+                        await asyncio.wait_for(self.wakeup, IDLE_CHECK_S)
+                    except asyncio.TimeoutError:
+                        pass
+                registry[self.sleeping] = 0
+            if time.monotonic() - last_refresh > IDLE_CHECK_S:
+                self.refresh()
+                last_refresh = time.monotonic()
+
+    def poll(self, ring : Ring) -> bool:
+        """dispatches everything new in `ring`, True if there was something"""
+        end = ring.write_position()
+        position = ring.read_position
+        if position == end:
+            return False
+        capacity = ring.capacity
+        if end - position > capacity // 2:
+            # lapped: what is left may be overwritten at any moment
+            self.report(nats.errors.SlowConsumerError(">", "", 0, LAPPED))
+            ring.read_position = end
+            return True
+
+        buf = ring.buf
+        while position < end:
+            at = RING_HEADER + position % capacity
+            size, subject_len, reply_len, headers_len, payload_len = RECORD.unpack_from(buf, at)
+            if size == 0:
+                position = end # torn by a writer that lapped us
+                break
+            if subject_len == PADDING:
+                position += size
+                continue
+            at += RECORD.size
+            subject_bytes = bytes(buf[at:at + subject_len])
+            subject = self.subject_names.get(subject_bytes)
+            if subject is None:
+                if len(self.subject_names) > 1024:
+                    self.subject_names.clear()
+                subject = self.subject_names[subject_bytes] = subject_bytes.decode()
+            at += subject_len
+            reply = bytes(buf[at:at + reply_len]).decode() if reply_len else ""
+            at += reply_len
+            headers = self.decode_headers(bytes(buf[at:at + headers_len])) if headers_len else None
+            at += headers_len
+
+            if subject in self.replies:
+                self.reply_to(Message(subject, buf[at:at + payload_len], reply, headers))
+            else:
+                for subscription in self.route(subject):
+                    # one view per subscription, each releases its own
+                    msg = RingMessage(subject, buf[at:at + payload_len], reply, headers)
+                    msg.ring, msg.position = ring, position
+                    subscription.deliver(msg)
+            position += size
+        ring.read_position = position
+        return True
+
+    def decode_headers(self, data : bytes) -> dict:
+        headers = self.headers_cache.get(data)
+        if headers is None:
+            if len(self.headers_cache) > 1024:
+                self.headers_cache.clear()
+            headers = self.headers_cache[data] = msgspec.msgpack.decode(data)
+        return headers
+
+    def valid(self, msg : Message) -> bool:
+        if not isinstance(msg, RingMessage):
+            return True
+        # a record is at most capacity/4, a write in progress (plus padding)
+        # spans at most capacity/2 past the write position
+        return msg.ring.write_position() - msg.position <= msg.ring.capacity // 2
+
+    def release(self, msg : Message) -> None:
+        if isinstance(msg.data, memoryview):
+            msg.data.release()
+
+LAPPED = types.SimpleNamespace(subject = ">") # drops we cannot tell the topic of
@@ -1,33 +1,143 @@
 import math
-from typing import List, Optional
+import os
+import threading
+import time
+from typing import List, Optional, Union
 import numpy as np
 from msgspec import Struct
-from starting_pack import subscribe, start, timer
-from messages import Controls, VehicleState, Cone, Cones
+from starting_pack import subscribe, subscribe_snapshot, start
+from messages import Controls, VehicleState, Cone, Cones, ConeMap
+from cone_index import cone_xy
+from collisions import CAR_TRIANGLE
+from trajectory import Trajectories, ScreenTrails, TrailLines
 import matplotlib.pyplot as plt
 import asyncio
 
 
+# ============================
+#   Parámetros
+# ============================
+
+FRAME_RATE = 20.0  # Hz
+TRAIL_PIXELS = 3.0  # separación mínima en pantalla entre puntos dibujados de la estela
+TRAIL_STEP = 0.25  # m, separación de la estela hasta el primer frame (luego sale del zoom)
+
+# Igual que en el simulador: con 0 se dibuja el único coche de `simulator.state`,
+# con N > 0 todos los de `simulator.<id>.state`
+FLEET_SIZE = int(os.environ.get("FLEET_SIZE") or 0)
+
+# Coche como línea triangular (en su propio marco), cerrada y terminada en NaN
+# para poder dibujar todos los coches con una sola línea. Es el mismo triángulo
+# con el que el simulador detecta contactos con los conos
+CAR_SHAPE = np.vstack([CAR_TRIANGLE, CAR_TRIANGLE[:1], [[np.nan, np.nan]]])
+
+
 # ============================
 #   Variables globales
 # ============================
 
-latest_state: Optional[VehicleState] = None
-latest_cones: Optional[Cones] = None
+# Los hilos de NATS y de dibujo no comparten nada que se modifique en su sitio,
+# así que ninguno espera al otro: solo se pasan referencias (asignarlas es
+# atómico). latest_cones se sustituye entero; poses, trails y screen solo los
+# toca el hilo de NATS, que en cada frame entrega al de dibujo un `Frame` en
+# `ready` (ver hand_over). trail_step lo escribe el hilo de dibujo
+latest_cones: Optional[ConeMap] = None
+node_loop: Optional[asyncio.AbstractEventLoop] = None
+trail_step = TRAIL_STEP
+
+
+class Poses:
+
+    """Última pose conocida de cada coche, un array de NumPy por variable."""
+
+    def __init__(self, n: int):
+        self.x = np.full(n, np.nan)
+        self.y = np.full(n, np.nan)
+        self.yaw = np.zeros(n)
+        self.speed = np.zeros(n)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def copy(self) -> "Poses":
+        out = Poses(0)
+        out.x, out.y, out.yaw, out.speed = self.x.copy(), self.y.copy(), self.yaw.copy(), self.speed.copy()
+        return out
+
+
+class Frame:
+
+    """Lo que dibuja un frame: poses y estelas de todos los coches. Mientras
+    lo tiene el hilo de dibujo, el de NATS no lo modifica."""
+
+    def __init__(self, p: Poses, lines: TrailLines):
+        self.poses = p
+        self.lines = lines
+
+
+poses = Poses(max(1, FLEET_SIZE))
+trails = Trajectories(max(1, FLEET_SIZE))
+screen = ScreenTrails(len(trails), TRAIL_STEP, trails.capacity, trails.seconds)
+ready: Optional[Frame] = Frame(poses.copy(), screen.lines.copy())  # el siguiente frame a dibujar
+
+
+def store_pose(i: int, s: VehicleState):
+    global poses, trails
+    if i >= len(poses):
+        n = max(i + 1, 2 * len(poses))
+        grown = Poses(n)
+        for name in ("x", "y", "yaw", "speed"):
+            getattr(grown, name)[:len(poses)] = getattr(poses, name)
+        trails = trails.grown(n)
+        screen.grow(n)
+        poses = grown
+    if trails.append(i, s.x, s.y, s.timestamp):
+        screen.add(i, s.x, s.y, s.timestamp)
+    poses.yaw[i] = s.yaw
+    poses.speed[i] = s.speed
+    poses.x[i] = s.x
+    poses.y[i] = s.y
+
+
+def hand_over(returned: TrailLines):
+    """
+    En el hilo de NATS, cuando el de dibujo termina un frame y devuelve sus
+    estelas. Las estelas en las que se estaba escribiendo pasan a `ready`, con
+    una copia de las poses (O(N)), y se sigue escribiendo en las devueltas,
+    puestas al día repitiendo solo las escrituras desde el frame anterior
+    (`screen.log`). Las estelas no se copian enteras salvo al cambiar el
+    número de coches o el zoom, que las rehace de todos modos.
+    """
+    global ready
+    if trail_step != screen.step:
+        screen.rebuild(trails, trail_step)
+    published = screen.lines
+    if screen.log is None or len(returned) != len(published):
+        returned = published.copy()
+    else:
+        returned.apply(screen.log)
+    screen.lines = returned
+    screen.log = []
+    ready = Frame(poses.copy(), published)
 
 
 # ============================
 #   Suscripciones NATS
 # ============================
 
-@subscribe("simulator.state", VehicleState)
-async def state_callback(msg: VehicleState):
-    global latest_state
-    latest_state = msg
+# Solo interesa el último estado (de cada coche): si el nodo se retrasa se saltan los atrasados
+if FLEET_SIZE:
+    @subscribe("simulator.*.state", VehicleState, mode="latest")
+    async def fleet_state_callback(msg: VehicleState, vehicle: str):
+        store_pose(int(vehicle), msg)
+else:
+    @subscribe("simulator.state", VehicleState, mode="latest")
+    async def state_callback(msg: VehicleState):
+        store_pose(0, msg)
 
 
-@subscribe("simulator.cones", Cones)
-async def cones_callback(msg: Cones):
+@subscribe_snapshot("simulator.conemap", ConeMap)
+async def cones_callback(msg: ConeMap):
     global latest_cones
     latest_cones = msg
 
@@ -36,12 +146,15 @@ async def cones_callback(msg: Cones):
 #   Visualización
 # ============================
 
-@timer(0.05) # Actualiza  cada 50 ms
-async def update_plot():
+class Renderer:
 
-    global latest_state, latest_cones
+    """
+    Dibuja una vez las partes estáticas (ejes, leyenda, conos) y en cada
+    frame solo restaura ese fondo y pinta encima coches, direcciones y texto
+    (blitting). Si el backend no soporta blit, redibuja la figura entera.
+    """
 
-    if not hasattr(update_plot, "initialized"):
+    def __init__(self):
         plt.ion()
         fig, ax = plt.subplots(figsize=(8, 6))
         ax.set_aspect("equal", "box")
@@ -51,57 +164,134 @@ async def update_plot():
         ax.set_xlabel("X (m)")
         ax.set_ylabel("Y (m)")
 
-        # Elementos gráficos
-        update_plot.fig = fig
-        update_plot.ax = ax
-        update_plot.scat = ax.scatter([], [], color="orange", label="Conos")
-        update_plot.car_plot, = ax.plot([], [], "-k", lw=2, label="Coche")
-        update_plot.dir_plot, = ax.plot([], [], "-r", lw=1.5, label="Dirección")
-        update_plot.txt = ax.text(-29, 18, "", fontsize=9, color="blue")
+        # Elementos gráficos: los animados no entran en el fondo
+        self.fig = fig
+        self.ax = ax
+        self.scat = ax.scatter([], [], color="orange", label="Conos")
+        self.trail_plot, = ax.plot([], [], "-", color="tab:blue", lw=1, alpha=0.6,
+                                   label="Trayectoria", animated=True)
+        self.car_plot, = ax.plot([], [], "-k", lw=2, label="Coche", animated=True)
+        self.dir_plot, = ax.plot([], [], "-r", lw=1.5, label="Dirección", animated=True)
+        self.txt = ax.text(0.01, 0.97, "", fontsize=9, color="blue", va="top",
+                           transform=ax.transAxes, animated=True)
         ax.legend()
-        update_plot.initialized = True
-
-    if latest_cones is not None:
-        xs = [c.x for c in latest_cones.cones]
-        ys = [c.y for c in latest_cones.cones]
-        update_plot.scat.set_offsets(np.c_[xs, ys])
-
-    if latest_state is not None:
-        s = latest_state
-        # Coche como linea triangular
-        L = 1.5
-        W = 0.7
-        pts = np.array([
-            [L, 0],
-            [-L * 0.6, W],
-            [-L * 0.6, -W]
-        ])
-        R = np.array([
-            [math.cos(s.yaw), -math.sin(s.yaw)],
-            [math.sin(s.yaw),  math.cos(s.yaw)]
-        ])
-        trans = (R @ pts.T).T + np.array([s.x, s.y])
-        # Cerrar el triángulo añadiendo el primer punto al final para que se dibuje correctamente
-        xs = np.append(trans[:, 0], trans[0, 0])
-        ys = np.append(trans[:, 1], trans[0, 1])
-        update_plot.car_plot.set_data(xs, ys)
-
-        # Línea de dirección
-        dir_line = np.array([
-            [s.x, s.y],
-            [s.x + math.cos(s.yaw) * 2.0, s.y + math.sin(s.yaw) * 2.0]
-        ])
-        update_plot.dir_plot.set_data(dir_line[:, 0], dir_line[:, 1])
-
-        # Texto con estado
-        update_plot.txt.set_text(
-            f"Velocidad: {s.speed:.2f} m/s\n"
-            f"Posición: ({s.x:.1f}, {s.y:.1f})"
-        )
-
-    # Redibujar
-    update_plot.fig.canvas.draw()
-    update_plot.fig.canvas.flush_events()
+        self.animated = [self.trail_plot, self.car_plot, self.dir_plot, self.txt]
+
+        self.blit = fig.canvas.supports_blit
+        self.background = None
+        self.cones: Optional[Union[Cones, ConeMap]] = None
+        fig.canvas.mpl_connect("draw_event", self.on_draw)
+        plt.show(block=False)
+        fig.canvas.draw()
+
+    def on_draw(self, event):
+        # Tras cualquier redibujado completo (inicio, conos nuevos, resize) guardar el fondo
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def set_cones(self, cones: Union[Cones, ConeMap]):
+        self.cones = cones
+        xy = cone_xy(cones)  # con ConeMap, una vista sobre el mensaje
+        xs, ys = xy[:, 0], xy[:, 1]
+        self.scat.set_offsets(xy)
+        if len(xs):
+            # Ampliar la vista si el circuito no cabe en la inicial
+            margin = 5.0
+            self.ax.set_xlim(min(-30, xs.min() - margin), max(30, xs.max() + margin))
+            self.ax.set_ylim(min(-20, ys.min() - margin), max(20, ys.max() + margin))
+        self.fig.canvas.draw()  # el fondo cambia: un único redibujado completo
+
+    def trail_step(self) -> float:
+        """TRAIL_PIXELS en metros con la escala actual de los ejes, redondeado a una
+        potencia de √2 para que los cambios pequeños de zoom no rehagan la estela."""
+        x0, x1 = self.ax.get_xlim()
+        step = TRAIL_PIXELS * (x1 - x0) / max(1.0, self.ax.bbox.width)
+        return 2.0 ** (round(2 * math.log2(step)) / 2)
+
+    def update_trail(self, lines: TrailLines):
+        # Ya decimadas: se dibujan tal cual, como una sola línea. recache_always
+        # copia ya los puntos: `lines` vuelve al hilo de NATS al acabar el frame
+        self.trail_plot.set_data(lines.x.ravel(), lines.y.ravel())
+        self.trail_plot.recache_always()
+
+    def update_artists(self, p: Poses):
+        x, y, yaw = p.x, p.y, p.yaw
+        cos_yaw = np.cos(yaw)[:, None]
+        sin_yaw = np.sin(yaw)[:, None]
+
+        # Triángulos de todos los coches a la vez (rotar + trasladar CAR_SHAPE)
+        car_x = x[:, None] + cos_yaw * CAR_SHAPE[:, 0] - sin_yaw * CAR_SHAPE[:, 1]
+        car_y = y[:, None] + sin_yaw * CAR_SHAPE[:, 0] + cos_yaw * CAR_SHAPE[:, 1]
+        self.car_plot.set_data(car_x.ravel(), car_y.ravel())
+
+        # Líneas de dirección
+        dir_x = np.column_stack([x, x + cos_yaw[:, 0] * 2.0, np.full(len(x), np.nan)])
+        dir_y = np.column_stack([y, y + sin_yaw[:, 0] * 2.0, np.full(len(y), np.nan)])
+        self.dir_plot.set_data(dir_x.ravel(), dir_y.ravel())
+
+        # Texto con estado (del primer coche)
+        if len(p) > 1:
+            header = f"Coches: {int(np.count_nonzero(~np.isnan(x)))}\n"
+        else:
+            header = ""
+        if not math.isnan(x[0]):
+            self.txt.set_text(
+                header +
+                f"Velocidad: {p.speed[0]:.2f} m/s\n"
+                f"Posición: ({x[0]:.1f}, {y[0]:.1f})"
+            )
+
+    def frame(self, p: Poses, cones: Optional[Union[Cones, ConeMap]], lines: Optional[TrailLines] = None):
+        if cones is not None and cones is not self.cones:
+            self.set_cones(cones)
+        if lines is not None:
+            self.update_trail(lines)
+        self.update_artists(p)
+
+        canvas = self.fig.canvas
+        if self.blit and self.background is not None:
+            canvas.restore_region(self.background)
+            for artist in self.animated:
+                self.ax.draw_artist(artist)
+            canvas.blit(self.fig.bbox)
+        else:
+            for artist in self.animated:
+                artist.set_animated(False)
+            self.blit = False
+            canvas.draw_idle()
+        canvas.flush_events()
+
+
+def render_loop():
+    """Bucle de dibujo a FRAME_RATE en el hilo principal (el que exige matplotlib)."""
+    renderer = Renderer()
+    period = 1.0 / FRAME_RATE
+    next_frame = time.monotonic()
+    global ready, trail_step
+    while plt.fignum_exists(renderer.fig.number):
+        trail_step = renderer.trail_step()  # al cambiar el zoom, hand_over rehace la estela
+        if ready is not None and node_loop is not None:
+            # Hasta que el hilo de NATS entregue el siguiente, este frame es solo del de dibujo
+            frame, ready = ready, None
+            renderer.frame(frame.poses, latest_cones, frame.lines)
+            node_loop.call_soon_threadsafe(hand_over, frame.lines)
+        else:
+            renderer.fig.canvas.flush_events()  # NATS aún no ha entregado el frame: nada nuevo
+        next_frame += period
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.monotonic()  # vamos tarde: no intentar recuperar frames
+
+
+async def node():
+    global node_loop
+    node_loop = asyncio.get_running_loop()
+    await start()
+
+
+def run_node():
+    asyncio.run(node())
 
 
 # ============================
@@ -109,8 +299,10 @@ async def update_plot():
 # ============================
 
 if __name__ == "__main__":
-    
+
+    # NATS en su propio hilo: dibujar nunca bloquea la recepción de mensajes, ni al revés
+    threading.Thread(target=run_node, daemon=True).start()
     try:
-        asyncio.run(start())
+        render_loop()
     except KeyboardInterrupt:
         print("[LOG] Visualizador cerrado por el usuario.")